@@ -1,48 +1,281 @@
 import os
+import re
 import json
 import google.generativeai as genai
 from dotenv import load_dotenv
+import upstream
+import telemetry
+import annotator
+import dictionary
+from reply_cache import reply_cache
 
 load_dotenv()
 
 # Support both variable names
 API_KEY = os.getenv("GEMINI_API_KEY") or os.getenv("AI_API_KEY")
 
+# With the local dictionary, the model only glosses what the dictionary would get wrong
+GLOSS_RULE = (
+    '"glosses": only for particles, auxiliaries, names, slang, or words used in a sense other than their most common one; keyed by dictionary form.'
+    if dictionary.dictionary else
+    '"glosses": short English meaning for each content word, keyed by dictionary form.'
+)
+
+# Static part of the prompt, sent once as the model's system instruction
+SYSTEM_INSTRUCTION = f"""
+You are a Japanese language tutor.
+**Instructions:**
+1. Reply naturally to the user's message.
+2. Prioritize using KNOWN grammar/vocab.
+3. Output JSON only.
+4. {GLOSS_RULE}
+5. "notes": for each PARTICLE/GRAMMAR form used, a detailed explanation.
+
+**Output Schema:**
+{{
+  "japanese": "猫が好きです。",
+  "english": "English translation.",
+  "grammar_point": "Brief summary.",
+  "glosses": {{ "猫": "cat", "好き": "liked" }},
+  "notes": {{ "が": "optional note" }}
+}}
+"""
+
+# Instruction for condensing older turns into the session's rolling summary
+SUMMARY_INSTRUCTION = """
+You condense a Japanese tutoring conversation for the tutor's memory.
+Merge the previous summary with the new turns into at most 80 words of plain English.
+Keep: topics discussed, facts the learner shared about themselves, words and grammar
+that were taught or corrected, and mistakes the learner keeps making. Drop greetings.
+"""
+
+# Using the flash model for speed and cost
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-flash-latest")
+
+model = None
+summary_model = None
+
 if API_KEY:
     genai.configure(api_key=API_KEY)
+    # Shared by every request; per-turn context goes in the prompt
+    model = genai.GenerativeModel(
+        MODEL_NAME,
+        system_instruction=SYSTEM_INSTRUCTION,
+        generation_config={"response_mime_type": "application/json"}
+    )
+    summary_model = genai.GenerativeModel(MODEL_NAME, system_instruction=SUMMARY_INSTRUCTION)
 else:
     print("⚠️  WARNING: No API Key found in .env file.")
 
-def generate_tutor_response(user_message, level_context, vocab_context):
+def build_tutor_prompt(user_message, level_context, vocab_context, history=''):
+    conversation = f"**Conversation so far:**\n{history}\n" if history else ""
+    return f"""{conversation}**User Profile:** Level: {level_context} | Known Vocab: {vocab_context}
+**User Message:** "{user_message}"
+"""
+
+def generate_tutor_response(user_message, level_context, vocab_context, use_cache=True, user_id=None, history=''):
     if not API_KEY:
         raise Exception("Server API Key is missing. Check your .env file.")
 
-    system_prompt = f"""
-    You are a Japanese language tutor.
-    **User Profile:** Level: {level_context} | Known Vocab: {vocab_context}
-    **Instructions:**
-    1. Reply naturally to: "{user_message}"
-    2. Prioritize using KNOWN grammar/vocab.
-    3. Output JSON only.
-    4. "reading" must be in HIRAGANA/KATAKANA.
-    5. If token is PARTICLE/GRAMMAR, provide detailed 'explanation'.
-
-    **Output Schema:**
-    {{
-      "segments": [
-         {{ "text": "猫", "reading": "ねこ", "meaning": "cat", "explanation": "optional note", "function": "noun" }}
-      ],
-      "english": "English translation.",
-      "grammar_point": "Brief summary."
-    }}
-    """
+    if use_cache:
+        cached = reply_cache.get(user_id, user_message, level_context, vocab_context, history)
+        if cached is not None:
+            return cached
 
-    # Using the flash model for speed and cost
-    model = genai.GenerativeModel('gemini-flash-latest')
-    
-    response = model.generate_content(
-        system_prompt,
-        generation_config={"response_mime_type": "application/json"}
-    )
+    prompt = build_tutor_prompt(user_message, level_context, vocab_context, history)
+
+    with upstream.limit("gemini", user_id):
+        response = model.generate_content(
+            prompt,
+            request_options=upstream.gemini_request_options()
+        )
     
-    return json.loads(response.text)
+    with telemetry.stage("gemini_parse"):
+        result = annotator.annotate_reply(json.loads(response.text))
+    if use_cache:
+        reply_cache.put(user_id, user_message, level_context, vocab_context, result, history)
+    return result
+
+async def generate_tutor_response_async(user_message, level_context, vocab_context, use_cache=True, user_id=None, history=''):
+    """Same as generate_tutor_response, awaited on the event loop."""
+    if not API_KEY:
+        raise Exception("Server API Key is missing. Check your .env file.")
+
+    if use_cache:
+        cached = reply_cache.get(user_id, user_message, level_context, vocab_context, history)
+        if cached is not None:
+            return cached
+
+    prompt = build_tutor_prompt(user_message, level_context, vocab_context, history)
+
+    async with upstream.alimit("gemini", user_id):
+        response = await model.generate_content_async(
+            prompt,
+            request_options=upstream.gemini_request_options_async()
+        )
+
+    with telemetry.stage("gemini_parse"):
+        result = annotator.annotate_reply(json.loads(response.text))
+    if use_cache:
+        reply_cache.put(user_id, user_message, level_context, vocab_context, result, history)
+    return result
+
+class SentenceStreamParser:
+    """Incrementally pulls finished sentences out of the "japanese" string.
+
+    Feed it raw text as the model streams it; each call returns the
+    sentences that became complete since the previous call. The last,
+    unterminated sentence comes out once the string closes.
+    """
+
+    ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = None  # Index of the next unread character inside the string
+        self.text = ""   # Decoded characters not yet handed out
+        self.done = False
+
+    def feed(self, text):
+        self.buffer += text
+        if self.done:
+            return []
+
+        if self.pos is None:
+            match = re.search(r'"japanese"\s*:\s*"', self.buffer)
+            if not match:
+                return []
+            self.pos = match.end()
+
+        while self.pos < len(self.buffer):
+            ch = self.buffer[self.pos]
+            if ch == '"':
+                self.done = True
+                break
+            if ch != '\\':
+                self.text += ch
+                self.pos += 1
+                continue
+            # Escape sequence; wait for the rest of it if it was split across chunks
+            if self.pos + 1 >= len(self.buffer):
+                break
+            kind = self.buffer[self.pos + 1]
+            if kind == 'u':
+                digits = self.buffer[self.pos + 2:self.pos + 6]
+                if len(digits) < 4:
+                    break
+                code = int(digits, 16)
+                if 0xD800 <= code < 0xDC00:
+                    # High surrogate; characters outside the BMP come as a \uXXXX\uXXXX pair
+                    low = self.buffer[self.pos + 6:self.pos + 12]
+                    if len(low) < 6 and '"' not in low:
+                        break
+                    if len(low) == 6 and low[:2] == '\\u' and 0xDC00 <= int(low[2:], 16) < 0xE000:
+                        code = 0x10000 + ((code - 0xD800) << 10) + (int(low[2:], 16) - 0xDC00)
+                        self.pos += 6
+                self.text += chr(code)
+                self.pos += 6
+            else:
+                self.text += self.ESCAPES.get(kind, kind)
+                self.pos += 2
+
+        sentences, self.text = annotator.split_sentences(self.text)
+        if sentences and not self.text and not self.done:
+            # More endings or a closing bracket may follow in the next chunk
+            self.text = sentences.pop()
+        if self.done and self.text:
+            sentences.append(self.text)
+            self.text = ""
+        return sentences
+
+    def result(self):
+        return json.loads(self.buffer)
+
+def stream_tutor_response(user_message, level_context, vocab_context, use_cache=True, user_id=None, history=''):
+    """Yield ("segment", dict) events sentence by sentence as the reply streams in, then ("done", full_response).
+
+    Streamed segments have readings but no meanings yet; the glosses come
+    after the sentence in the model's output, so "done" carries the full
+    segments.
+    """
+    if not API_KEY:
+        raise Exception("Server API Key is missing. Check your .env file.")
+
+    if use_cache:
+        cached = reply_cache.get(user_id, user_message, level_context, vocab_context, history)
+        if cached is not None:
+            for segment in cached.get('segments', []):
+                yield "segment", segment
+            yield "done", cached
+            return
+
+    prompt = build_tutor_prompt(user_message, level_context, vocab_context, history)
+
+    with upstream.limit("gemini", user_id):
+        response = model.generate_content(
+            prompt,
+            stream=True,
+            request_options=upstream.gemini_request_options(stream=True)
+        )
+
+        parser = SentenceStreamParser()
+        for chunk in response:
+            for sentence in parser.feed(chunk.text):
+                for segment in annotator.annotate(sentence):
+                    yield "segment", segment
+
+    with telemetry.stage("gemini_parse"):
+        result = annotator.annotate_reply(parser.result())
+    if use_cache:
+        reply_cache.put(user_id, user_message, level_context, vocab_context, result, history)
+    yield "done", result
+
+async def stream_tutor_response_async(user_message, level_context, vocab_context, use_cache=True, user_id=None, history=''):
+    """Async counterpart of stream_tutor_response."""
+    if not API_KEY:
+        raise Exception("Server API Key is missing. Check your .env file.")
+
+    if use_cache:
+        cached = reply_cache.get(user_id, user_message, level_context, vocab_context, history)
+        if cached is not None:
+            for segment in cached.get('segments', []):
+                yield "segment", segment
+            yield "done", cached
+            return
+
+    prompt = build_tutor_prompt(user_message, level_context, vocab_context, history)
+
+    async with upstream.alimit("gemini", user_id):
+        response = await model.generate_content_async(
+            prompt,
+            stream=True,
+            request_options=upstream.gemini_request_options_async(stream=True)
+        )
+
+        parser = SentenceStreamParser()
+        async for chunk in response:
+            for sentence in parser.feed(chunk.text):
+                for segment in annotator.annotate(sentence):
+                    yield "segment", segment
+
+    with telemetry.stage("gemini_parse"):
+        result = annotator.annotate_reply(parser.result())
+    if use_cache:
+        reply_cache.put(user_id, user_message, level_context, vocab_context, result, history)
+    yield "done", result
+
+def summarize_conversation(previous_summary, transcript, user_id=None):
+    """Fold new transcript lines into the previous rolling summary."""
+    if not API_KEY:
+        raise Exception("Server API Key is missing. Check your .env file.")
+
+    prompt = f"""**Previous summary:** {previous_summary or "(none)"}
+**New turns:**
+{transcript}
+"""
+    with upstream.limit("gemini", user_id):
+        response = summary_model.generate_content(
+            prompt,
+            request_options=upstream.gemini_request_options()
+        )
+    return response.text.strip()
@@ -0,0 +1,213 @@
+"""Local segmentation and readings for tutor replies.
+
+Gemini only writes the sentence, its translation, short glosses and grammar
+notes; MeCab (via fugashi, with the UniDic dictionary memory-mapped from
+disk) splits the sentence into segments and supplies readings and parts of
+speech, so readings no longer depend on the model getting them right.
+"""
+import os
+import threading
+from functools import lru_cache
+import fugashi
+from dotenv import load_dotenv
+import dictionary
+
+load_dotenv()
+
+# Sentences whose segmentation is kept in memory
+ANNOTATOR_CACHE_SIZE = int(os.getenv("ANNOTATOR_CACHE_SIZE", "4096"))
+
+SENTENCE_ENDINGS = "。！？!?\n"
+CLOSING_BRACKETS = "」』）)"
+
+# UniDic pos1 -> segment "function"
+FUNCTIONS = {
+    "名詞": "noun",
+    "代名詞": "pronoun",
+    "動詞": "verb",
+    "形容詞": "adjective",
+    "形状詞": "adjective",
+    "副詞": "adverb",
+    "助詞": "particle",
+    "助動詞": "auxiliary",
+    "接続詞": "conjunction",
+    "感動詞": "interjection",
+    "連体詞": "adnominal",
+    "接頭辞": "prefix",
+    "接尾辞": "suffix",
+    "記号": "punctuation",
+    "補助記号": "punctuation",
+    "空白": "punctuation",
+}
+
+# Conjugating words absorb the auxiliaries, て/で and dependent verbs that follow them
+# (食べ+まし+た -> 食べました, 食べ+て+いる -> 食べている)
+CONJUGATING = {"動詞", "形容詞", "助動詞"}
+# Runs of these nouns form one segment
+NOUN_KINDS = {"普通名詞", "固有名詞"}
+
+# Segments the local dictionary may gloss. Particles, auxiliaries and
+# suffixes are short kana whose readings collide with unrelated common
+# words (は -> "feather"), so they are never looked up.
+DICTIONARY_FUNCTIONS = {"noun", "verb", "adjective", "adverb"}
+
+# Everyday readings where UniDic's first choice is the formal one
+READING_OVERRIDES = {"私": "わたし", "日本": "にほん", "何": "なに"}
+
+_local = threading.local()
+
+def _tagger():
+    # One tagger per thread; they all share the same mapped dictionary pages
+    tagger = getattr(_local, 'tagger', None)
+    if tagger is None:
+        tagger = _local.tagger = fugashi.Tagger()
+    return tagger
+
+def to_hiragana(text):
+    return ''.join(chr(ord(ch) - 0x60) if 'ァ' <= ch <= 'ヶ' else ch for ch in text)
+
+def has_kanji(text):
+    return any('\u4e00' <= ch <= '\u9fff' or ch == '々' for ch in text)
+
+def _feature(word, name):
+    value = getattr(word.feature, name, None)
+    return value if value and value != '*' else ''
+
+def _attaches(word, previous):
+    """Whether `word` belongs to the same segment as the word before it."""
+    pos1, pos2 = _feature(word, 'pos1'), _feature(word, 'pos2')
+    if previous == "名詞":
+        # Compound nouns (日本+語 -> 日本語)
+        return pos1 == "名詞" and pos2 in NOUN_KINDS
+    if previous not in CONJUGATING:
+        return False
+    if pos1 in ("助動詞", "接尾辞"):
+        return True
+    if pos1 in ("動詞", "形容詞") and pos2 == "非自立可能":
+        return True
+    return pos1 == "助詞" and pos2 == "接続助詞" and word.surface in ("て", "で")
+
+def _base_forms(word, lemma):
+    """Spellings the model may key a word's gloss by: the lemma (為る), its written base form (する) and its kana (する)."""
+    forms = [lemma, _feature(word, 'orthBase'), to_hiragana(_feature(word, 'kanaBase'))]
+    return tuple(dict.fromkeys(form for form in forms if form))
+
+@lru_cache(maxsize=ANNOTATOR_CACHE_SIZE)
+def _segment(sentence):
+    """(text, reading, lemma, function, base forms) per segment of `sentence`."""
+    segments = []
+    previous = None
+    for word in _tagger()(sentence):
+        pos1 = _feature(word, 'pos1')
+        kana = _feature(word, 'kana')
+        reading = READING_OVERRIDES.get(word.surface) or (to_hiragana(kana) if kana else word.surface)
+        if to_hiragana(word.surface) == reading:
+            reading = word.surface  # Kana already; no furigana needed
+        if segments and _attaches(word, previous):
+            text, joined_reading, lemma, function, forms = segments[-1]
+            segments[-1] = (text + word.surface, joined_reading + reading, lemma, function, forms)
+            continue  # The segment keeps its kind, so more can attach
+        function = FUNCTIONS.get(pos1, "other")
+        lemma = _feature(word, 'lemma').split('-')[0] or word.surface  # UniDic lemmas may carry "-English" tags
+        segments.append((
+            word.surface,
+            '' if function == "punctuation" else reading,
+            lemma,
+            function,
+            _base_forms(word, lemma)
+        ))
+        if pos1 in CONJUGATING:
+            previous = pos1
+        elif pos1 == "名詞" and _feature(word, 'pos2') in NOUN_KINDS:
+            previous = "名詞"
+        else:
+            previous = None
+    return tuple(segments)
+
+def _lookup(table, text, forms):
+    if not isinstance(table, dict):
+        return ''
+    for key in (text, *forms):
+        if table.get(key):
+            return str(table[key])
+    return ''
+
+def dictionary_meaning(text, lemma, function):
+    """Local dictionary meaning for a content word, or ''.
+
+    The (kanji) lemma is tried first; the surface only when it has kanji
+    of its own. Either way the entry's part of speech must agree.
+    """
+    if function not in DICTIONARY_FUNCTIONS:
+        return ''
+    meaning = dictionary.gloss(lemma, function)
+    if not meaning and text != lemma and has_kanji(text):
+        meaning = dictionary.gloss(text, function)
+    return meaning
+
+def gloss(term):
+    """Local dictionary meaning for a vocab term, or '' if it isn't a single content word."""
+    segments = _segment(term)
+    if len(segments) != 1:
+        return dictionary.gloss(term) if has_kanji(term) else ''
+    text, _, lemma, function, _ = segments[0]
+    return dictionary_meaning(text, lemma, function)
+
+def dictionary_form(text):
+    """Dictionary form of the first word in `text` (食べました -> 食べる)."""
+    segments = _segment(text)
+    return segments[0][2] if segments else text
+
+def reading(text):
+    """Reading of `text` as a whole, from its segments."""
+    return ''.join(segment[1] or segment[0] for segment in _segment(text))
+
+def annotate(sentence, glosses=None, notes=None):
+    """Segments for `sentence`, with meanings from `glosses` and explanations from `notes`.
+
+    Both maps are keyed by surface form or dictionary form (kanji or
+    kana), as the model wrote them. Content words the model didn't gloss get their meaning
+    from the local dictionary.
+    """
+    segments = []
+    for text, reading, lemma, function, forms in _segment(sentence):
+        meaning = _lookup(glosses, text, forms)
+        if not meaning:
+            meaning = dictionary_meaning(text, lemma, function)
+        segment = {"text": text, "reading": reading, "meaning": meaning, "function": function}
+        explanation = _lookup(notes, text, forms)
+        if explanation:
+            segment["explanation"] = explanation
+        segments.append(segment)
+    return segments
+
+def split_sentences(text):
+    """(finished sentences, unfinished remainder)."""
+    sentences, start, i = [], 0, 0
+    while i < len(text):
+        if text[i] in SENTENCE_ENDINGS:
+            i += 1
+            while i < len(text) and (text[i] in SENTENCE_ENDINGS or text[i] in CLOSING_BRACKETS):
+                i += 1
+            sentences.append(text[start:i])
+            start = i
+        else:
+            i += 1
+    return sentences, text[start:]
+
+def annotate_text(text, glosses=None, notes=None):
+    sentences, rest = split_sentences(text)
+    segments = []
+    for sentence in sentences + ([rest] if rest else []):
+        segments.extend(annotate(sentence, glosses, notes))
+    return segments
+
+def annotate_reply(reply):
+    """Turn the model's {japanese, english, grammar_point, glosses, notes} into the client's reply shape."""
+    if 'segments' in reply:
+        return reply  # Already annotated (e.g. from the reply cache)
+    return {
+        "segments": annotate_text(str(reply.get('japanese', '')), reply.get('glosses'), reply.get('notes')),
+        "english": reply.get('english', ''),
+        "grammar_point": reply.get('grammar_point', '')
+    }
@@ -1,19 +1,45 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-import bcrypt
 import json
 import os
-import asyncio
-import requests
+import itertools
+import math
 import time
 import uuid
-from psycopg2.extras import RealDictCursor
-from database import init_db, get_db_connection, release_db_connection, is_db_available
-from ai import generate_tutor_response
-import edge_tts
+from concurrent.futures import TimeoutError as HashTimeout
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.errors import UniqueViolation
+from database import init_db, db_connection, is_db_available, pool_stats
+import telemetry
+from ai import generate_tutor_response, stream_tutor_response
+from reply_cache import reply_cache
+from vocab_context import user_vocab_cache
+import upstream
+from passwords import hash_password, verify_password, needs_rehash, user_cache, HashQueueFull
+import dictionary
+import annotator
+import srs
+import sync
+import search
+import transfer
+from tts import cache_key, load_clip, stream_speech_cached, audio_cache, presynth
+import endpoints
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Attributes request parsing and response serialization to their own trace stages."""
+
+    def dumps(self, obj, **kwargs):
+        with telemetry.stage("serialize"):
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        with telemetry.stage("request_parse"):
+            return super().loads(s, **kwargs)
 
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 CORS(app, supports_credentials=True)
 
 # JWT Configuration
@@ -21,14 +47,102 @@ app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET', 'dev-secret-change-in-pro
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = 60 * 60 * 24 * 7  # 7 days
 jwt = JWTManager(app)
 
-WHISPER_URL = os.getenv("WHISPER_URL", "http://whisper:9000")
+# Pagination defaults
+SESSION_PAGE_SIZE = 30
+MESSAGE_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_VOCAB_BATCH = 500
+
+# If set, /api/metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
 # Initialize Database Tables on Startup
 with app.app_context():
     init_db()
 
+# ==================== TRACING & METRICS ====================
+
+@app.before_request
+def begin_trace():
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    telemetry.start_trace(request.method, route, telemetry.request_id_from(request.headers.get('X-Request-ID')))
+
+@app.after_request
+def end_trace(response):
+    trace = telemetry.current_trace()
+    if trace is not None:
+        response.headers['X-Request-ID'] = trace.request_id
+        # Streamed bodies are still being produced here; finish once they're sent
+        response.call_on_close(lambda: telemetry.finish_trace(trace, response.status_code))
+    return response
+
+def stats_metrics(prefix, description, series, counters):
+    """One metric per numeric snapshot key over [(labels, snapshot), ...].
+
+    Keys in `counters` (the component's running totals) become counters
+    with a _total suffix; the rest are point-in-time gauges.
+    """
+    metrics = {}
+    for labels, stats in series:
+        for key, value in stats.items():
+            if isinstance(value, (int, float)):
+                metrics.setdefault(key, []).append((labels, value))
+    return [(
+        f"{prefix}_{key}_total" if key in counters else f"{prefix}_{key}",
+        f"{description}: {key.replace('_', ' ')}.",
+        "counter" if key in counters else "gauge",
+        samples
+    ) for key, samples in sorted(metrics.items())]
+
+def collect_metrics():
+    metrics = []
+    if is_db_available():
+        pool = pool_stats()
+        metrics.append(("db_pool_connections", "Pooled database connections by state.", "gauge", [
+            ({"state": "in_use"}, pool["in_use"]),
+            ({"state": "idle"}, pool["idle"]),
+            ({"state": "max"}, pool["max"]),
+        ]))
+        # Running totals; rate(wait_seconds) / rate(checkouts) is the mean checkout wait
+        for key in ("checkouts", "checkout_waits", "checkout_timeouts", "wait_seconds_total", "held_seconds_total",
+                    "connections_opened", "connections_discarded", "statements", "statement_seconds_total", "slow_statements"):
+            name = key.removesuffix("_total")
+            metrics.append((f"db_pool_{name}_total", f"Database pool: {name.replace('_', ' ')}.", "counter", [({}, pool[key])]))
+        for key in ("wait_seconds_max", "held_seconds_max", "statement_seconds_max"):
+            metrics.append((f"db_pool_{key}", f"Database pool: longest {key.split('_')[0]} since start, seconds.", "gauge", [({}, pool[key])]))
+    admissions = upstream.admissions.values()
+    metrics.extend(stats_metrics(
+        "upstream", "Upstream admission control",
+        [({"upstream": admission.name}, admission.snapshot()) for admission in admissions],
+        {key for admission in admissions for key in admission.stats}
+    ))
+    for prefix, description, component in (
+            ("tutor_reply_cache", "Tutor reply cache", reply_cache),
+            ("tts_audio_cache", "TTS audio cache", audio_cache),
+            ("tts_presynth", "TTS pre-synthesis", presynth)):
+        metrics.extend(stats_metrics(prefix, description, [({}, component.snapshot())], component.stats))
+    return metrics
+
+telemetry.registry.add_collector(collect_metrics)
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of request, stage, pool, upstream and cache metrics."""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(telemetry.registry.render(), mimetype='text/plain; version=0.0.4')
+
 # ==================== AUTH ROUTES ====================
 
+def busy_response(e, status=503, retry_after=1):
+    response = jsonify({"error": str(e)})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, status
+
+def overloaded_response(e):
+    """429/503 for a call refused by upstream admission control."""
+    return busy_response(e, e.status, e.retry_after)
+
 @app.route('/api/auth/register', methods=['POST'])
 def register():
     data = request.json
@@ -41,32 +155,34 @@ def register():
     if len(password) < 6:
         return jsonify({"error": "Password must be at least 6 characters"}), 400
     
-    conn = None
     try:
-        conn = get_db_connection()
-        conn.autocommit = True
-        
-        # Check if user exists
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("SELECT id FROM users WHERE email = %s", (email,))
-            if cur.fetchone():
-                return jsonify({"error": "Email already registered"}), 409
+        with db_connection() as conn:
+            # Check if user exists
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("SELECT id FROM users WHERE email = %s", (email,))
+                if cur.fetchone():
+                    return jsonify({"error": "Email already registered"}), 409
         
-        # Create user
+        # Hash without holding a connection; it's the slow part
         user_id = str(uuid.uuid4())
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        password_hash = hash_password(password)
         created_at = int(time.time() * 1000)
         
-        with conn.cursor() as cur:
-            cur.execute(
-                "INSERT INTO users (id, email, password_hash, created_at) VALUES (%s, %s, %s, %s)",
-                (user_id, email, password_hash, created_at)
-            )
-            # Create default settings
-            cur.execute(
-                "INSERT INTO user_settings (user_id, settings) VALUES (%s, %s)",
-                (user_id, json.dumps({}))
-            )
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """INSERT INTO users (id, email, password_hash, created_at) VALUES (%s, %s, %s, %s)
+                       ON CONFLICT (email) DO NOTHING RETURNING id""",
+                    (user_id, email, password_hash, created_at)
+                )
+                if not cur.fetchone():
+                    # Lost a race with a concurrent registration
+                    return jsonify({"error": "Email already registered"}), 409
+                # Create default settings
+                cur.execute(
+                    "INSERT INTO user_settings (user_id, settings) VALUES (%s, %s)",
+                    (user_id, json.dumps({}))
+                )
         
         # Generate token
         access_token = create_access_token(identity=user_id)
@@ -76,12 +192,13 @@ def register():
             "user": {"id": user_id, "email": email}
         }), 201
         
+    except HashQueueFull as e:
+        return busy_response(e)
+    except HashTimeout:
+        return busy_response("Sign-in is taking too long, try again shortly")
     except Exception as e:
         print(f"Registration error: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            release_db_connection(conn)
 
 @app.route('/api/auth/login', methods=['POST'])
 def login():
@@ -92,20 +209,30 @@ def login():
     if not email or not password:
         return jsonify({"error": "Email and password required"}), 400
     
-    conn = None
     try:
-        conn = get_db_connection()
-        
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("SELECT id, email, password_hash FROM users WHERE email = %s", (email,))
-            user = cur.fetchone()
+        with db_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("SELECT id, email, password_hash FROM users WHERE email = %s", (email,))
+                user = cur.fetchone()
         
         if not user:
             return jsonify({"error": "Invalid credentials"}), 401
         
-        if not bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8')):
+        if not verify_password(password, user['password_hash']):
             return jsonify({"error": "Invalid credentials"}), 401
         
+        if needs_rehash(user['password_hash']):
+            # Work factor changed since this hash was made; upgrade it now
+            # that we have the plaintext. Skipped if the password changed meanwhile.
+            new_hash = hash_password(password)
+            with db_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s",
+                        (new_hash, user['id'], user['password_hash'])
+                    )
+        
+        user_cache.put(user['id'], {"id": user['id'], "email": user['email']})
         access_token = create_access_token(identity=user['id'])
         
         return jsonify({
@@ -113,36 +240,37 @@ def login():
             "user": {"id": user['id'], "email": user['email']}
         })
         
+    except HashQueueFull as e:
+        return busy_response(e)
+    except HashTimeout:
+        return busy_response("Sign-in is taking too long, try again shortly")
     except Exception as e:
         print(f"Login error: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            release_db_connection(conn)
 
 @app.route('/api/auth/me', methods=['GET'])
 @jwt_required()
 def get_current_user():
     user_id = get_jwt_identity()
     
-    conn = None
+    user = user_cache.get(user_id)
+    if user:
+        return jsonify({"user": user})
+    
     try:
-        conn = get_db_connection()
-        
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("SELECT id, email FROM users WHERE id = %s", (user_id,))
-            user = cur.fetchone()
+        with db_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("SELECT id, email FROM users WHERE id = %s", (user_id,))
+                user = cur.fetchone()
         
         if not user:
             return jsonify({"error": "User not found"}), 404
         
+        user_cache.put(user_id, user)
         return jsonify({"user": user})
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            release_db_connection(conn)
 
 # ==================== SETTINGS ROUTES ====================
 
@@ -151,116 +279,388 @@ def get_current_user():
 def user_settings():
     user_id = get_jwt_identity()
     
-    conn = None
     try:
-        conn = get_db_connection()
-        conn.autocommit = True
-        
-        if request.method == 'GET':
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("SELECT settings FROM user_settings WHERE user_id = %s", (user_id,))
-                row = cur.fetchone()
+        with db_connection() as conn:
+            if request.method == 'GET':
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute("SELECT settings FROM user_settings WHERE user_id = %s", (user_id,))
+                    row = cur.fetchone()
             
-            return jsonify(row['settings'] if row else {})
+                return jsonify(row['settings'] if row else {})
         
-        else:  # PUT
-            settings = request.json
+            else:  # PUT
+                settings = request.json
             
-            with conn.cursor() as cur:
-                cur.execute(
-                    """INSERT INTO user_settings (user_id, settings) VALUES (%s, %s)
-                       ON CONFLICT (user_id) DO UPDATE SET settings = %s""",
-                    (user_id, json.dumps(settings), json.dumps(settings))
-                )
+                with conn.cursor() as cur:
+                    cur.execute(
+                        """INSERT INTO user_settings (user_id, settings) VALUES (%s, %s)
+                           ON CONFLICT (user_id) DO UPDATE SET settings = %s""",
+                        (user_id, json.dumps(settings), json.dumps(settings))
+                    )
             
-            return jsonify({"status": "saved"})
+                return jsonify({"status": "saved"})
             
     except Exception as e:
         print(f"Settings error: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            release_db_connection(conn)
+
+# ==================== SYNC ROUTES ====================
+
+@app.route('/api/sync', methods=['GET'])
+@jwt_required()
+def sync_changes():
+    """Settings, vocab and session metadata changed since ?since=<cursor>, plus deleted ids.
+
+    Without a cursor (or with one too old for the kept tombstones) the
+    response is a full snapshot with "reset": true. The body carries the
+    next cursor; an unchanged result answers If-None-Match with a 304.
+    """
+    user_id = get_jwt_identity()
+    since = request.args.get('since')
+    if since:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+    else:
+        since = None
+
+    if not is_db_available():
+        return jsonify({"error": "Database not available"}), 503
+
+    try:
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                body, _ = sync.load_changes(cur, user_id, since, int(time.time() * 1000))
+    except Exception as e:
+        print(f"Sync error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    tag = sync.etag(body)
+    headers = {'ETag': tag, 'Cache-Control': 'private, no-cache', 'Vary': 'Accept-Encoding'}
+    if sync.etag_matches(request.headers.get('If-None-Match'), tag):
+        return Response(status=304, headers=headers)
+
+    with telemetry.stage("compress"):
+        payload, encoding = sync.compress(body, request.headers.get('Accept-Encoding'))
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(payload, mimetype='application/json', headers=headers)
+
+# ==================== EXPORT / IMPORT ROUTES ====================
+
+@app.route('/api/export', methods=['GET'])
+@jwt_required()
+def export_user_data():
+    """Stream all of the user's data as NDJSON; the format is described in transfer.py."""
+    user_id = get_jwt_identity()
+
+    if not is_db_available():
+        return jsonify({"error": "Database not available"}), 503
+
+    now = int(time.time() * 1000)
+
+    def generate():
+        try:
+            with db_connection() as conn:
+                yield from transfer.export_lines(conn, user_id, now)
+        except Exception as e:
+            print(f"Export error: {e}")
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={
+            'Content-Disposition': f'attachment; filename="j-tutor-export-{now}.ndjson"',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@app.route('/api/import', methods=['POST'])
+@jwt_required()
+def import_user_data():
+    """Load an export into the user's account, reading the body as it arrives.
+
+    Responds with NDJSON: {"type": "progress", "lines", "counts", "skipped"}
+    after each committed batch, then {"type": "done", ...} or {"type":
+    "error", "line", "error"}. Batches committed before an error are kept;
+    sending the same file again picks up where it stopped.
+    """
+    user_id = get_jwt_identity()
+
+    if not is_db_available():
+        return jsonify({"error": "Database not available"}), 503
+
+    stream = request.stream
+    try:
+        transfer.read_header(stream)
+    except transfer.ImportFormatError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def generate():
+        importer = transfer.Importer(user_id)
+        try:
+            for progress in importer.batches(stream):
+                yield json.dumps({"type": "progress", **progress}) + "\n"
+            yield json.dumps({"type": "done", **importer.progress()}) + "\n"
+        except Exception as e:
+            print(f"Import error: {e}")
+            # Format errors carry the offending line; anything else failed the batch being written
+            line = e.line if isinstance(e, transfer.ImportFormatError) else None
+            yield json.dumps({"type": "error", "line": line, "error": str(e)}) + "\n"
+        finally:
+            user_vocab_cache.invalidate(user_id)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# ==================== SEARCH ROUTES ====================
+
+@app.route('/api/search', methods=['GET'])
+@jwt_required()
+def search_user_data():
+    """Search vocab and conversation history: ?q=&type=all|vocab|messages&limit=&offset=.
+
+    Results are ranked; each list reports whether another page exists at
+    offset + limit.
+    """
+    user_id = get_jwt_identity()
+    query = ' '.join(request.args.get('q', '').split())
+    kind = request.args.get('type', 'all')
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    if len(query) > search.MAX_QUERY_LENGTH:
+        return jsonify({"error": f"q is limited to {search.MAX_QUERY_LENGTH} characters"}), 400
+    if kind not in ('all', 'vocab', 'messages'):
+        return jsonify({"error": "type must be all, vocab or messages"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', search.SEARCH_PAGE_SIZE)), 1), search.MAX_SEARCH_PAGE_SIZE)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"error": "limit and offset must be numbers"}), 400
+
+    if not is_db_available():
+        return jsonify({"error": "Database not available"}), 503
+
+    try:
+        result = {"query": query, "vocab": [], "messages": [], "hasMore": {"vocab": False, "messages": False}}
+        with db_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                if kind in ('all', 'vocab'):
+                    result["vocab"], result["hasMore"]["vocab"] = search.search_vocab(cur, user_id, query, limit, offset)
+                if kind in ('all', 'messages'):
+                    result["messages"], result["hasMore"]["messages"] = search.search_messages(cur, user_id, query, limit, offset)
+        return jsonify(result)
+
+    except Exception as e:
+        print(f"Search error: {e}")
+        return jsonify({"error": str(e)}), 500
 
 # ==================== SESSIONS ROUTES ====================
 
+def insert_session_messages(cur, session_id, messages, start_position, now):
+    """Insert messages as rows starting at start_position."""
+    execute_values(
+        cur,
+        "INSERT INTO messages (session_id, position, role, data, created_at) VALUES %s",
+        [
+            (session_id, start_position + i, m.get('role'), json.dumps(m), now)
+            for i, m in enumerate(messages)
+        ]
+    )
+
+def replace_session_messages(cur, session_id, messages, now):
+    """Swap the session's stored messages for `messages`, dropping the summary built on the old ones."""
+    cur.execute("DELETE FROM messages WHERE session_id = %s", (session_id,))
+    if messages:
+        insert_session_messages(cur, session_id, messages, 0, now)
+    # Positions restart, so the old summary no longer lines up; the version
+    # bump tells an in-flight summary refresh its transcript is gone
+    cur.execute(
+        """UPDATE sessions
+           SET message_count = %s, summary = NULL, summary_through = -1, history_version = history_version + 1
+           WHERE id = %s""",
+        (len(messages), session_id)
+    )
+
 @app.route('/api/sessions', methods=['GET', 'POST'])
 @jwt_required()
 def chat_sessions():
     user_id = get_jwt_identity()
     
-    conn = None
     try:
-        conn = get_db_connection()
-        conn.autocommit = True
-        
-        if request.method == 'POST':
-            data = request.json
-            session_id = data.get('id', str(uuid.uuid4()))
-            title = data.get('title', 'New Conversation')
-            messages = data.get('messages', [])
-            now = int(time.time() * 1000)
+        with db_connection() as conn:
+            if request.method == 'POST':
+                data = request.json
+                session_id = data.get('id', str(uuid.uuid4()))
+                title = data.get('title', 'New Conversation')
+                messages = data.get('messages')
+                now = int(time.time() * 1000)
             
-            with conn.cursor() as cur:
-                cur.execute(
-                    """INSERT INTO sessions (id, user_id, title, messages, created_at, updated_at)
-                       VALUES (%s, %s, %s, %s, %s, %s)
-                       ON CONFLICT (id) DO UPDATE SET
-                           title = EXCLUDED.title,
-                           messages = EXCLUDED.messages,
-                           updated_at = EXCLUDED.updated_at""",
-                    (session_id, user_id, title, json.dumps(messages), now, now)
-                )
+                # Metadata upsert; messages (if sent) replace the stored ones.
+                # New turns should go through POST /api/sessions/<id>/messages.
+                with conn.cursor() as cur:
+                    cur.execute(
+                        """INSERT INTO sessions (id, user_id, title, created_at, updated_at)
+                           VALUES (%s, %s, %s, %s, %s)
+                           ON CONFLICT (id) DO UPDATE SET
+                               title = EXCLUDED.title,
+                               updated_at = EXCLUDED.updated_at
+                           WHERE sessions.user_id = EXCLUDED.user_id
+                           RETURNING id""",
+                        (session_id, user_id, title, now, now)
+                    )
+                    if not cur.fetchone():
+                        return jsonify({"error": "Session not found"}), 404
+                    
+                    if messages is not None:
+                        replace_session_messages(cur, session_id, messages, now)
             
-            return jsonify({"status": "saved", "id": session_id})
+                return jsonify({"status": "saved", "id": session_id})
         
-        else:  # GET
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(
-                    "SELECT id, title, messages, created_at, updated_at FROM sessions WHERE user_id = %s ORDER BY updated_at DESC",
-                    (user_id,)
-                )
-                rows = cur.fetchall()
+            else:  # GET
+                # Lightweight listing, newest first, keyset-paginated on (updated_at, id)
+                limit = min(max(request.args.get('limit', SESSION_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+                cursor = request.args.get('cursor')
             
-            sessions = []
-            for r in rows:
-                sessions.append({
-                    "id": r['id'],
-                    "title": r['title'],
-                    "messages": r['messages'] if isinstance(r['messages'], list) else json.loads(r['messages']),
-                    "createdAt": r['created_at'],
-                    "updatedAt": r['updated_at']
-                })
+                sql = """SELECT id, title, created_at, updated_at, message_count
+                         FROM sessions WHERE user_id = %s"""
+                params = [user_id]
+                if cursor:
+                    try:
+                        cursor_updated, cursor_id = cursor.split(':', 1)
+                        cursor_updated = int(cursor_updated)
+                    except ValueError:
+                        return jsonify({"error": "Invalid cursor"}), 400
+                    sql += " AND (updated_at, id) < (%s, %s)"
+                    params += [cursor_updated, cursor_id]
+                sql += " ORDER BY updated_at DESC, id DESC LIMIT %s"
+                params.append(limit + 1)
+            
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute(sql, params)
+                    rows = cur.fetchall()
             
-            return jsonify(sessions)
+                has_more = len(rows) > limit
+                rows = rows[:limit]
+            
+                sessions = []
+                for r in rows:
+                    sessions.append({
+                        "id": r['id'],
+                        "title": r['title'],
+                        "messageCount": r['message_count'] or 0,
+                        "createdAt": r['created_at'],
+                        "updatedAt": r['updated_at']
+                    })
+            
+                next_cursor = None
+                if has_more:
+                    next_cursor = f"{rows[-1]['updated_at']}:{rows[-1]['id']}"
+            
+                return jsonify({"sessions": sessions, "nextCursor": next_cursor})
             
     except Exception as e:
         print(f"Sessions error: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            release_db_connection(conn)
 
-@app.route('/api/sessions/<session_id>', methods=['DELETE'])
+@app.route('/api/sessions/<session_id>/messages', methods=['POST'])
 @jwt_required()
-def delete_session(session_id):
+def append_session_messages(session_id):
+    """Append new turns to a session without rewriting earlier ones."""
     user_id = get_jwt_identity()
+    data = request.json
+    messages = data.get('messages') if isinstance(data, dict) else data
+    
+    if not isinstance(messages, list) or not messages:
+        return jsonify({"error": "messages must be a non-empty list"}), 400
     
-    conn = None
     try:
-        conn = get_db_connection()
-        conn.autocommit = True
+        with db_connection() as conn:
+            now = int(time.time() * 1000)
         
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM sessions WHERE id = %s AND user_id = %s", (session_id, user_id))
+            with conn.cursor() as cur:
+                # Row lock on the session serializes concurrent appends
+                cur.execute(
+                    """UPDATE sessions
+                       SET message_count = message_count + %s, updated_at = %s
+                       WHERE id = %s AND user_id = %s
+                       RETURNING message_count""",
+                    (len(messages), now, session_id, user_id)
+                )
+                row = cur.fetchone()
+                if not row:
+                    return jsonify({"error": "Session not found"}), 404
+                
+                start_position = row[0] - len(messages)
+                insert_session_messages(cur, session_id, messages, start_position, now)
+        
+            return jsonify({"status": "saved", "id": session_id, "messageCount": row[0]}), 201
+        
+    except Exception as e:
+        print(f"Append messages error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/sessions/<session_id>', methods=['GET', 'DELETE'])
+@jwt_required()
+def session_detail(session_id):
+    user_id = get_jwt_identity()
+    
+    try:
+        with db_connection() as conn:
+            if request.method == 'GET':
+                # Window of the most recent messages before ?before=<position>
+                limit = min(max(request.args.get('limit', MESSAGE_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+                before = request.args.get('before', type=int)
+            
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute(
+                        """SELECT id, title, created_at, updated_at, message_count
+                           FROM sessions WHERE id = %s AND user_id = %s""",
+                        (session_id, user_id)
+                    )
+                    session = cur.fetchone()
+                    if not session:
+                        return jsonify({"error": "Session not found"}), 404
+                
+                    if before is None:
+                        before = session['message_count'] or 0
+                
+                    cur.execute(
+                        """SELECT position, data FROM messages
+                           WHERE session_id = %s AND position < %s
+                           ORDER BY position DESC LIMIT %s""",
+                        (session_id, before, limit)
+                    )
+                    rows = cur.fetchall()
+            
+                rows.reverse()
+                first_position = rows[0]['position'] if rows else before
+            
+                return jsonify({
+                    "id": session['id'],
+                    "title": session['title'],
+                    "messageCount": session['message_count'] or 0,
+                    "createdAt": session['created_at'],
+                    "updatedAt": session['updated_at'],
+                    "messages": [r['data'] for r in rows],
+                    "firstPosition": first_position,
+                    "hasMore": first_position > 0
+                })
         
-        return jsonify({"status": "deleted"})
+            else:  # DELETE
+                with conn.cursor() as cur:
+                    cur.execute("DELETE FROM sessions WHERE id = %s AND user_id = %s", (session_id, user_id))
+            
+                return jsonify({"status": "deleted"})
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            release_db_connection(conn)
 
 # ==================== EXISTING ROUTES (UPDATED) ====================
 
@@ -270,6 +670,10 @@ def health():
         "status": "ok",
         "database": "connected" if is_db_available() else "unavailable"
     }
+    if is_db_available():
+        status["pool"] = pool_stats()
+    status["upstreams"] = upstream.admission_stats()
+    status["dictionary"] = dictionary.dictionary.stats() if dictionary.dictionary else None
     return jsonify(status)
 
 @app.route('/api/transcribe', methods=['POST'])
@@ -280,81 +684,279 @@ def transcribe():
         return jsonify({"error": "No audio file provided"}), 400
     
     audio_file = request.files['audio']
+    user_id = get_jwt_identity()
     
     try:
-        response = requests.post(
-            f"{WHISPER_URL}/asr",
-            files={"audio_file": (audio_file.filename, audio_file.stream, audio_file.mimetype)},
-            params={"language": "ja", "output": "json"}
-        )
+        # Read once so a retried request re-sends the same bytes
+        audio_bytes = audio_file.read()
+        with upstream.limit("whisper", user_id):
+            response = upstream.get_whisper_session().post(
+                **endpoints.whisper_request(audio_file.filename, audio_bytes, audio_file.mimetype),
+                timeout=upstream.whisper_timeout()
+            )
         
-        if response.ok:
-            result = response.json()
-            return jsonify({"text": result.get("text", "")})
-        else:
-            return jsonify({"error": "Transcription failed"}), 500
+        body, status = endpoints.transcription_result(response.ok, response.json)
+        return jsonify(body), status
             
+    except upstream.Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         print(f"Transcription error: {e}")
         return jsonify({"error": str(e)}), 500
 
-async def generate_speech(text, voice):
-    """Generate speech using Edge TTS."""
-    communicate = edge_tts.Communicate(text, voice)
-    
-    audio_bytes = b""
-    async for chunk in communicate.stream():
-        if chunk["type"] == "audio":
-            audio_bytes += chunk["data"]
-    
-    return audio_bytes
-
-@app.route('/api/tts', methods=['POST'])
+@app.route('/api/tts', methods=['GET', 'POST'])
 @jwt_required()
 def text_to_speech():
-    """Generate speech from text using Edge TTS."""
-    data = request.json
+    """Generate speech from text using Edge TTS, served from the audio cache when possible.
+
+    The ETag is the content address of the clip; cached clips also get
+    If-None-Match (304) and Range handling. A clip that is still being
+    pre-synthesized is waited for rather than synthesized twice.
+    """
+    user_id = get_jwt_identity()
+    data = request.json if request.method == 'POST' else request.args
     text = data.get('text', '')
-    voice = data.get('voice', 'ja-JP-NanamiNeural')
-    
-    valid_voices = [
-        'ja-JP-NanamiNeural', 'ja-JP-KeitaNeural', 'ja-JP-AoiNeural',
-        'ja-JP-DaichiNeural', 'ja-JP-MayuNeural', 'ja-JP-NaokiNeural', 
-        'ja-JP-ShioriNeural'
-    ]
-    if voice not in valid_voices:
-        voice = 'ja-JP-NanamiNeural'
+    voice = endpoints.tts_voice(data.get('voice'))
     
     if not text:
         return jsonify({"error": "No text provided"}), 400
     
     try:
-        audio_data = asyncio.run(generate_speech(text, voice))
+        key = cache_key(text, voice)
+        audio_data = load_clip(key)
         
-        return app.response_class(
-            audio_data,
+        if audio_data is not None:
+            status, headers, body = endpoints.cached_clip(audio_data, key, request.headers)
+            return Response(body, status=status, mimetype='audio/mpeg', headers=headers)
+        
+        # Cache miss: relay chunks as Edge TTS produces them. Pull the first
+        # one here so synthesis failures and admission rejections still
+        # surface as an error status.
+        chunks = stream_speech_cached(key, text, voice, user_id)
+        first_chunk = next(chunks, b"")
+        
+        def generate():
+            yield first_chunk
+            yield from chunks
+        
+        return Response(
+            stream_with_context(generate()),
             mimetype='audio/mpeg',
-            headers={'Content-Disposition': 'inline'}
+            headers={**endpoints.clip_headers(key), 'Accept-Ranges': 'none', 'X-Accel-Buffering': 'no'}
         )
+    except upstream.Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         print(f"TTS error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/tts/stats', methods=['GET'])
+@jwt_required()
+def tts_stats():
+    return jsonify({**audio_cache.snapshot(), "presynth": presynth.snapshot()})
+
 @app.route('/api/chat', methods=['POST'])
 @jwt_required()
 def chat():
+    user_id = get_jwt_identity()
     data = request.json
     try:
-        response = generate_tutor_response(
-            data.get('message', ''),
-            data.get('levelContext', ''),
-            data.get('vocabContext', '')
-        )
-        return jsonify(response)
+        response = generate_tutor_response(**endpoints.tutor_arguments(user_id, data))
+        # Start synthesizing the reply's audio before the client asks for it
+        return jsonify(endpoints.chat_reply(response, user_id, data))
+    except upstream.Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         print(f"AI Error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+@jwt_required()
+def chat_stream():
+    """Stream the tutor reply as NDJSON, one finished segment per line.
+
+    See endpoints.ChatStreamLines for the events. Streamed segments carry
+    readings only; the segments in "done" add meanings and explanations.
+    """
+    user_id = get_jwt_identity()
+    data = request.json
+
+    try:
+        events = stream_tutor_response(**endpoints.tutor_arguments(user_id, data))
+        # Start the reply before responding so a refused or failed call
+        # gets an error status instead of a stream with one error line
+        first = next(events)
+    except upstream.Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        print(f"AI Stream Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    lines = endpoints.ChatStreamLines(user_id, data)
+
+    def generate():
+        try:
+            for event, payload in itertools.chain([first], events):
+                yield lines.line(event, payload)
+        except Exception as e:
+            yield lines.error(e)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers=endpoints.NDJSON_HEADERS
+    )
+
+@app.route('/api/chat/stats', methods=['GET'])
+@jwt_required()
+def chat_stats():
+    return jsonify(reply_cache.snapshot())
+
+# ==================== DICTIONARY ROUTES ====================
+
+DICTIONARY_MAX_RESULTS = 50
+
+@app.route('/api/dictionary/<path:term>', methods=['GET'])
+@jwt_required()
+def dictionary_lookup(term):
+    """JMdict entries for a word; ?prefix=1 also matches longer words starting with it.
+
+    An inflected form with no entry of its own falls back to its dictionary
+    form (食べました -> 食べる).
+    """
+    if dictionary.dictionary is None:
+        return jsonify({"error": "Dictionary is not available"}), 503
+
+    prefix = request.args.get('prefix') in ('1', 'true')
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), DICTIONARY_MAX_RESULTS)
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+
+    with telemetry.stage("dictionary"):
+        entries = dictionary.dictionary.lookup(term, prefix, limit)
+        lemma = None
+        if not entries:
+            lemma = annotator.dictionary_form(term)
+            if lemma != term:
+                entries = dictionary.dictionary.lookup(lemma, prefix, limit)
+
+    response = jsonify({"term": term, "lemma": lemma if entries and lemma != term else None, "entries": entries})
+    # The index only changes with a deploy
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+def vocab_item(r):
+    """API shape of a vocab row."""
+    return {
+        "id": r['id'],
+        "term": r['term'],
+        "reading": r['reading'],
+        "meaning": r['meaning'],
+        "explanation": r['explanation'],
+        "examples": json.loads(r['examples']) if r['examples'] else [],
+        "mastery": r['mastery'],
+        "addedAt": r['added_at'],
+        "dueAt": r.get('due_at')
+    }
+
+class VocabConflict(Exception):
+    """A vocab item's id or edited term clashes with another stored row."""
+
+def upsert_vocab_items(cur, user_id, items):
+    """Insert or update vocab items in one transaction, deduplicated on (user_id, term).
+
+    An item whose id is already stored for this user updates that row, so
+    editing a card's term renames it. Otherwise rows are matched on term and
+    an existing row keeps its id. Returns {term: id} for the stored rows.
+    Raises VocabConflict for an id owned by another user or a rename onto a
+    term that another card still holds once the whole batch is applied.
+    Only id and term are required; other fields fall back to column defaults.
+    """
+    rows = {}
+    seen_ids = set()
+    # Last occurrence of a term or id wins; a statement can't touch one row twice
+    for item in reversed(items):
+        if item['term'] in rows or item['id'] in seen_ids:
+            continue
+        seen_ids.add(item['id'])
+        rows[item['term']] = (
+            item['id'],
+            user_id,
+            item['term'],
+            # Fill gaps locally rather than leave the card blank
+            item.get('reading') or annotator.reading(item['term']),
+            item.get('meaning') or annotator.gloss(item['term']),
+            item.get('explanation', ''),
+            json.dumps(item.get('examples', [])),
+            item.get('mastery', 1),
+            item.get('addedAt')
+        )
+    rows = dict(reversed(rows.items()))
+
+    cur.execute(
+        "SELECT id, user_id, term FROM vocab WHERE id = ANY(%s) FOR UPDATE",
+        ([row[0] for row in rows.values()],)
+    )
+    stored = {vocab_id: (owner, term) for vocab_id, owner, term in cur.fetchall()}
+    renames = []
+    for term, row in list(rows.items()):
+        if row[0] not in stored:
+            continue
+        owner, stored_term = stored[row[0]]
+        if owner != user_id:
+            raise VocabConflict(f"Vocab id {row[0]} is already in use")
+        if stored_term != term:
+            renames.append(rows.pop(term))
+
+    ids = {}
+    try:
+        if renames:
+            # Judge clashes on the batch's end state, so swapping two cards' terms is fine
+            renamed_ids = [row[0] for row in renames]
+            cur.execute(
+                "SELECT term, id FROM vocab WHERE user_id = %s AND term = ANY(%s) AND NOT id = ANY(%s)",
+                (user_id, [row[2] for row in renames], renamed_ids)
+            )
+            held = cur.fetchone()
+            if held:
+                raise VocabConflict(f"'{held[0]}' is already in your vocab")
+            # Park the old terms first so no intermediate state has two cards on one term
+            cur.execute(
+                "UPDATE vocab SET term = 'renaming:' || id WHERE user_id = %s AND id = ANY(%s)",
+                (user_id, renamed_ids)
+            )
+            for vocab_id, _, term, reading, meaning, explanation, examples, _, added_at in renames:
+                cur.execute(
+                    """UPDATE vocab SET term = %s, reading = %s, meaning = %s, explanation = %s, examples = %s,
+                           added_at = COALESCE(%s, added_at)
+                       WHERE id = %s AND user_id = %s""",
+                    (term, reading, meaning, explanation, examples, added_at, vocab_id, user_id)
+                )
+                ids[term] = vocab_id
+
+        if rows:
+            result = execute_values(
+                cur,
+                """INSERT INTO vocab (id, user_id, term, reading, meaning, explanation, examples, mastery, added_at)
+                   VALUES %s
+                   ON CONFLICT (user_id, term) DO UPDATE SET
+                       reading = EXCLUDED.reading,
+                       meaning = EXCLUDED.meaning,
+                       explanation = EXCLUDED.explanation,
+                       examples = EXCLUDED.examples,
+                       added_at = COALESCE(EXCLUDED.added_at, vocab.added_at)
+                   RETURNING term, id""",
+                list(rows.values()),
+                page_size=len(rows),
+                fetch=True
+            )
+            ids.update({term: vocab_id for term, vocab_id in result})
+    except UniqueViolation as e:
+        # A concurrent save took the id or term between the checks and the writes
+        raise VocabConflict("Vocab changed concurrently, try again") from e
+    return ids
+
 @app.route('/api/vocab', methods=['GET', 'POST'])
 @jwt_required()
 def vocab():
@@ -363,88 +965,214 @@ def vocab():
     if not is_db_available():
         return jsonify({"error": "Database not available"}), 503
     
-    conn = None
     try:
-        conn = get_db_connection()
-        conn.autocommit = True
-        
-        if request.method == 'POST':
-            item = request.json
+        with db_connection() as conn:
+            if request.method == 'POST':
+                item = request.json
             
-            sql = """
-                INSERT INTO vocab (id, user_id, term, reading, meaning, explanation, examples, mastery, added_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (id) DO UPDATE SET
-                    term = EXCLUDED.term,
-                    reading = EXCLUDED.reading,
-                    meaning = EXCLUDED.meaning,
-                    explanation = EXCLUDED.explanation,
-                    examples = EXCLUDED.examples,
-                    mastery = EXCLUDED.mastery,
-                    added_at = EXCLUDED.added_at;
-            """
+                with conn.cursor() as cur:
+                    upsert_vocab_items(cur, user_id, [item])
             
-            with conn.cursor() as cur:
-                cur.execute(sql, (
-                    item['id'], 
-                    user_id,
-                    item['term'], 
-                    item['reading'], 
-                    item['meaning'], 
-                    item.get('explanation', ''), 
-                    json.dumps(item.get('examples', [])), 
-                    item['mastery'], 
-                    item['addedAt']
-                ))
-            
-            return jsonify({"status": "saved"})
+                user_vocab_cache.invalidate(user_id)
+                return jsonify({"status": "saved"})
         
-        else:  # GET
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("SELECT * FROM vocab WHERE user_id = %s ORDER BY added_at DESC", (user_id,))
-                rows = cur.fetchall()
+            else:  # GET
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute("SELECT * FROM vocab WHERE user_id = %s ORDER BY added_at DESC", (user_id,))
+                    rows = cur.fetchall()
             
-            vocab_list = []
-            for r in rows:
-                vocab_list.append({
-                    "id": r['id'],
-                    "term": r['term'],
-                    "reading": r['reading'],
-                    "meaning": r['meaning'], 
-                    "explanation": r['explanation'],
-                    "examples": json.loads(r['examples']) if r['examples'] else [],
-                    "mastery": r['mastery'],
-                    "addedAt": r['added_at']
-                })
-            return jsonify(vocab_list)
+                return jsonify([vocab_item(r) for r in rows])
 
+    except VocabConflict as e:
+        return jsonify({"error": str(e)}), 409
+    except KeyError as e:
+        return jsonify({"error": f"Missing field {e}"}), 400
+    except Exception as e:
+        print(f"Database Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/vocab/batch', methods=['POST'])
+@jwt_required()
+def vocab_batch():
+    """Upsert many vocab items in a single round trip and transaction."""
+    user_id = get_jwt_identity()
+    items = request.json
+    
+    if not isinstance(items, list):
+        return jsonify({"error": "Expected a list of vocab items"}), 400
+    if len(items) > MAX_VOCAB_BATCH:
+        return jsonify({"error": f"At most {MAX_VOCAB_BATCH} items per batch"}), 400
+    if not items:
+        return jsonify({"status": "saved", "ids": {}})
+    
+    if not is_db_available():
+        return jsonify({"error": "Database not available"}), 503
+    
+    try:
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                ids = upsert_vocab_items(cur, user_id, items)
+        
+            user_vocab_cache.invalidate(user_id)
+            return jsonify({"status": "saved", "ids": ids})
+        
+    except VocabConflict as e:
+        return jsonify({"error": str(e)}), 409
+    except KeyError as e:
+        return jsonify({"error": f"Missing field {e}"}), 400
     except Exception as e:
         print(f"Database Error: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            release_db_connection(conn)
 
 @app.route('/api/vocab/<vocab_id>', methods=['DELETE'])
 @jwt_required()
 def delete_vocab(vocab_id):
     user_id = get_jwt_identity()
     
-    conn = None
     try:
-        conn = get_db_connection()
-        conn.autocommit = True
-        
-        with conn.cursor() as cur:
-            cur.execute("DELETE FROM vocab WHERE id = %s AND user_id = %s", (vocab_id, user_id))
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM vocab WHERE id = %s AND user_id = %s", (vocab_id, user_id))
         
-        return jsonify({"status": "deleted"})
+            user_vocab_cache.invalidate(user_id)
+            return jsonify({"status": "deleted"})
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            release_db_connection(conn)
+
+# ==================== REVIEW ROUTES ====================
+
+@app.route('/api/review/next', methods=['GET'])
+@jwt_required()
+def review_next():
+    """The next due cards, most overdue first, in one range scan of (user_id, due_at)."""
+    user_id = get_jwt_identity()
+    try:
+        limit = min(max(int(request.args.get('limit', srs.REVIEW_BATCH_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+
+    if not is_db_available():
+        return jsonify({"error": "Database not available"}), 503
+
+    now = int(time.time() * 1000)
+    try:
+        with db_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(
+                    """SELECT id, term, reading, meaning, explanation, examples, mastery, added_at,
+                              due_at, interval_days, ease, repetitions, lapses
+                       FROM vocab
+                       WHERE user_id = %s AND due_at <= %s
+                       ORDER BY due_at, id
+                       LIMIT %s""",
+                    (user_id, now, limit)
+                )
+                rows = cur.fetchall()
+
+        cards = []
+        for r in rows:
+            card = vocab_item(r)
+            card.update({"interval": r['interval_days'], "ease": r['ease'], "repetitions": r['repetitions'], "lapses": r['lapses']})
+            cards.append(card)
+        return jsonify({"cards": cards, "now": now})
+
+    except Exception as e:
+        print(f"Database Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/review/grade', methods=['POST'])
+@jwt_required()
+def review_grade():
+    """Record a batch of answers: [{"id", "grade": 1-4, "reviewedAt"?}, ...].
+
+    Grades for the same card are applied in reviewedAt order. Only the
+    graded cards are read and written, in one transaction.
+    """
+    user_id = get_jwt_identity()
+    grades = request.json
+
+    if not isinstance(grades, list):
+        return jsonify({"error": "Expected a list of grades"}), 400
+    if len(grades) > srs.MAX_REVIEW_GRADES:
+        return jsonify({"error": f"At most {srs.MAX_REVIEW_GRADES} grades per batch"}), 400
+
+    now = int(time.time() * 1000)
+    answers = []
+    for g in grades:
+        grade = g.get('grade') if isinstance(g, dict) else None
+        # bool is an int subclass and 3.0 == 3; only a real int is a grade
+        if (not isinstance(g, dict) or not isinstance(g.get('id'), str)
+                or not isinstance(grade, int) or isinstance(grade, bool) or grade not in srs.GRADES):
+            return jsonify({"error": "Each grade needs an id and a grade from 1 (again) to 4 (easy)"}), 400
+        reviewed_at = g.get('reviewedAt')
+        # Offline answers keep their time, but never land in the future
+        if isinstance(reviewed_at, (int, float)) and not isinstance(reviewed_at, bool) and math.isfinite(reviewed_at):
+            reviewed_at = min(int(reviewed_at), now)
+        else:
+            reviewed_at = now
+        answers.append((reviewed_at, g['id'], g['grade']))
+    if not answers:
+        return jsonify({"status": "saved", "cards": [], "missing": []})
+
+    if not is_db_available():
+        return jsonify({"error": "Database not available"}), 503
+
+    try:
+        with db_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(
+                    """SELECT id, interval_days, ease, repetitions, lapses
+                       FROM vocab WHERE user_id = %s AND id = ANY(%s)
+                       FOR UPDATE""",
+                    (user_id, list({vocab_id for _, vocab_id, _ in answers}))
+                )
+                cards = {r['id']: dict(r) for r in cur.fetchall()}
+
+                log = []
+                for reviewed_at, vocab_id, grade in sorted(answers, key=lambda a: a[0]):
+                    card = cards.get(vocab_id)
+                    if card is None:
+                        continue
+                    card.update(srs.schedule(card, grade, reviewed_at))
+                    log.append((user_id, vocab_id, grade, reviewed_at, card['interval_days']))
+
+                if log:
+                    # Ids were already checked against user_id above
+                    execute_values(
+                        cur,
+                        """UPDATE vocab v SET
+                               due_at = d.due_at, interval_days = d.interval_days, ease = d.ease,
+                               repetitions = d.repetitions, lapses = d.lapses, mastery = d.mastery,
+                               last_reviewed_at = d.last_reviewed_at
+                           FROM (VALUES %s) AS d(id, due_at, interval_days, ease, repetitions, lapses, mastery, last_reviewed_at)
+                           WHERE v.id = d.id""",
+                        [
+                            (c['id'], c['due_at'], c['interval_days'], c['ease'], c['repetitions'], c['lapses'], c['mastery'], c['last_reviewed_at'])
+                            for c in cards.values() if 'due_at' in c
+                        ],
+                        page_size=len(cards)
+                    )
+                    execute_values(
+                        cur,
+                        "INSERT INTO reviews (user_id, vocab_id, grade, reviewed_at, interval_days) VALUES %s",
+                        log,
+                        page_size=len(log)
+                    )
+
+        user_vocab_cache.invalidate(user_id)
+        return jsonify({
+            "status": "saved",
+            "cards": [
+                {"id": c['id'], "dueAt": c['due_at'], "interval": c['interval_days'], "ease": c['ease'], "mastery": c['mastery']}
+                for c in cards.values() if 'due_at' in c
+            ],
+            "missing": sorted({vocab_id for _, vocab_id, _ in answers} - cards.keys())
+        })
+
+    except Exception as e:
+        print(f"Database Error: {e}")
+        return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
     print("🚀 Server running on http://localhost:5000")
@@ -0,0 +1,309 @@
+"""ASGI entry point for production serving.
+
+Routes that spend most of their time waiting on Gemini, Whisper or Edge TTS
+are served natively async here, so a slow upstream holds a coroutine rather
+than a worker thread. Everything else is handed to the Flask app in app.py.
+
+Run with:  uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+import os
+import json
+import asyncio
+import functools
+from contextlib import asynccontextmanager
+from a2wsgi import WSGIMiddleware
+from flask_jwt_extended import decode_token
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+from app import app as flask_app
+from ai import generate_tutor_response_async, stream_tutor_response_async
+from tts import cache_key, load_clip, astream_speech_cached
+import endpoints
+from endpoints import WHISPER_URL
+from transcription import SpeechSegmenter, transcribe_segment, STREAM_MAX_PENDING_SEGMENTS
+import upstream
+import telemetry
+
+# Threads for the Flask (WSGI) side: DB-bound routes only
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", "16"))
+
+whisper_client = None
+
+class AuthError(Exception):
+    pass
+
+def user_id_from_token(token):
+    """Validate a JWT the same way @jwt_required() does and return the identity."""
+    try:
+        with flask_app.app_context():
+            decoded = decode_token(token)
+    except Exception as e:
+        raise AuthError(str(e))
+    return decoded[flask_app.config.get('JWT_IDENTITY_CLAIM', 'sub')]
+
+def get_user_id(request):
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        raise AuthError("Missing Authorization Header")
+    return user_id_from_token(header[len('Bearer '):])
+
+def auth_error(e):
+    return JSONResponse({"msg": str(e)}, status_code=401)
+
+def traced(route):
+    """Time an async endpoint the way the Flask hooks time WSGI routes."""
+    def decorate(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(request):
+            trace = telemetry.start_trace(request.method, route, telemetry.request_id_from(request.headers.get('x-request-id')))
+            try:
+                response = await endpoint(request)
+            except Exception:
+                telemetry.finish_trace(trace, 500)
+                raise
+            response.headers['X-Request-ID'] = trace.request_id
+            if isinstance(response, StreamingResponse):
+                body = response.body_iterator
+
+                async def finish_after_body():
+                    try:
+                        async for chunk in body:
+                            yield chunk
+                    finally:
+                        telemetry.finish_trace(trace, response.status_code)
+
+                response.body_iterator = finish_after_body()
+            else:
+                telemetry.finish_trace(trace, response.status_code)
+            return response
+        return wrapper
+    return decorate
+
+def overloaded_error(e):
+    return JSONResponse({"error": str(e)}, status_code=e.status, headers={'Retry-After': str(e.retry_after)})
+
+@traced('/api/chat')
+async def chat(request):
+    try:
+        user_id = get_user_id(request)
+    except AuthError as e:
+        return auth_error(e)
+
+    data = await request.json()
+    try:
+        arguments = await run_in_threadpool(endpoints.tutor_arguments, user_id, data)
+        response = await generate_tutor_response_async(**arguments)
+        return JSONResponse(endpoints.chat_reply(response, user_id, data))
+    except upstream.Overloaded as e:
+        return overloaded_error(e)
+    except Exception as e:
+        print(f"AI Error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@traced('/api/chat/stream')
+async def chat_stream(request):
+    try:
+        user_id = get_user_id(request)
+    except AuthError as e:
+        return auth_error(e)
+
+    data = await request.json()
+    try:
+        arguments = await run_in_threadpool(endpoints.tutor_arguments, user_id, data)
+        events = stream_tutor_response_async(**arguments)
+        # Start the reply first so refusals and failures get an error status
+        first = await anext(events)
+    except upstream.Overloaded as e:
+        return overloaded_error(e)
+    except Exception as e:
+        print(f"AI Stream Error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+    lines = endpoints.ChatStreamLines(user_id, data)
+
+    async def generate():
+        try:
+            yield lines.line(*first)
+            async for event, payload in events:
+                yield lines.line(event, payload)
+        except Exception as e:
+            yield lines.error(e)
+
+    return StreamingResponse(
+        generate(),
+        media_type='application/x-ndjson',
+        headers=endpoints.NDJSON_HEADERS
+    )
+
+@traced('/api/transcribe')
+async def transcribe(request):
+    try:
+        user_id = get_user_id(request)
+    except AuthError as e:
+        return auth_error(e)
+
+    form = await request.form()
+    audio_file = form.get('audio')
+    if audio_file is None or isinstance(audio_file, str):
+        return JSONResponse({"error": "No audio file provided"}, status_code=400)
+
+    try:
+        async with upstream.alimit("whisper", user_id):
+            # Stream from the spooled upload rather than reading it into memory
+            response = await whisper_client.post(
+                **endpoints.whisper_request(audio_file.filename, audio_file.file, audio_file.content_type)
+            )
+
+        body, status = endpoints.transcription_result(response.is_success, response.json)
+        return JSONResponse(body, status_code=status)
+
+    except upstream.Overloaded as e:
+        return overloaded_error(e)
+    except Exception as e:
+        print(f"Transcription error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def transcribe_stream(websocket):
+    """Live transcription over a WebSocket.
+
+    The client sends {"token": ...} first, then binary frames of 16 kHz mono
+    16-bit PCM, then {"type": "end"}. We reply with {"type": "partial"} as
+    each segment is transcribed and a {"type": "final"} before closing.
+    """
+    await websocket.accept()
+    try:
+        hello = await websocket.receive_json()
+        user_id = user_id_from_token(hello.get('token', ''))
+    except WebSocketDisconnect:
+        return
+    except (AuthError, ValueError, KeyError, AttributeError) as e:
+        await websocket.send_json({"type": "error", "error": str(e) or "Unauthorized"})
+        await websocket.close(code=1008)
+        return
+
+    trace = telemetry.start_trace('WS', '/api/transcribe/stream')
+    segmenter = SpeechSegmenter()
+    segments = asyncio.Queue(maxsize=STREAM_MAX_PENDING_SEGMENTS)
+    texts = []
+
+    async def transcribe_segments():
+        # One segment at a time so the transcript stays in speaking order
+        while (pcm := await segments.get()) is not None:
+            text = await transcribe_segment(whisper_client, WHISPER_URL, pcm, user_id)
+            if text:
+                texts.append(text)
+                await websocket.send_json({"type": "partial", "text": "".join(texts)})
+
+    worker = asyncio.create_task(transcribe_segments())
+
+    async def enqueue(item):
+        # Waits for queue space, unless the worker has died and never will free any
+        put = asyncio.ensure_future(segments.put(item))
+        await asyncio.wait({put, worker}, return_when=asyncio.FIRST_COMPLETED)
+        put.cancel()
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            if message.get('bytes'):
+                for pcm in segmenter.feed(message['bytes']):
+                    # Stops reading from the client while Whisper is behind
+                    await enqueue(pcm)
+            elif message.get('text') and json.loads(message['text']).get('type') == 'end':
+                break
+            if worker.done():
+                break
+
+        if not worker.done():
+            tail = segmenter.flush()
+            if tail:
+                await enqueue(tail)
+            await enqueue(None)
+        await worker
+        await websocket.send_json({"type": "final", "text": "".join(texts)})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except upstream.Overloaded as e:
+        try:
+            await websocket.send_json({"type": "error", "error": str(e), "retryAfter": e.retry_after})
+            await websocket.close(code=1013)  # Try Again Later
+        except Exception:
+            pass
+    except Exception as e:
+        print(f"Transcription stream error: {e}")
+        try:
+            await websocket.send_json({"type": "error", "error": str(e)})
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        worker.cancel()
+        telemetry.finish_trace(trace, 101)
+
+@traced('/api/tts')
+async def text_to_speech(request):
+    try:
+        user_id = get_user_id(request)
+    except AuthError as e:
+        return auth_error(e)
+
+    data = await request.json() if request.method == 'POST' else request.query_params
+    text = data.get('text', '')
+    voice = endpoints.tts_voice(data.get('voice'))
+
+    if not text:
+        return JSONResponse({"error": "No text provided"}, status_code=400)
+
+    try:
+        key = cache_key(text, voice)
+        # Disk reads and waits on a pre-synthesis worker stay off the event loop
+        audio_data = await run_in_threadpool(load_clip, key)
+
+        if audio_data is not None:
+            status, headers, body = endpoints.cached_clip(audio_data, key, request.headers)
+            return Response(body, status_code=status, media_type='audio/mpeg', headers=headers)
+
+        # Pull the first chunk before responding so synthesis failures are a 500
+        chunks = astream_speech_cached(key, text, voice, user_id)
+        first_chunk = await anext(chunks, b"")
+
+        async def generate():
+            yield first_chunk
+            async for chunk in chunks:
+                yield chunk
+
+        return StreamingResponse(
+            generate(),
+            media_type='audio/mpeg',
+            headers={**endpoints.clip_headers(key), 'Accept-Ranges': 'none', 'X-Accel-Buffering': 'no'}
+        )
+    except upstream.Overloaded as e:
+        return overloaded_error(e)
+    except Exception as e:
+        print(f"TTS error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@asynccontextmanager
+async def lifespan(_):
+    global whisper_client
+    whisper_client = upstream.create_async_whisper_client()
+    yield
+    await whisper_client.aclose()
+
+application = Starlette(
+    routes=[
+        Route('/api/chat', chat, methods=['POST']),
+        Route('/api/chat/stream', chat_stream, methods=['POST']),
+        Route('/api/transcribe', transcribe, methods=['POST']),
+        WebSocketRoute('/api/transcribe/stream', transcribe_stream),
+        Route('/api/tts', text_to_speech, methods=['GET', 'POST']),
+        Mount('/', app=WSGIMiddleware(flask_app, workers=WSGI_THREADS)),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,336 @@
+"""Drive realistic user flows against the backend and report latency per endpoint.
+
+    cd backend && python -m bench.loadtest --users 20 --duration 60
+
+By default this starts bench.server (real app, stubbed Gemini/Whisper/Edge
+TTS) against the database in DB_DSN and stops it afterwards. Pass --url
+to target a server that is already running.
+
+Each virtual user registers once, then repeats: login -> list sessions ->
+create a session -> a few chat turns, each appended to the session ->
+save the new words -> play one reply with TTS -> (sometimes) transcribe.
+Flows are seeded, so two runs with the same flags issue the same requests.
+
+--save writes the results as JSON; --baseline compares p95s against such a
+file and exits non-zero if any endpoint got slower than --max-regression.
+"""
+import os
+import io
+import sys
+import json
+import math
+import time
+import uuid
+import wave
+import random
+import signal
+import argparse
+import threading
+import subprocess
+from collections import defaultdict
+import requests
+
+PHRASES = [
+    "こんにちは", "今日はいい天気ですね", "猫が好きです", "日本語を勉強しています",
+    "昨日、友達と映画を見ました", "駅はどこですか", "おすすめの本はありますか",
+    "週末は何をしますか", "この漢字の読み方を教えてください", "ラーメンを食べたいです",
+]
+
+BENCH_EMAIL_DOMAIN = "bench.invalid"
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)  # endpoint -> [seconds]
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def add(self, endpoint, seconds, status):
+        with self._lock:
+            self.samples[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+            if status == 'error' or status >= 400:
+                self.errors[endpoint] += 1
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+class VirtualUser:
+    def __init__(self, index, base_url, recorder, rng, args, run_id):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.rng = rng
+        self.args = args
+        self.http = requests.Session()
+        self.email = f"user{index}-{run_id}@{BENCH_EMAIL_DOMAIN}"
+        self.password = "bench-password"
+        self.token = None
+
+    def call(self, endpoint, method, path, stream=False, **kwargs):
+        headers = kwargs.pop('headers', {})
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        started = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, headers=headers,
+                                         stream=stream, timeout=self.args.timeout, **kwargs)
+            # Time to the last byte, like a client playing or rendering it
+            content = response.content
+        except requests.RequestException:
+            self.recorder.add(endpoint, time.perf_counter() - started, 'error')
+            return None, None
+        self.recorder.add(endpoint, time.perf_counter() - started, response.status_code)
+        return response, content
+
+    def register(self):
+        response, _ = self.call('POST /api/auth/register', 'POST', '/api/auth/register',
+                                json={"email": self.email, "password": self.password})
+        return response is not None and response.status_code == 201
+
+    def flow(self):
+        response, _ = self.call('POST /api/auth/login', 'POST', '/api/auth/login',
+                                json={"email": self.email, "password": self.password})
+        if response is None or not response.ok:
+            return
+        self.token = response.json()['token']
+
+        self.call('GET /api/sessions', 'GET', '/api/sessions')
+
+        session_id = str(uuid.uuid4())
+        self.call('POST /api/sessions', 'POST', '/api/sessions',
+                  json={"id": session_id, "title": "Bench conversation"})
+
+        words = {}
+        reply_text = None
+        for _ in range(self.args.turns):
+            message = self.rng.choice(PHRASES)
+            if self.args.stream:
+                response, content = self.call('POST /api/chat/stream', 'POST', '/api/chat/stream',
+                                              stream=True, json={"message": message, "levelContext": "N5", "sessionId": session_id})
+                segments = []
+                if response is not None and response.ok:
+                    for line in content.decode('utf-8').splitlines():
+                        event = json.loads(line)
+                        if event.get('type') == 'segment':
+                            segments.append(event['segment'])
+            else:
+                response, _ = self.call('POST /api/chat', 'POST', '/api/chat',
+                                        json={"message": message, "levelContext": "N5", "sessionId": session_id})
+                segments = response.json().get('segments', []) if response is not None and response.ok else []
+
+            now = int(time.time() * 1000)
+            self.call('POST /api/sessions/<id>/messages', 'POST', f'/api/sessions/{session_id}/messages', json={
+                "messages": [
+                    {"role": "user", "content": message, "timestamp": now},
+                    {"role": "assistant", "content": {"segments": segments}, "timestamp": now},
+                ]
+            })
+            for segment in segments:
+                words[segment['text']] = segment
+            if segments:
+                reply_text = "".join(s['text'] for s in segments)
+
+            time.sleep(self.rng.uniform(0, self.args.think_time))
+
+        if words:
+            self.call('POST /api/vocab/batch', 'POST', '/api/vocab/batch', json=[
+                {
+                    "id": str(uuid.uuid4()),
+                    "term": term,
+                    "reading": segment.get('reading', ''),
+                    "meaning": segment.get('meaning', ''),
+                    "mastery": 1,
+                    "addedAt": int(time.time() * 1000),
+                } for term, segment in words.items()
+            ])
+
+        if reply_text:
+            self.call('GET /api/tts', 'GET', '/api/tts', params={"text": reply_text})
+
+        if self.rng.random() < self.args.transcribe_ratio:
+            self.call('POST /api/transcribe', 'POST', '/api/transcribe',
+                      files={"audio": ("recording.wav", silent_wav(self.rng.uniform(1, 4)), "audio/wav")})
+
+def silent_wav(seconds):
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes(b"\x00\x00" * int(16000 * seconds))
+    return buf.getvalue()
+
+def wait_until_up(base_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError("Benchmark server exited during startup")
+        try:
+            if requests.get(f"{base_url}/api/health", timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not come up within {timeout}s")
+
+def start_server(args):
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [
+        sys.executable, '-m', 'bench.server',
+        '--port', str(args.port),
+        '--server', args.server,
+        '--gemini-latency', str(args.gemini_latency),
+        '--gemini-first-token', str(args.gemini_first_token),
+        '--whisper-latency', str(args.whisper_latency),
+        '--tts-latency', str(args.tts_latency),
+        '--bcrypt-rounds', str(args.bcrypt_rounds),
+    ]
+    return subprocess.Popen(command, cwd=backend_dir)
+
+def summarize(recorder, elapsed):
+    results = {}
+    for endpoint, samples in sorted(recorder.samples.items()):
+        ordered = sorted(samples)
+        results[endpoint] = {
+            "count": len(ordered),
+            "errors": recorder.errors[endpoint],
+            "rps": round(len(ordered) / elapsed, 2),
+            "p50_ms": round(percentile(ordered, 50) * 1000, 1),
+            "p95_ms": round(percentile(ordered, 95) * 1000, 1),
+            "p99_ms": round(percentile(ordered, 99) * 1000, 1),
+            "max_ms": round(ordered[-1] * 1000, 1),
+            "statuses": {str(k): v for k, v in sorted(recorder.statuses[endpoint].items(), key=str)},
+        }
+    return results
+
+def print_report(results, elapsed, total):
+    print(f"\n📊 {total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)\n")
+    header = f"{'endpoint':<34} {'count':>6} {'err':>5} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+    print(header)
+    print('-' * len(header))
+    for endpoint, r in results.items():
+        print(f"{endpoint:<34} {r['count']:>6} {r['errors']:>5} {r['rps']:>7.2f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['max_ms']:>8.1f}")
+    print("(latencies in ms)")
+
+def compare(results, baseline, max_regression, min_ms):
+    """Endpoints whose p95 regressed beyond the allowed ratio (ignoring tiny absolute changes)."""
+    regressions = []
+    for endpoint, r in results.items():
+        before = baseline.get(endpoint)
+        if not before:
+            continue
+        allowed = max(before['p95_ms'] * (1 + max_regression), before['p95_ms'] + min_ms)
+        if r['p95_ms'] > allowed:
+            regressions.append((endpoint, before['p95_ms'], r['p95_ms']))
+        if r['errors'] > before.get('errors', 0):
+            regressions.append((f"{endpoint} errors", before.get('errors', 0), r['errors']))
+    return regressions
+
+def cleanup(dsn):
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM users WHERE email LIKE %s", (f"%@{BENCH_EMAIL_DOMAIN}",))
+            print(f"🧹 Removed {cur.rowcount} benchmark users")
+    finally:
+        conn.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the backend with stubbed upstreams.")
+    parser.add_argument('--url', help="Target an already running server instead of starting bench.server")
+    parser.add_argument('--server', choices=('asgi', 'flask'), default='asgi')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=60, help="Seconds to keep starting new flows")
+    parser.add_argument('--ramp-up', type=float, default=5, help="Seconds over which users start")
+    parser.add_argument('--turns', type=int, default=3, help="Chat turns per flow")
+    parser.add_argument('--think-time', type=float, default=1.0, help="Max pause between turns (seconds)")
+    parser.add_argument('--no-stream', dest='stream', action='store_false', help="Use /api/chat instead of /api/chat/stream")
+    parser.add_argument('--transcribe-ratio', type=float, default=0.3)
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--gemini-latency', type=float, default=0.8)
+    parser.add_argument('--gemini-first-token', type=float, default=0.3)
+    parser.add_argument('--whisper-latency', type=float, default=1.0)
+    parser.add_argument('--tts-latency', type=float, default=0.4)
+    parser.add_argument('--bcrypt-rounds', type=int, default=4)
+    parser.add_argument('--save', help="Write results to this JSON file")
+    parser.add_argument('--baseline', help="Compare against results saved with --save")
+    parser.add_argument('--max-regression', type=float, default=0.2, help="Allowed p95 increase (0.2 = 20%%)")
+    parser.add_argument('--min-regression-ms', type=float, default=5, help="Ignore p95 increases smaller than this")
+    parser.add_argument('--cleanup', action='store_true', help="Delete benchmark users from DB_DSN afterwards")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    process = None
+    base_url = args.url.rstrip('/') if args.url else f"http://127.0.0.1:{args.port}"
+    if not args.url:
+        process = start_server(args)
+
+    try:
+        wait_until_up(base_url, process)
+        recorder = Recorder()
+        run_id = uuid.uuid4().hex[:8]
+        users = [VirtualUser(i, base_url, recorder, random.Random(args.seed * 100003 + i), args, run_id)
+                 for i in range(args.users)]
+
+        started = time.perf_counter()
+        deadline = started + args.duration
+
+        def run(user, delay):
+            time.sleep(delay)
+            if not user.register():
+                return
+            while time.perf_counter() < deadline:
+                user.flow()
+
+        threads = [
+            threading.Thread(target=run, args=(user, args.ramp_up * i / max(1, args.users)), daemon=True)
+            for i, user in enumerate(users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        results = summarize(recorder, elapsed)
+        print_report(results, elapsed, sum(r['count'] for r in results.values()))
+
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump({"args": vars(args), "results": results}, f, indent=2, ensure_ascii=False)
+            print(f"💾 Saved results to {args.save}")
+
+        exit_code = 0
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)['results']
+            regressions = compare(results, baseline, args.max_regression, args.min_regression_ms)
+            for endpoint, before, after in regressions:
+                print(f"❌ {endpoint}: {before} -> {after}")
+            if regressions:
+                exit_code = 1
+            else:
+                print("✅ No regressions against baseline")
+
+        if args.cleanup:
+            cleanup(os.environ['DB_DSN'])
+        return exit_code
+    finally:
+        if process is not None:
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+if __name__ == '__main__':
+    sys.exit(main())
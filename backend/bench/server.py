@@ -0,0 +1,48 @@
+"""Run the backend with stubbed upstreams for benchmarking.
+
+    cd backend && python -m bench.server --port 5050 --gemini-latency 0.8
+
+Uses DB_DSN from the environment, like the app itself. loadtest.py starts
+this for you unless it is pointed at an already running server.
+"""
+import os
+import argparse
+import tempfile
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--server', choices=('asgi', 'flask'), default='asgi',
+                        help="asgi: uvicorn + asgi.py as in production; flask: threaded dev server")
+    parser.add_argument('--gemini-latency', type=float, default=0.8)
+    parser.add_argument('--gemini-first-token', type=float, default=0.3)
+    parser.add_argument('--whisper-latency', type=float, default=1.0)
+    parser.add_argument('--tts-latency', type=float, default=0.4)
+    parser.add_argument('--bcrypt-rounds', type=int, default=4,
+                        help="Low by default so logins don't dominate; raise to test auth bursts")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    from bench import stubs
+    # Settings app.py and friends read at import time
+    os.environ['WHISPER_URL'] = stubs.start_fake_whisper(args.whisper_latency)
+    os.environ['BCRYPT_ROUNDS'] = str(args.bcrypt_rounds)
+    os.environ.setdefault('TTS_CACHE_DIR', tempfile.mkdtemp(prefix='bench-tts-'))
+    os.environ.setdefault('REQUEST_LOG', '0')
+
+    from app import app
+    stubs.install(args.gemini_latency, args.gemini_first_token, args.tts_latency)
+
+    print(f"🏁 Benchmark server ({args.server}) on http://{args.host}:{args.port}", flush=True)
+    if args.server == 'asgi':
+        import uvicorn
+        import asgi
+        uvicorn.run(asgi.application, host=args.host, port=args.port, log_level='warning')
+    else:
+        app.run(host=args.host, port=args.port, threaded=True)
+
+if __name__ == '__main__':
+    main()
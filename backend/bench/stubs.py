@@ -0,0 +1,145 @@
+"""Deterministic stand-ins for Gemini, Whisper and Edge TTS.
+
+Each stub answers from a hash of its input after a configurable delay, so
+benchmark runs exercise the real request path (admission control, caches,
+pool, serialization) without calling out to anything.
+"""
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+VOCAB = ["猫", "先生", "学校", "日本語", "食べる", "飲む", "行く", "本", "友達", "天気"]
+
+def _digest(text):
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+def fake_reply(prompt):
+    """A well-formed tutor reply derived from the prompt."""
+    digest = _digest(prompt)
+    words = [VOCAB[b % len(VOCAB)] for b in digest[:4 + digest[4] % 8]]
+    return {
+        "japanese": "、".join(words) + "です。",
+        "english": f"Reply {digest[:4].hex()}",
+        "grammar_point": "です: polite copula." if digest[5] % 2 else "",
+        "glosses": {word: f"word {VOCAB.index(word)}" for word in words},
+        "notes": {"です": "Polite copula."}
+    }
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+class _Response:
+    """Mimics a GenerateContentResponse, streamed or not."""
+
+    def __init__(self, text, chunks, delay):
+        self.text = text
+        self._chunks = chunks
+        self._delay = delay
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            time.sleep(self._delay)
+            yield _Chunk(chunk)
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def _aiter(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(self._delay)
+            yield _Chunk(chunk)
+
+class FakeModel:
+    """Replaces ai.model. `latency` is the total time to produce a reply."""
+
+    def __init__(self, latency=0.8, first_token=0.3, stream_chunks=8):
+        self.latency = latency
+        self.first_token = first_token
+        self.stream_chunks = stream_chunks
+
+    def _respond(self, prompt, stream):
+        text = json.dumps(fake_reply(prompt), ensure_ascii=False)
+        if not stream:
+            return _Response(text, [], 0), self.latency
+        size = max(1, len(text) // self.stream_chunks + 1)
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        return _Response(text, chunks, max(0.0, self.latency - self.first_token) / len(chunks)), self.first_token
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        response, wait = self._respond(prompt, stream)
+        time.sleep(wait)
+        return response
+
+    async def generate_content_async(self, prompt, stream=False, request_options=None):
+        response, wait = self._respond(prompt, stream)
+        await asyncio.sleep(wait)
+        return response
+
+class FakeCommunicate:
+    """Replaces edge_tts.Communicate; roughly 1 KB of "audio" per character."""
+
+    latency = 0.4
+    chunk_count = 8
+
+    def __init__(self, text, voice, **kwargs):
+        self.text = text
+        self.voice = voice
+
+    async def stream(self):
+        digest = _digest(f"{self.voice}:{self.text}")
+        chunk = (b"\xff\xf3" + digest) * max(1, len(self.text) * 1024 // (len(digest) + 2) // self.chunk_count)
+        for _ in range(self.chunk_count):
+            await asyncio.sleep(self.latency / self.chunk_count)
+            yield {"type": "audio", "data": chunk}
+
+class _WhisperHandler(BaseHTTPRequestHandler):
+    latency = 1.0
+    protocol_version = "HTTP/1.1"
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return bytes(body)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_POST(self):
+        body = self._read_body()
+        time.sleep(self.latency)
+        payload = json.dumps({"text": "".join(VOCAB[b % len(VOCAB)] for b in hashlib.sha256(body).digest()[:3])}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_fake_whisper(latency=1.0, host='127.0.0.1', port=0):
+    """Serve a stand-in for the Whisper /asr endpoint on a background thread; returns its URL."""
+    handler = type('WhisperHandler', (_WhisperHandler,), {'latency': latency})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-whisper", daemon=True).start()
+    return f"http://{host}:{server.server_address[1]}"
+
+def install(gemini_latency=0.8, gemini_first_token=0.3, tts_latency=0.4):
+    """Swap the stubs in for the real clients. Call after importing app."""
+    import edge_tts
+    import ai
+
+    ai.API_KEY = ai.API_KEY or "bench"
+    ai.model = FakeModel(gemini_latency, min(gemini_first_token, gemini_latency))
+    ai.summary_model = FakeModel(gemini_latency, min(gemini_first_token, gemini_latency))
+    FakeCommunicate.latency = tts_latency
+    edge_tts.Communicate = FakeCommunicate
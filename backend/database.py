@@ -1,14 +1,237 @@
 import os
+import select
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 import psycopg2
-from psycopg2 import pool
+from psycopg2 import extensions
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
+import telemetry
 
 load_dotenv()
 
 DB_DSN = os.getenv("DB_DSN")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "20"))
+# Seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Connections idle longer than this are pinged before being handed out; shorter
+# idles are pinged only if the server left something unread on the socket
+DB_HEALTHCHECK_IDLE = float(os.getenv("DB_HEALTHCHECK_IDLE", "30"))
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
 
 connection_pool = None
+# Set by init_db once pg_trgm and the search indexes are in place
+trigram_search = False
+
+class PoolTimeout(Exception):
+    pass
+
+class PoolMetrics:
+    """Counters for pool checkouts and statements, safe to update from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {
+            "checkouts": 0,
+            "checkout_waits": 0,
+            "checkout_timeouts": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "held_seconds_total": 0.0,
+            "held_seconds_max": 0.0,
+            "connections_opened": 0,
+            "connections_discarded": 0,
+            "statements": 0,
+            "statement_seconds_total": 0.0,
+            "statement_seconds_max": 0.0,
+            "slow_statements": 0,
+        }
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self.values[name] += amount
+
+    def observe(self, name, seconds):
+        with self._lock:
+            self.values[f"{name}_seconds_total"] += seconds
+            if seconds > self.values[f"{name}_seconds_max"]:
+                self.values[f"{name}_seconds_max"] = seconds
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.values)
+
+metrics = PoolMetrics()
+
+_instrumented_cursors = {}
+
+def _instrumented(cursor_class):
+    """Subclass of cursor_class whose execute() calls are timed."""
+    if cursor_class not in _instrumented_cursors:
+        class InstrumentedCursor(cursor_class):
+            def execute(self, query, vars=None):
+                start = time.perf_counter()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    _record_statement(query, time.perf_counter() - start)
+
+        InstrumentedCursor.__name__ = f"Instrumented{cursor_class.__name__}"
+        _instrumented_cursors[cursor_class] = InstrumentedCursor
+    return _instrumented_cursors[cursor_class]
+
+def _record_statement(query, seconds):
+    metrics.add("statements")
+    metrics.observe("statement", seconds)
+    telemetry.record("db_query", seconds)
+    if seconds * 1000 >= DB_SLOW_QUERY_MS:
+        metrics.add("slow_statements")
+        text = query.decode('utf-8', 'replace') if isinstance(query, bytes) else str(query)
+        print(f"🐢 Slow query ({seconds * 1000:.0f} ms, request {telemetry.current_request_id()}): {' '.join(text.split())[:200]}")
+
+class InstrumentedConnection(extensions.connection):
+    """Connection whose cursors, whatever their factory, record statement timings."""
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory') or self.cursor_factory or extensions.cursor
+        kwargs['cursor_factory'] = _instrumented(factory)
+        return super().cursor(*args, **kwargs)
+
+class ConnectionPool:
+    """Thread-safe connection pool that blocks (up to a timeout) when exhausted.
+
+    Connections are health-checked on checkout if they sat idle, left data
+    unread on the socket, or were idle when another connection turned out
+    dead; dead ones are discarded and the checkout moves on to the next.
+    Any open transaction is rolled back and autocommit restored on release.
+    """
+
+    def __init__(self, minconn, maxconn, dsn, timeout=DB_POOL_TIMEOUT):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.dsn = dsn
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, returned_at)
+        self._checked_out = {}  # id(conn) -> checked out at
+        self._size = 0
+        self._suspect_before = 0.0  # Idle since before a connection was found dead: ping first
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, connection_factory=InstrumentedConnection)
+        metrics.add("connections_opened")
+        return conn
+
+    def _is_alive(self, conn, returned_at):
+        if conn.closed:
+            return False
+        # A server that dropped the connection leaves its goodbye (or EOF) unread
+        readable, _, _ = select.select([conn], [], [], 0)
+        now = time.monotonic()
+        if not readable and now - returned_at < DB_HEALTHCHECK_IDLE and returned_at > self._suspect_before:
+            return True
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.autocommit = False
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        # Whatever killed it (a server restart, a failover) likely took its idle siblings too
+        self._suspect_before = time.monotonic()
+        metrics.add("connections_discarded")
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            conn = None
+            with self._cond:
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        metrics.add("checkout_timeouts")
+                        raise PoolTimeout(f"No database connection free after {self.timeout:.0f}s")
+                    waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                else:
+                    # Reserve the slot before connecting outside the lock
+                    self._size += 1
+                    returned_at = None
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_alive(conn, returned_at):
+                self._discard(conn)
+                with self._cond:
+                    self._size -= 1
+                continue
+
+            now = time.monotonic()
+            with self._cond:
+                self._checked_out[id(conn)] = now
+            metrics.add("checkouts")
+            if waited:
+                metrics.add("checkout_waits")
+            metrics.observe("wait", now - start)
+            telemetry.record("db_checkout", now - start)
+            return conn
+
+    def putconn(self, conn):
+        with self._cond:
+            checked_out_at = self._checked_out.pop(id(conn), None)
+        if checked_out_at is not None:
+            metrics.observe("held", time.monotonic() - checked_out_at)
+
+        keep = not conn.closed
+        if keep:
+            try:
+                # Reset session state so the next borrower starts clean
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                conn.autocommit = False
+            except psycopg2.Error:
+                keep = False
+
+        with self._cond:
+            if keep:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._size -= 1
+            self._cond.notify()
+        if not keep:
+            self._discard(conn)
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._checked_out),
+                "max": self.maxconn,
+            }
 
 def init_pool():
     """Initialize the database connection pool."""
@@ -19,13 +242,9 @@ def init_pool():
         return False
     
     try:
-        connection_pool = psycopg2.pool.SimpleConnectionPool(
-            1, 20,
-            dsn=DB_DSN
-        )
-        if connection_pool:
-            print("✅ Database connection pool created successfully")
-            return True
+        connection_pool = ConnectionPool(DB_POOL_MIN, DB_POOL_MAX, DB_DSN)
+        print("✅ Database connection pool created successfully")
+        return True
     except (Exception, psycopg2.DatabaseError) as error:
         print(f"❌ Error connecting to PostgreSQL: {error}")
         print("   Database features will be unavailable.")
@@ -42,6 +261,31 @@ def release_db_connection(conn):
     if connection_pool is not None and conn is not None:
         connection_pool.putconn(conn)
 
+@contextmanager
+def db_connection():
+    """Borrow a pooled connection for one transaction.
+
+    Commits when the block exits normally (including an early return),
+    rolls back if it raises, and always returns the connection to the pool.
+    """
+    conn = get_db_connection()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+def pool_stats():
+    """Pool occupancy plus checkout/statement metrics."""
+    stats = metrics.snapshot()
+    if connection_pool is not None:
+        stats.update(connection_pool.snapshot())
+    return stats
+
 def is_db_available():
     """Check if database is available."""
     return connection_pool is not None
@@ -52,74 +296,278 @@ def init_db():
         print("⚠️  Skipping database initialization - no connection available")
         return False
     
-    conn = None
     try:
-        conn = get_db_connection()
-        conn.autocommit = True
-        with conn.cursor() as cur:
-            # Create Users Table
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id TEXT PRIMARY KEY,
-                    email TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    created_at BIGINT NOT NULL
-                );
-            """)
-            
-            # Create User Settings Table
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS user_settings (
-                    user_id TEXT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
-                    settings JSONB DEFAULT '{}'::jsonb
-                );
-            """)
-            
-            # Create Vocab Table with user_id
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS vocab (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                    term TEXT NOT NULL,
-                    reading TEXT,
-                    meaning TEXT,
-                    explanation TEXT,
-                    examples TEXT, 
-                    mastery INTEGER DEFAULT 1,
-                    added_at BIGINT
-                );
-            """)
-            
-            # Create index on vocab user_id
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_vocab_user_id ON vocab(user_id);
-            """)
-            
-            # Create Sessions Table with user_id
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS sessions (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                    title TEXT,
-                    messages JSONB DEFAULT '[]'::jsonb,
-                    created_at BIGINT,
-                    updated_at BIGINT
-                );
-            """)
-            
-            # Create index on sessions user_id
-            cur.execute("""
-                CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
-            """)
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                # Create Users Table
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS users (
+                        id TEXT PRIMARY KEY,
+                        email TEXT UNIQUE NOT NULL,
+                        password_hash TEXT NOT NULL,
+                        created_at BIGINT NOT NULL
+                    );
+                """)
+            
+                # Create User Settings Table
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS user_settings (
+                        user_id TEXT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+                        settings JSONB DEFAULT '{}'::jsonb
+                    );
+                """)
+            
+                # Create Vocab Table with user_id
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS vocab (
+                        id TEXT PRIMARY KEY,
+                        user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                        term TEXT NOT NULL,
+                        reading TEXT,
+                        meaning TEXT,
+                        explanation TEXT,
+                        examples TEXT, 
+                        mastery INTEGER DEFAULT 1,
+                        added_at BIGINT
+                    );
+                """)
+            
+                # Create index on vocab user_id
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_vocab_user_id ON vocab(user_id);
+                """)
+            
+                # One row per term per user; upserts dedup against this
+                cur.execute("SELECT to_regclass('idx_vocab_user_term')")
+                if cur.fetchone()[0] is None:
+                    dedupe_vocab_terms(cur)
+                cur.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_vocab_user_term ON vocab(user_id, term);
+                """)
+
+                # Spaced-repetition state; new and migrated cards are due immediately
+                cur.execute("""
+                    ALTER TABLE vocab ADD COLUMN IF NOT EXISTS due_at BIGINT NOT NULL DEFAULT 0;
+                    ALTER TABLE vocab ADD COLUMN IF NOT EXISTS interval_days REAL NOT NULL DEFAULT 0;
+                    ALTER TABLE vocab ADD COLUMN IF NOT EXISTS ease REAL NOT NULL DEFAULT 2.5;
+                    ALTER TABLE vocab ADD COLUMN IF NOT EXISTS repetitions INTEGER NOT NULL DEFAULT 0;
+                    ALTER TABLE vocab ADD COLUMN IF NOT EXISTS lapses INTEGER NOT NULL DEFAULT 0;
+                    ALTER TABLE vocab ADD COLUMN IF NOT EXISTS last_reviewed_at BIGINT;
+                """)
+            
+                # Due-card queue: the next batch is one range scan
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_vocab_user_due ON vocab(user_id, due_at, id);
+                """)
+            
+                # Append-only review history
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS reviews (
+                        id BIGSERIAL PRIMARY KEY,
+                        user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                        vocab_id TEXT NOT NULL REFERENCES vocab(id) ON DELETE CASCADE,
+                        grade SMALLINT NOT NULL,
+                        reviewed_at BIGINT NOT NULL,
+                        interval_days REAL NOT NULL
+                    );
+                """)
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_reviews_user_reviewed ON reviews(user_id, reviewed_at);
+                    CREATE INDEX IF NOT EXISTS idx_reviews_vocab ON reviews(vocab_id);
+                """)
+            
+                # Create Sessions Table with user_id
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS sessions (
+                        id TEXT PRIMARY KEY,
+                        user_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                        title TEXT,
+                        messages JSONB DEFAULT '[]'::jsonb,
+                        created_at BIGINT,
+                        updated_at BIGINT
+                    );
+                """)
+            
+                # Create index on sessions user_id
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
+                """)
+            
+                # Keyset pagination index for the session list
+                cur.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_sessions_user_updated ON sessions(user_id, updated_at DESC, id DESC);
+                """)
+            
+                # Track the number of stored messages so appends can assign positions
+                cur.execute("""
+                    ALTER TABLE sessions ADD COLUMN IF NOT EXISTS message_count INTEGER DEFAULT 0;
+                """)
+            
+                # Rolling summary of turns older than the tutor's verbatim window
+                cur.execute("""
+                    ALTER TABLE sessions ADD COLUMN IF NOT EXISTS summary TEXT;
+                    ALTER TABLE sessions ADD COLUMN IF NOT EXISTS summary_through INTEGER NOT NULL DEFAULT -1;
+                """)
+            
+                # Bumped whenever the stored messages (and summary) are replaced wholesale
+                cur.execute("""
+                    ALTER TABLE sessions ADD COLUMN IF NOT EXISTS history_version INTEGER NOT NULL DEFAULT 0;
+                """)
+            
+                # Create Messages Table (one row per turn, append-only)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS messages (
+                        session_id TEXT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+                        position INTEGER NOT NULL,
+                        role TEXT,
+                        data JSONB NOT NULL,
+                        created_at BIGINT,
+                        PRIMARY KEY (session_id, position)
+                    );
+                """)
+            
+                migrate_session_messages(cur)
+            
+                init_sync_tracking(cur)
+            
+                init_search(cur)
             
         print("✅ Database tables initialized")
         return True
     except Exception as e:
         print(f"❌ Database initialization failed: {e}")
         return False
-    finally:
-        if conn:
-            release_db_connection(conn)
+
+def init_sync_tracking(cur):
+    """Server-clock change times and delete tombstones for /api/sync.
+
+    Triggers keep them current, so every write path (upserts, review
+    grades, message appends) is picked up without touching its SQL.
+    """
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION touch_changed_at() RETURNS trigger AS $$
+        BEGIN
+            -- Take a transaction id before the stamp, so sync's commit horizon sees this writer
+            PERFORM txid_current();
+            NEW.changed_at := (extract(epoch FROM clock_timestamp()) * 1000)::bigint;
+            RETURN NEW;
+        END $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION record_tombstone() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO tombstones (user_id, kind, item_id, deleted_at)
+            VALUES (OLD.user_id, TG_ARGV[0], OLD.id, (extract(epoch FROM clock_timestamp()) * 1000)::bigint);
+            RETURN OLD;
+        END $$ LANGUAGE plpgsql;
+    """)
+    # No foreign key: deleting a user cascades into these triggers
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS tombstones (
+            user_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            deleted_at BIGINT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_tombstones_user_deleted ON tombstones(user_id, deleted_at);
+    """)
+    for table, columns in (("user_settings", ""), ("vocab", ""), ("sessions", " OF title, updated_at, message_count")):
+        cur.execute(f"""
+            ALTER TABLE {table} ADD COLUMN IF NOT EXISTS changed_at BIGINT NOT NULL DEFAULT 0;
+            DROP TRIGGER IF EXISTS {table}_touch ON {table};
+            CREATE TRIGGER {table}_touch BEFORE INSERT OR UPDATE{columns} ON {table}
+                FOR EACH ROW EXECUTE FUNCTION touch_changed_at();
+        """)
+    for table in ("vocab", "sessions"):
+        cur.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_{table}_user_changed ON {table}(user_id, changed_at);
+            DROP TRIGGER IF EXISTS {table}_tombstone ON {table};
+            CREATE TRIGGER {table}_tombstone AFTER DELETE ON {table}
+                FOR EACH ROW EXECUTE FUNCTION record_tombstone('{table}');
+        """)
+
+def init_search(cur):
+    """Text expressions for /api/search, plus trigram GIN indexes over them when pg_trgm is available.
+
+    Without pg_trgm search still works, as unindexed ILIKE scans of the
+    user's own rows.
+    """
+    global trigram_search
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION vocab_search_text(term TEXT, reading TEXT, meaning TEXT) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT term || ' ' || COALESCE(reading, '') || ' ' || COALESCE(meaning, '')
+        $$;
+
+        CREATE OR REPLACE FUNCTION message_search_text(data JSONB) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT CASE jsonb_typeof(data->'content')
+                WHEN 'string' THEN data->>'content'
+                WHEN 'object' THEN COALESCE((
+                    SELECT string_agg(segment->>'text', '' ORDER BY n)
+                    FROM jsonb_array_elements(
+                        CASE jsonb_typeof(data->'content'->'segments') WHEN 'array' THEN data->'content'->'segments' ELSE '[]'::jsonb END
+                    ) WITH ORDINALITY AS s(segment, n)
+                ), '') || ' ' || COALESCE(data->'content'->>'english', data->'content'->>'text', '')
+                ELSE ''
+            END
+        $$;
+    """)
+
+    cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+    if cur.fetchone() is None:
+        cur.execute("SAVEPOINT enable_trgm")
+        try:
+            cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cur.execute("RELEASE SAVEPOINT enable_trgm")
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT enable_trgm")
+            print(f"⚠️  pg_trgm unavailable, search will scan without indexes: {str(e).splitlines()[0]}")
+            trigram_search = False
+            return
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_vocab_search ON vocab
+            USING gin (vocab_search_text(term, reading, meaning) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS idx_messages_search ON messages
+            USING gin (message_search_text(data) gin_trgm_ops);
+    """)
+    trigram_search = True
+
+def dedupe_vocab_terms(cur):
+    """Drop duplicate (user_id, term) rows, keeping the most recently added one."""
+    cur.execute("""
+        DELETE FROM vocab v
+        USING vocab newer
+        WHERE v.user_id = newer.user_id
+          AND v.term = newer.term
+          AND (COALESCE(v.added_at, 0), v.id) < (COALESCE(newer.added_at, 0), newer.id);
+    """)
+    if cur.rowcount:
+        print(f"✅ Removed {cur.rowcount} duplicate vocab entries")
+
+def migrate_session_messages(cur):
+    """Split legacy sessions.messages JSONB blobs into rows of the messages table.
+
+    Safe to re-run: rows that already exist are skipped and a blob is only
+    cleared once its messages have been copied.
+    """
+    cur.execute("""
+        INSERT INTO messages (session_id, position, role, data, created_at)
+        SELECT s.id, m.ord - 1, m.elem->>'role', m.elem, s.updated_at
+        FROM sessions s, jsonb_array_elements(s.messages) WITH ORDINALITY AS m(elem, ord)
+        WHERE jsonb_typeof(s.messages) = 'array' AND jsonb_array_length(s.messages) > 0
+        ON CONFLICT (session_id, position) DO NOTHING;
+    """)
+    migrated = cur.rowcount
+    
+    cur.execute("""
+        UPDATE sessions
+        SET message_count = jsonb_array_length(messages), messages = '[]'::jsonb
+        WHERE jsonb_typeof(messages) = 'array' AND jsonb_array_length(messages) > 0;
+    """)
+    
+    if migrated:
+        print(f"✅ Migrated {migrated} messages out of session blobs")
 
 # Initialize pool on module load
 init_pool()
@@ -0,0 +1,251 @@
+"""JMdict lookups from a prebuilt, memory-mapped index.
+
+Build the index once from the EDRDG release (the "_examp" file includes
+example sentences):
+
+    python -m dictionary build JMdict_e_examp.gz data/jmdict.idx
+
+Index layout (little-endian):
+    header       magic, key count, entry count
+    key table    key count x (key offset, key length, postings offset, postings count)
+    entry table  entry count x (entry offset, entry length)
+    data         UTF-8 keys, u32 posting lists, compact JSON entries
+
+Keys are every kanji and kana spelling (kana also folded to hiragana),
+sorted by their UTF-8 bytes, so an exact match is a binary search and a
+prefix search is the run of keys that follows it. Nothing is parsed up
+front; pages are read from the mapped file as lookups touch them.
+"""
+import os
+import re
+import sys
+import gzip
+import json
+import mmap
+import struct
+from functools import lru_cache
+from xml.etree.ElementTree import XMLPullParser
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DICTIONARY_PATH = os.getenv("DICTIONARY_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "jmdict.idx"))
+# Decoded entries kept in memory
+DICTIONARY_CACHE_SIZE = int(os.getenv("DICTIONARY_CACHE_SIZE", "20000"))
+
+MAGIC = b"JMD1"
+HEADER = struct.Struct("<4sII")
+KEY = struct.Struct("<IIII")
+ENTRY = struct.Struct("<II")
+POSTING = struct.Struct("<I")
+
+# ke_pri/re_pri tags that mark an entry as common
+COMMON_TAGS = {"news1", "ichi1", "spec1", "spec2", "gai1"}
+MAX_EXAMPLES = 3
+
+XML_ENTITIES = {"amp", "lt", "gt", "quot", "apos"}
+
+# Segment function -> JMdict part-of-speech codes (by prefix) that agree with it
+POS_PREFIXES = {
+    "noun": ("n", "pn", "num"),
+    "verb": ("v",),
+    "adjective": ("adj",),
+    "adverb": ("adv",),
+}
+# Entries considered when a part of speech has to agree
+GLOSS_CANDIDATES = 5
+
+def to_hiragana(text):
+    return ''.join(chr(ord(ch) - 0x60) if 'ァ' <= ch <= 'ヶ' else ch for ch in text)
+
+def normalize(term):
+    return to_hiragana(term.strip())
+
+class Dictionary:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.key_count, self.entry_count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a dictionary index")
+        self._keys_at = HEADER.size
+        self._entries_at = self._keys_at + self.key_count * KEY.size
+        self.entry = lru_cache(maxsize=DICTIONARY_CACHE_SIZE)(self._entry)
+
+    def _key(self, index):
+        offset, length, postings, count = KEY.unpack_from(self._map, self._keys_at + index * KEY.size)
+        return self._map[offset:offset + length], postings, count
+
+    def _lower_bound(self, key):
+        low, high = 0, self.key_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _postings(self, offset, count):
+        return [POSTING.unpack_from(self._map, offset + i * POSTING.size)[0] for i in range(count)]
+
+    def _entry(self, entry_id):
+        offset, length = ENTRY.unpack_from(self._map, self._entries_at + entry_id * ENTRY.size)
+        return json.loads(self._map[offset:offset + length])
+
+    def entry_ids(self, term, prefix=False, limit=10):
+        """Entry ids for `term` (or for every key starting with it), common entries first."""
+        key = normalize(term).encode('utf-8')
+        if not key:
+            return []
+        ids = []
+        index = self._lower_bound(key)
+        while index < self.key_count and len(ids) < limit:
+            found, postings, count = self._key(index)
+            if found != key and not (prefix and found.startswith(key)):
+                break
+            for entry_id in self._postings(postings, count):
+                if entry_id not in ids:
+                    ids.append(entry_id)
+            index += 1
+        # Exact matches come first; within a key, entry ids are already common-first
+        return ids[:limit]
+
+    def lookup(self, term, prefix=False, limit=10):
+        return [self.entry(entry_id) for entry_id in self.entry_ids(term, prefix, limit)]
+
+    def gloss(self, term, function=None, max_glosses=3):
+        """Short meaning for `term` from its most common entry's first sense, or ''.
+
+        With a segment `function` ("noun", "verb", ...) the first sense whose
+        part of speech agrees with it is used instead, across the few most
+        common entries, and '' if none does.
+        """
+        prefixes = POS_PREFIXES.get(function) if function else None
+        if function and not prefixes:
+            return ''
+        for entry_id in self.entry_ids(term, limit=GLOSS_CANDIDATES if prefixes else 1):
+            pos = []
+            for sense in self.entry(entry_id).get('senses') or []:
+                pos = sense.get('pos') or pos  # JMdict lists pos only where it changes
+                if prefixes is None or any(code.startswith(prefixes) for code in pos):
+                    return '; '.join(sense.get('glosses', [])[:max_glosses])
+        return ''
+
+    def stats(self):
+        info = self.entry.cache_info()
+        return {"keys": self.key_count, "entries": self.entry_count, "cached": info.currsize, "hits": info.hits, "misses": info.misses}
+
+def load_dictionary(path=DICTIONARY_PATH):
+    if not os.path.exists(path):
+        print(f"⚠️  WARNING: No dictionary index at {path}; dictionary lookups are disabled.")
+        return None
+    try:
+        return Dictionary(path)
+    except Exception as e:
+        print(f"⚠️  WARNING: Could not load dictionary index {path}: {e}")
+        return None
+
+dictionary = load_dictionary()
+
+def gloss(term, function=None):
+    """Dictionary meaning for `term`, or '' when there is none (or no dictionary)."""
+    return dictionary.gloss(term, function) if dictionary and term else ''
+
+# ==================== BUILD ====================
+
+def _texts(element, tag):
+    return [child.text for child in element.findall(tag) if child.text]
+
+def parse_entry(element):
+    kanji = [k.findtext('keb') for k in element.findall('k_ele')]
+    readings = [r.findtext('reb') for r in element.findall('r_ele')]
+    priorities = {p.text for p in element.iter() if p.tag in ('ke_pri', 're_pri')}
+    senses, examples = [], []
+    for sense in element.findall('sense'):
+        senses.append({
+            "pos": _texts(sense, 'pos'),
+            "glosses": _texts(sense, 'gloss'),
+            "misc": _texts(sense, 'misc')
+        })
+        for example in sense.findall('example'):
+            sentences = {s.get('{http://www.w3.org/XML/1998/namespace}lang'): s.text for s in example.findall('ex_sent')}
+            if sentences.get('jpn') and len(examples) < MAX_EXAMPLES:
+                examples.append({"japanese": sentences['jpn'], "english": sentences.get('eng', '')})
+    entry = {
+        "id": int(element.findtext('ent_seq')),
+        "kanji": [k for k in kanji if k],
+        "readings": [r for r in readings if r],
+        "common": bool(priorities & COMMON_TAGS),
+        "senses": senses
+    }
+    if examples:
+        entry["examples"] = examples
+    return entry
+
+def iter_jmdict(path):
+    """Entries from a JMdict XML file (optionally gzipped).
+
+    Entity references such as &n; are kept as their names ("n", "v1")
+    rather than expanded into long descriptions, and the DTD is skipped.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    parser = XMLPullParser(events=('end',))
+    entity = re.compile(r'&([\w-]+);')
+    in_dtd = False
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('<!DOCTYPE'):
+                in_dtd = True
+            if in_dtd:
+                in_dtd = not line.startswith(']>')
+                continue
+            parser.feed(entity.sub(lambda m: m.group(0) if m.group(1) in XML_ENTITIES else m.group(1), line))
+            for _, element in parser.read_events():
+                if element.tag == 'entry':
+                    yield parse_entry(element)
+                    element.clear()
+
+def build_index(source, target):
+    entries = sorted(iter_jmdict(source), key=lambda e: (not e['common'], e['id']))
+    postings = {}
+    for entry_id, entry in enumerate(entries):
+        for spelling in entry['kanji'] + entry['readings']:
+            for key in {spelling, normalize(spelling)}:
+                ids = postings.setdefault(key.encode('utf-8'), [])
+                if not ids or ids[-1] != entry_id:
+                    ids.append(entry_id)
+    keys = sorted(postings)
+
+    data_at = HEADER.size + len(keys) * KEY.size + len(entries) * ENTRY.size
+    data = bytearray()
+    key_table = bytearray()
+    for key in keys:
+        key_at = data_at + len(data)
+        data += key
+        postings_at = data_at + len(data)
+        data += b''.join(POSTING.pack(entry_id) for entry_id in postings[key])
+        key_table += KEY.pack(key_at, len(key), postings_at, len(postings[key]))
+    entry_table = bytearray()
+    for entry in entries:
+        blob = json.dumps(entry, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        entry_table += ENTRY.pack(data_at + len(data), len(blob))
+        data += blob
+
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    partial = target + '.tmp'
+    with open(partial, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(keys), len(entries)))
+        f.write(key_table)
+        f.write(entry_table)
+        f.write(data)
+    os.replace(partial, target)
+    return len(keys), len(entries)
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (3, 4) or sys.argv[1] != 'build':
+        sys.exit("usage: python -m dictionary build JMdict_e_examp.gz [data/jmdict.idx]")
+    target = sys.argv[3] if len(sys.argv) == 4 else DICTIONARY_PATH
+    key_count, entry_count = build_index(sys.argv[2], target)
+    print(f"✅ Dictionary index written to {target}: {entry_count} entries, {key_count} keys")
@@ -0,0 +1,141 @@
+"""Request and response logic shared by the Flask routes (app.py) and the async routes (asgi.py).
+
+Both entry points serve chat, transcription and TTS. Only the I/O differs,
+so argument parsing, NDJSON event lines and cached-clip responses live
+here and each side wraps the results in its own framework's responses.
+"""
+import os
+import json
+from dotenv import load_dotenv
+from history import build_tutor_context
+from tts import ReplyAudio, VALID_VOICES, DEFAULT_VOICE
+
+load_dotenv()
+
+WHISPER_URL = os.getenv("WHISPER_URL", "http://whisper:9000")
+
+# Synthesized audio never changes for a given ETag, so clients may keep it
+TTS_MAX_AGE = 60 * 60 * 24
+
+NDJSON_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+# ==================== CHAT ====================
+
+def tutor_arguments(user_id, data):
+    """Keyword arguments for the tutor reply functions from a chat request body.
+
+    Loads the vocab context and session history, so it blocks on the database.
+    """
+    message = data.get('message', '')
+    vocab_context, history = build_tutor_context(user_id, data.get('sessionId'), message, data.get('vocabContext', ''))
+    return {
+        "user_message": message,
+        "level_context": data.get('levelContext', ''),
+        "vocab_context": vocab_context,
+        "use_cache": data.get('cache', True) is not False,
+        "user_id": user_id,
+        "history": history
+    }
+
+def tts_voice(voice):
+    return voice if voice in VALID_VOICES else DEFAULT_VOICE
+
+def chat_reply(response, user_id, data):
+    """The /api/chat body: the reply plus its audio handle, whose sentences start synthesizing now."""
+    audio = ReplyAudio(user_id, tts_voice(data.get('voice'))).finish(response.get('segments'))
+    return {**response, "audio": audio}
+
+class ChatStreamLines:
+    """Turns the tutor stream's (event, payload) pairs into NDJSON lines.
+
+    Lines: {"type": "segment", "segment": {...}} for each segment as soon as
+    its sentence is complete, then {"type": "done", "segments": [...],
+    "english": ..., "grammar_point": ..., "audio": ...} or {"type": "error",
+    "error": ...}. Each sentence is queued for pre-synthesis as it streams.
+    """
+
+    def __init__(self, user_id, data):
+        self.audio = ReplyAudio(user_id, tts_voice(data.get('voice')))
+
+    def line(self, event, payload):
+        if event == 'segment':
+            self.audio.add(payload)
+            line = {"type": "segment", "segment": payload}
+        else:
+            line = {
+                "type": "done",
+                "segments": payload.get('segments'),
+                "english": payload.get('english'),
+                "grammar_point": payload.get('grammar_point'),
+                "audio": self.audio.finish(payload.get('segments'))
+            }
+        return json.dumps(line, ensure_ascii=False) + "\n"
+
+    @staticmethod
+    def error(e):
+        print(f"AI Stream Error: {e}")
+        return json.dumps({"type": "error", "error": str(e)}) + "\n"
+
+# ==================== TRANSCRIPTION ====================
+
+def whisper_request(filename, audio, content_type):
+    """Arguments for the Whisper /asr POST; `audio` is bytes or a file object."""
+    return {
+        "url": f"{WHISPER_URL}/asr",
+        "files": {"audio_file": (filename, audio, content_type)},
+        "params": {"language": "ja", "output": "json"}
+    }
+
+def transcription_result(ok, read_json):
+    """(JSON body, status) for a finished Whisper call."""
+    if not ok:
+        return {"error": "Transcription failed"}, 500
+    return {"text": read_json().get("text", "")}, 200
+
+# ==================== TTS ====================
+
+def clip_headers(key):
+    return {
+        'Content-Disposition': 'inline',
+        'ETag': f'"{key}"',
+        'Cache-Control': f'private, max-age={TTS_MAX_AGE}',
+        'Accept-Ranges': 'bytes'
+    }
+
+def _etag_matches(header, key):
+    candidates = [tag.strip() for tag in (header or '').split(',')]
+    return '*' in candidates or f'"{key}"' in candidates or f'W/"{key}"' in candidates
+
+def _byte_range(header, size):
+    """(start, end) inclusive for a single "bytes=" range, None to ignore it, or False if unsatisfiable."""
+    unit, _, spec = (header or '').partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        return None  # Multiple ranges aren't worth it for short clips; send it all
+    first, _, last = spec.strip().partition('-')
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                return False
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+def cached_clip(audio, key, headers):
+    """(status, headers, body) for a cached clip, honouring If-None-Match, Range and If-Range."""
+    response_headers = clip_headers(key)
+    if _etag_matches(headers.get('If-None-Match'), key):
+        return 304, response_headers, b''
+    if headers.get('Range') and headers.get('If-Range', f'"{key}"') == f'"{key}"':
+        span = _byte_range(headers.get('Range'), len(audio))
+        if span is False:
+            return 416, {**response_headers, 'Content-Range': f'bytes */{len(audio)}'}, b''
+        if span:
+            start, end = span
+            return 206, {**response_headers, 'Content-Range': f'bytes {start}-{end}/{len(audio)}'}, audio[start:end + 1]
+    return 200, response_headers, audio
@@ -0,0 +1,193 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import RealDictCursor
+from dotenv import load_dotenv
+from database import db_connection, is_db_available
+from vocab_context import build_vocab_context
+import ai
+import upstream
+
+load_dotenv()
+
+# Estimated tokens for vocab context + conversation history in one prompt
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1200"))
+# Most recent turns (learner message + tutor reply) kept word for word
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "3"))
+# Older messages that must pile up before the summary is refreshed
+HISTORY_SUMMARY_BATCH = int(os.getenv("HISTORY_SUMMARY_BATCH", "4"))
+HISTORY_SUMMARY_WORKERS = int(os.getenv("HISTORY_SUMMARY_WORKERS", "2"))
+# Vocab may use at most this share of the budget; history gets the rest
+VOCAB_BUDGET_SHARE = 0.4
+MESSAGE_MAX_TOKENS = 150
+SUMMARY_MAX_TOKENS = 200
+# Messages folded into the summary per refresh
+SUMMARY_MAX_MESSAGES = 40
+
+def estimate_tokens(text):
+    """Rough token count: about one per CJK character, four characters per token otherwise."""
+    wide = sum(1 for ch in text if ord(ch) >= 0x3000)
+    return wide + (len(text) - wide + 3) // 4
+
+def clip(text, max_tokens):
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    return text[:max(1, len(text) * max_tokens // tokens)] + "…"
+
+def message_text(message):
+    content = message.get('content')
+    if isinstance(content, dict):
+        segments = content.get('segments')
+        if segments:
+            text = ''.join(str(s.get('text', '')) for s in segments if isinstance(s, dict))
+            english = content.get('english')
+            return f"{text} ({english})" if english else text
+        return str(content.get('text', ''))
+    return str(content or '')
+
+def format_message(message):
+    speaker = "Tutor" if message.get('role') == 'assistant' else "Learner"
+    return f"{speaker}: {clip(message_text(message), MESSAGE_MAX_TOKENS)}"
+
+def trim_vocab(vocab_context, max_tokens):
+    """Keep the leading (most relevant) terms that fit."""
+    if estimate_tokens(vocab_context) <= max_tokens:
+        return vocab_context
+    kept, used = [], 0
+    for term in vocab_context.split(', '):
+        cost = estimate_tokens(term) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(term)
+        used += cost
+    return ', '.join(kept)
+
+def load_history(user_id, session_id, limit):
+    """(summary, summary_through, message_count, newest `limit` unsummarized messages oldest first), or None."""
+    with db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """SELECT summary, summary_through, message_count
+                   FROM sessions WHERE id = %s AND user_id = %s""",
+                (session_id, user_id)
+            )
+            session = cur.fetchone()
+            if not session:
+                return None
+            cur.execute(
+                """SELECT data FROM messages
+                   WHERE session_id = %s AND position > %s
+                   ORDER BY position DESC LIMIT %s""",
+                (session_id, session['summary_through'], limit)
+            )
+            rows = cur.fetchall()
+    messages = [r['data'] for r in reversed(rows) if not r['data'].get('isError')]
+    return session['summary'], session['summary_through'], session['message_count'] or 0, messages
+
+class SummaryRefresher:
+    """Folds turns that aged out of the verbatim window into the session summary, off the request path."""
+
+    def __init__(self, workers):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summary")
+        self._lock = threading.Lock()
+        self._pending = set()
+
+    def schedule(self, user_id, session_id):
+        with self._lock:
+            if session_id in self._pending:
+                return
+            self._pending.add(session_id)
+        self._executor.submit(self._run, user_id, session_id)
+
+    def _run(self, user_id, session_id):
+        try:
+            refresh_summary(user_id, session_id)
+        except upstream.Overloaded:
+            pass  # Try again on a later turn
+        except Exception as e:
+            print(f"Summary refresh error: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(session_id)
+
+summary_refresher = SummaryRefresher(HISTORY_SUMMARY_WORKERS)
+
+def refresh_summary(user_id, session_id):
+    with db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """SELECT summary, summary_through, message_count, history_version
+                   FROM sessions WHERE id = %s AND user_id = %s""",
+                (session_id, user_id)
+            )
+            session = cur.fetchone()
+            if not session:
+                return
+            # Everything before the verbatim window is fair game
+            last = (session['message_count'] or 0) - 2 * HISTORY_RECENT_TURNS - 1
+            cur.execute(
+                """SELECT position, data FROM messages
+                   WHERE session_id = %s AND position > %s AND position <= %s
+                   ORDER BY position LIMIT %s""",
+                (session_id, session['summary_through'], last, SUMMARY_MAX_MESSAGES)
+            )
+            rows = cur.fetchall()
+    if not rows:
+        return
+
+    # The Gemini call happens without a connection checked out
+    transcript = '\n'.join(format_message(r['data']) for r in rows if not r['data'].get('isError'))
+    summary = clip(ai.summarize_conversation(session['summary'], transcript, user_id), SUMMARY_MAX_TOKENS)
+
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            # Skipped if another refresh won the race or the messages were
+            # replaced, which can leave summary_through where it was
+            cur.execute(
+                """UPDATE sessions SET summary = %s, summary_through = %s
+                   WHERE id = %s AND summary_through = %s AND history_version = %s""",
+                (summary, rows[-1]['position'], session_id, session['summary_through'], session['history_version'])
+            )
+
+def build_tutor_context(user_id, session_id, message, fallback_vocab=''):
+    """(vocab context, conversation history) for a tutor prompt, together within HISTORY_TOKEN_BUDGET.
+
+    History is the session's rolling summary plus as many of the newest
+    unsummarized messages as fit, newest kept first. Turns older than the
+    last HISTORY_RECENT_TURNS are summarized in the background once enough
+    of them accumulate.
+    """
+    vocab_context = trim_vocab(
+        build_vocab_context(user_id, message, fallback_vocab),
+        int(HISTORY_TOKEN_BUDGET * VOCAB_BUDGET_SHARE)
+    )
+    if not session_id or not is_db_available():
+        return vocab_context, ''
+
+    loaded = load_history(user_id, session_id, 2 * HISTORY_RECENT_TURNS + HISTORY_SUMMARY_BATCH)
+    if loaded is None:
+        return vocab_context, ''
+    summary, summary_through, message_count, messages = loaded
+
+    remaining = HISTORY_TOKEN_BUDGET - estimate_tokens(vocab_context)
+    lines = []
+    summary_line = f"(Earlier: {summary})" if summary else None
+    if summary_line:
+        remaining -= estimate_tokens(summary_line)
+    for m in reversed(messages):
+        line = format_message(m)
+        cost = estimate_tokens(line)
+        if cost > remaining:
+            break
+        lines.append(line)
+        remaining -= cost
+    lines.reverse()
+    if summary_line:
+        lines.insert(0, summary_line)
+
+    aged_out = message_count - 2 * HISTORY_RECENT_TURNS - (summary_through + 1)
+    if aged_out >= HISTORY_SUMMARY_BATCH:
+        summary_refresher.schedule(user_id, session_id)
+
+    return vocab_context, '\n'.join(lines)
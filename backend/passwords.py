@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# bcrypt work factor for new hashes; existing hashes are upgraded on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Threads doing bcrypt work, and how many hashes may wait for one
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", "64"))
+HASH_TIMEOUT = float(os.getenv("HASH_TIMEOUT", "10"))
+
+# /api/auth/me lookups
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "300"))
+AUTH_CACHE_USERS = int(os.getenv("AUTH_CACHE_USERS", "10000"))
+
+class HashQueueFull(Exception):
+    """Too many password hashes already waiting; the caller should retry later."""
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+def _checkpw(password, password_hash):
+    return bcrypt.checkpw(password, password_hash)
+
+class HashPool:
+    """Runs bcrypt on a few worker threads so a login burst can't occupy every request thread.
+
+    bcrypt releases the GIL while it hashes, so threads run in parallel
+    without worker processes (which would re-import the app and its
+    startup code). At most `queue_size` hashes may be pending at once;
+    beyond that callers get HashQueueFull immediately instead of piling
+    up behind the workers.
+    """
+
+    def __init__(self, workers, queue_size, timeout):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    def run(self, fn, *args):
+        """Result of fn(*args) on a worker; raises TimeoutError after `timeout` seconds.
+
+        The slot is held until the worker finishes, not until the caller stops
+        waiting, so timed-out hashes still count against the queue.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise HashQueueFull("Too many sign-ins in progress, try again shortly")
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result(timeout=self.timeout)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+hash_pool = HashPool(HASH_WORKERS, HASH_QUEUE_SIZE, HASH_TIMEOUT)
+
+def hash_password(password):
+    return hash_pool.run(_hashpw, password.encode('utf-8'), BCRYPT_ROUNDS).decode('utf-8')
+
+def verify_password(password, password_hash):
+    return hash_pool.run(_checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+def hash_rounds(password_hash):
+    """Work factor stored in a "$2b$12$..." hash."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+def needs_rehash(password_hash):
+    return hash_rounds(password_hash) != BCRYPT_ROUNDS
+
+class UserLookupCache:
+    """id -> public user record for /api/auth/me, bounded LRU with a TTL."""
+
+    def __init__(self, max_users, ttl):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._users = OrderedDict()  # user_id -> (expires_at, user)
+
+    def get(self, user_id):
+        with self._lock:
+            cached = self._users.get(user_id)
+            if cached is None:
+                return None
+            if cached[0] < time.time():
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+            return dict(cached[1])
+
+    def put(self, user_id, user):
+        if self.max_users <= 0:
+            return
+        with self._lock:
+            self._users[user_id] = (time.time() + self.ttl, dict(user))
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+user_cache = UserLookupCache(AUTH_CACHE_USERS, AUTH_CACHE_TTL)
@@ -0,0 +1,155 @@
+import os
+import copy
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Set TUTOR_CACHE_SIZE=0 to disable the cache entirely
+TUTOR_CACHE_SIZE = int(os.getenv("TUTOR_CACHE_SIZE", "5000"))
+TUTOR_CACHE_TTL = int(os.getenv("TUTOR_CACHE_TTL", str(60 * 60 * 24)))
+# Similarity (0-1) above which a near-duplicate opener reuses a reply; 0 disables
+TUTOR_CACHE_FUZZY_THRESHOLD = float(os.getenv("TUTOR_CACHE_FUZZY_THRESHOLD", "0"))
+# Only short messages (greetings, "how do I say X") are worth fuzzy matching
+TUTOR_CACHE_FUZZY_MAX_CHARS = 64
+
+TRAILING_PUNCTUATION = "!?.,~。、…〜 "
+
+def normalize_message(message):
+    text = unicodedata.normalize('NFKC', message).lower()
+    text = ' '.join(text.split())
+    stripped = text.rstrip(TRAILING_PUNCTUATION)
+    # A question wants a different reply than the same words as a statement
+    if '?' in text[len(stripped):]:
+        stripped += '?'
+    return stripped
+
+def context_hash(user_id, level_context, vocab_context, history=''):
+    """Openers (no history) share entries across learners; later turns stay with their learner's conversation."""
+    if not history:
+        return hashlib.sha256(f"{level_context}\n{vocab_context}".encode('utf-8')).hexdigest()
+    return hashlib.sha256(f"{user_id}\n{level_context}\n{vocab_context}\n{history}".encode('utf-8')).hexdigest()
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def similarity(a, b):
+    """Jaccard similarity of two trigram sets."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+class ReplyCache:
+    """TTL + LRU cache of tutor replies keyed by (context, normalized message).
+
+    A conversation's first message is keyed by level and vocab context
+    only, so learners sending the same opener ("こんにちは") at the same level
+    share a reply, and with a fuzzy threshold set near-duplicate openers do
+    too. Later messages also key on the learner and the conversation so
+    far, since history shapes what the tutor says; those entries only
+    serve a retry or resend within that conversation.
+    """
+
+    def __init__(self, max_entries, ttl, fuzzy_threshold=0.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.fuzzy_threshold = fuzzy_threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (context, message) -> (expires_at, reply, trigrams)
+        self._by_context = {}  # opener context -> set of messages, for the fuzzy tier
+        self.stats = {"hits": 0, "fuzzy_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, user_id, message, level_context, vocab_context, history=''):
+        if not self.enabled:
+            return None
+        context = context_hash(user_id, level_context, vocab_context, history)
+        normalized = normalize_message(message)
+        now = time.time()
+
+        with self._lock:
+            entry = self._lookup(context, normalized, now)
+            if entry is not None:
+                self.stats["hits"] += 1
+                return copy.deepcopy(entry[1])
+
+            if not history and self.fuzzy_threshold > 0 and len(normalized) <= TUTOR_CACHE_FUZZY_MAX_CHARS:
+                entry = self._fuzzy_lookup(context, normalized, now)
+                if entry is not None:
+                    self.stats["fuzzy_hits"] += 1
+                    return copy.deepcopy(entry[1])
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, user_id, message, level_context, vocab_context, reply, history=''):
+        if not self.enabled:
+            return
+        context = context_hash(user_id, level_context, vocab_context, history)
+        normalized = normalize_message(message)
+        key = (context, normalized)
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._entries[key] = (time.time() + self.ttl, copy.deepcopy(reply), trigrams(normalized))
+            if not history:
+                self._by_context.setdefault(context, set()).add(normalized)
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._forget(old_key)
+                self.stats["evictions"] += 1
+
+    def _lookup(self, context, normalized, now):
+        # Caller holds the lock
+        key = (context, normalized)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < now:
+            del self._entries[key]
+            self._forget(key)
+            self.stats["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _fuzzy_lookup(self, context, normalized, now):
+        # Caller holds the lock
+        grams = trigrams(normalized)
+        best, best_score = None, self.fuzzy_threshold
+        for candidate in self._by_context.get(context, ()):
+            if len(candidate) > TUTOR_CACHE_FUZZY_MAX_CHARS:
+                continue
+            # A question never stands in for a statement, or vice versa
+            if candidate.endswith('?') != normalized.endswith('?'):
+                continue
+            score = similarity(grams, self._entries[(context, candidate)][2])
+            if score >= best_score:
+                best, best_score = candidate, score
+        if best is None:
+            return None
+        return self._lookup(context, best, now)
+
+    def _forget(self, key):
+        # Caller holds the lock
+        context, normalized = key
+        messages = self._by_context.get(context)
+        if messages is not None:
+            messages.discard(normalized)
+            if not messages:
+                del self._by_context[context]
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries)}
+
+reply_cache = ReplyCache(TUTOR_CACHE_SIZE, TUTOR_CACHE_TTL, TUTOR_CACHE_FUZZY_THRESHOLD)
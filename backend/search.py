@@ -0,0 +1,112 @@
+"""Ranked search over a user's vocab and conversation history.
+
+Both sides match with ILIKE against the same immutable text expressions
+the trigram GIN indexes in database.init_search are built on, so Postgres
+can answer from the index instead of scanning every message. Kana queries
+also match the other script (ねこ finds ネコ and vice versa).
+
+Queries shorter than a trigram give the index nothing to narrow on, so
+they match with strpos instead, which the index can't serve. The planner
+then starts from the user's own rows (vocab by user_id, sessions by
+user_id, then their messages by primary key).
+"""
+import database
+
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 100
+MAX_QUERY_LENGTH = 100
+SNIPPET_CONTEXT = 30
+# pg_trgm indexes three-character grams; shorter queries scan the user's rows
+MIN_INDEXED_QUERY_LENGTH = 3
+
+def to_hiragana(text):
+    return ''.join(chr(ord(ch) - 0x60) if 'ァ' <= ch <= 'ヶ' else ch for ch in text)
+
+def to_katakana(text):
+    return ''.join(chr(ord(ch) + 0x60) if 'ぁ' <= ch <= 'ゖ' else ch for ch in text)
+
+def query_variants(query):
+    """The query plus its hiragana and katakana spellings, deduplicated."""
+    return list(dict.fromkeys([query, to_hiragana(query), to_katakana(query)]))
+
+def like_pattern(text):
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+def _match_clause(expression, variants, params):
+    clauses = []
+    for i, variant in enumerate(variants):
+        if len(variant) >= MIN_INDEXED_QUERY_LENGTH:
+            params[f"p{i}"] = like_pattern(variant)
+            clauses.append(f"{expression} ILIKE %(p{i})s")
+        else:
+            params[f"p{i}"] = variant.lower()
+            clauses.append(f"strpos(lower({expression}), %(p{i})s) > 0")
+    return "(" + " OR ".join(clauses) + ")"
+
+def search_vocab(cur, user_id, query, limit, offset):
+    """Exact term/reading matches first, then prefix matches, then by trigram similarity and recency."""
+    variants = query_variants(query)
+    params = {"user_id": user_id, "query": query, "variants": variants, "limit": limit + 1, "offset": offset}
+    expression = "vocab_search_text(term, reading, meaning)"
+    rank = f"similarity({expression}, %(query)s)" if database.trigram_search else "0"
+    params["prefix"] = like_pattern(query)[1:]
+    cur.execute(
+        f"""SELECT id, term, reading, meaning, mastery, added_at, {rank} AS rank
+            FROM vocab
+            WHERE user_id = %(user_id)s AND {_match_clause(expression, variants, params)}
+            ORDER BY (term = ANY(%(variants)s) OR reading = ANY(%(variants)s)) DESC,
+                     (term ILIKE %(prefix)s) DESC,
+                     rank DESC, added_at DESC NULLS LAST, id
+            LIMIT %(limit)s OFFSET %(offset)s""",
+        params
+    )
+    rows = cur.fetchall()
+    items = [{
+        "id": r['id'],
+        "term": r['term'],
+        "reading": r['reading'],
+        "meaning": r['meaning'],
+        "mastery": r['mastery'],
+        "addedAt": r['added_at']
+    } for r in rows[:limit]]
+    return items, len(rows) > limit
+
+def snippet(text, variants):
+    """A window of text around the first match."""
+    folded = to_hiragana(text).lower()
+    for variant in variants:
+        index = folded.find(to_hiragana(variant).lower())
+        if index != -1:
+            start = max(0, index - SNIPPET_CONTEXT)
+            end = min(len(text), index + len(variant) + SNIPPET_CONTEXT)
+            return ("…" if start else "") + text[start:end] + ("…" if end < len(text) else "")
+    return text[:2 * SNIPPET_CONTEXT]
+
+def search_messages(cur, user_id, query, limit, offset):
+    """Messages whose text contains the query, best word match first, then newest."""
+    variants = query_variants(query)
+    params = {"user_id": user_id, "query": query, "limit": limit + 1, "offset": offset}
+    expression = "message_search_text(m.data)"
+    rank = f"word_similarity(%(query)s, {expression})" if database.trigram_search else "0"
+    cur.execute(
+        f"""SELECT m.session_id, s.title, m.position, m.role, m.created_at, {expression} AS text, {rank} AS rank
+            FROM messages m
+            JOIN sessions s ON s.id = m.session_id
+            WHERE s.user_id = %(user_id)s
+              AND m.data->>'isError' IS DISTINCT FROM 'true'
+              AND {_match_clause(expression, variants, params)}
+            ORDER BY rank DESC, m.created_at DESC NULLS LAST, m.session_id, m.position
+            LIMIT %(limit)s OFFSET %(offset)s""",
+        params
+    )
+    rows = cur.fetchall()
+    items = [{
+        "sessionId": r['session_id'],
+        "sessionTitle": r['title'],
+        "position": r['position'],
+        "role": r['role'],
+        "createdAt": r['created_at'],
+        "snippet": snippet(r['text'], variants)
+    } for r in rows[:limit]]
+    return items, len(rows) > limit
@@ -0,0 +1,66 @@
+"""Spaced-repetition scheduling (SM-2 with Anki-style four-button grades).
+
+A card's state lives on its vocab row: due_at (ms), interval_days, ease,
+repetitions and lapses. Grading never reads the rest of the user's deck.
+"""
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Cards returned by one GET /api/review/next
+REVIEW_BATCH_SIZE = int(os.getenv("REVIEW_BATCH_SIZE", "20"))
+# Grades accepted by one POST /api/review/grade
+MAX_REVIEW_GRADES = int(os.getenv("MAX_REVIEW_GRADES", "500"))
+
+AGAIN, HARD, GOOD, EASY = 1, 2, 3, 4
+GRADES = (AGAIN, HARD, GOOD, EASY)
+
+DAY_MS = 24 * 60 * 60 * 1000
+# A forgotten card comes back within the same sitting
+RELEARN_MS = 10 * 60 * 1000
+
+START_EASE = 2.5
+MIN_EASE = 1.3
+EASY_BONUS = 1.3
+HARD_FACTOR = 1.2
+MAX_INTERVAL_DAYS = 365 * 5
+
+def mastery_for(repetitions):
+    """The 1-5 mastery the tutor's vocab ranking uses, from consecutive successful reviews."""
+    return min(5, 1 + repetitions)
+
+def schedule(card, grade, now):
+    """New state for `card` (interval_days, ease, repetitions, lapses) after `grade` at `now` (ms)."""
+    interval = card.get('interval_days') or 0.0
+    ease = card.get('ease') or START_EASE
+    repetitions = card.get('repetitions') or 0
+    lapses = card.get('lapses') or 0
+
+    if grade == AGAIN:
+        ease = max(MIN_EASE, ease - 0.2)
+        state = {"interval_days": 0.0, "repetitions": 0, "lapses": lapses + 1}
+        due_at = now + RELEARN_MS
+    else:
+        if grade == HARD:
+            ease = max(MIN_EASE, ease - 0.15)
+            interval = max(1.0, interval * HARD_FACTOR)
+        elif repetitions == 0:
+            interval = 1.0 if grade == GOOD else 4.0
+        elif repetitions == 1:
+            interval = 6.0 if grade == GOOD else 6.0 * EASY_BONUS
+        else:
+            interval = interval * ease * (EASY_BONUS if grade == EASY else 1.0)
+        if grade == EASY:
+            ease += 0.15
+        interval = min(interval, MAX_INTERVAL_DAYS)
+        state = {"interval_days": interval, "repetitions": repetitions + 1, "lapses": lapses}
+        due_at = now + int(interval * DAY_MS)
+
+    state.update({
+        "ease": round(ease, 2),
+        "due_at": due_at,
+        "mastery": mastery_for(state["repetitions"]),
+        "last_reviewed_at": now
+    })
+    return state
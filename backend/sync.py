@@ -0,0 +1,133 @@
+"""Delta sync of settings, vocab and session metadata.
+
+The cursor is the newest server-side change time (ms) the client has
+seen. Rows carry a trigger-maintained changed_at and deletes leave
+tombstones, so a sync reads only what changed since the cursor through
+the (user_id, changed_at) indexes. Postgres renders the rows as JSON
+itself, and the payload is compressed for the wire.
+
+A row is stamped when it is written but only becomes visible when its
+transaction commits, so the cursor never passes the start of a writing
+transaction that is still open; its rows are read on the next sync.
+"""
+import os
+import gzip
+import hashlib
+import brotli
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Tombstones are kept this long; older cursors get a full snapshot
+SYNC_TOMBSTONE_TTL_MS = int(os.getenv("SYNC_TOMBSTONE_TTL_DAYS", "30")) * 24 * 60 * 60 * 1000
+# Bodies smaller than this aren't worth compressing
+SYNC_COMPRESS_MIN_BYTES = 1024
+
+VOCAB_JSON = """json_build_object(
+    'id', id, 'term', term, 'reading', reading, 'meaning', meaning, 'explanation', explanation,
+    'examples', COALESCE(examples, '[]')::json, 'mastery', mastery, 'addedAt', added_at, 'dueAt', due_at
+)"""
+
+SESSION_JSON = """json_build_object(
+    'id', id, 'title', title, 'createdAt', created_at, 'updatedAt', updated_at, 'messageCount', COALESCE(message_count, 0)
+)"""
+
+def _changed(cur, table, row_json, user_id, after):
+    cur.execute(
+        f"""SELECT COALESCE(json_agg({row_json} ORDER BY changed_at), '[]')::text, MAX(changed_at)
+            FROM {table} WHERE user_id = %s AND changed_at > %s""",
+        (user_id, after)
+    )
+    return cur.fetchone()
+
+def commit_horizon(cur):
+    """Start time (ms) of the oldest other transaction that has written and not yet finished.
+
+    Every row stamped before it is committed. With no such transaction,
+    the current time. Run before reading the changes, so that their
+    snapshot includes everything committed below the horizon.
+    """
+    cur.execute("""
+        SELECT (extract(epoch FROM LEAST(MIN(xact_start), clock_timestamp())) * 1000)::bigint
+        FROM pg_stat_activity
+        WHERE backend_xid IS NOT NULL AND datname = current_database() AND pid <> pg_backend_pid()
+    """)
+    return cur.fetchone()[0]
+
+def load_changes(cur, user_id, since, now):
+    """(JSON body bytes, cursor) with everything that changed after `since`.
+
+    `since` of None, or one older than the tombstone window, gets a full
+    snapshot with "reset": true; the client should replace its copy.
+    """
+    reset = since is None or since < now - SYNC_TOMBSTONE_TTL_MS
+    after = -1 if reset else since
+    cursor = 0 if reset else since
+    horizon = commit_horizon(cur)
+
+    cur.execute(
+        "SELECT COALESCE(settings, '{}'::jsonb)::text, changed_at FROM user_settings WHERE user_id = %s AND changed_at > %s",
+        (user_id, after)
+    )
+    row = cur.fetchone()
+    settings = row[0] if row else 'null'
+    if row:
+        cursor = max(cursor, row[1])
+
+    vocab, latest = _changed(cur, 'vocab', VOCAB_JSON, user_id, after)
+    cursor = max(cursor, latest or 0)
+    sessions, latest = _changed(cur, 'sessions', SESSION_JSON, user_id, after)
+    cursor = max(cursor, latest or 0)
+
+    deleted = {'vocab': '[]', 'sessions': '[]'}
+    if reset:
+        cur.execute("DELETE FROM tombstones WHERE user_id = %s AND deleted_at < %s", (user_id, now - SYNC_TOMBSTONE_TTL_MS))
+    else:
+        cur.execute(
+            """SELECT kind, json_agg(item_id ORDER BY deleted_at)::text, MAX(deleted_at)
+               FROM tombstones WHERE user_id = %s AND deleted_at > %s
+               GROUP BY kind""",
+            (user_id, after)
+        )
+        for kind, ids, latest in cur.fetchall():
+            deleted[kind] = ids
+            cursor = max(cursor, latest)
+
+    # Rows at or after the horizon may have in-flight neighbours; re-read them next time
+    cursor = min(cursor, horizon - 1)
+
+    body = (
+        f'{{"cursor":"{cursor}","reset":{"true" if reset else "false"},"settings":{settings},'
+        f'"vocab":{vocab},"sessions":{sessions},'
+        f'"deleted":{{"vocab":{deleted["vocab"]},"sessions":{deleted["sessions"]}}}}}'
+    )
+    return body.encode('utf-8'), cursor
+
+def etag(body):
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match, tag):
+    if not if_none_match:
+        return False
+    candidates = [t.strip() for t in if_none_match.split(',')]
+    return '*' in candidates or tag in candidates or f"W/{tag}" in candidates
+
+def accepted_encodings(accept_encoding):
+    encodings = set()
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0'):
+            continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+def compress(body, accept_encoding):
+    """(body, Content-Encoding or None): brotli if the client takes it, then gzip."""
+    if len(body) < SYNC_COMPRESS_MIN_BYTES:
+        return body, None
+    encodings = accepted_encodings(accept_encoding)
+    if 'br' in encodings:
+        return brotli.compress(body, quality=5), 'br'
+    if 'gzip' in encodings:
+        return gzip.compress(body, compresslevel=6), 'gzip'
+    return body, None
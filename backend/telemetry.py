@@ -0,0 +1,212 @@
+"""Prometheus-style metrics and per-request stage tracing.
+
+Each request gets a Trace (held in a context variable) with a request ID.
+Code on the request path wraps slow work in stage("name") or calls
+record("name", seconds); the time goes into a per-route histogram and
+into the request's JSON log line, so one slow turn can be broken down
+into pool wait, queries, upstream calls and serialization.
+"""
+import os
+import re
+import json
+import math
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# One JSON log line per request with its stage timings (set REQUEST_LOG=0 to silence)
+REQUEST_LOG = os.getenv("REQUEST_LOG", "1") != "0"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(list(zip(self.labelnames, key)))} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # label key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', _format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(pairs)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(pairs)} {series[-1]}")
+        return lines
+
+class Registry:
+    """Metrics plus collectors that report other modules' gauges and counters at scrape time."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """collect() returns [(name, documentation, "gauge" or "counter", [(labels dict, value), ...]), ...]."""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                collected = collect()
+            except Exception as e:
+                print(f"⚠️  Metrics collector failed: {e}")
+                continue
+            for name, documentation, kind, samples in collected:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(sorted((k, str(v)) for k, v in labels.items()))} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests handled.", ("method", "route", "status")
+))
+http_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Time from request start to the last byte of the response.", ("method", "route")
+))
+stage_duration = registry.register(Histogram(
+    "request_stage_duration_seconds", "Time spent in each stage of a request.", ("route", "stage")
+))
+
+# ==================== TRACING ====================
+
+class Trace:
+    __slots__ = ('request_id', 'method', 'route', 'started', 'stages', 'finished')
+
+    def __init__(self, request_id, method, route):
+        self.request_id = request_id
+        self.method = method
+        self.route = route
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.finished = False
+
+_current = contextvars.ContextVar('trace', default=None)
+
+def request_id_from(header_value):
+    """Reuse a well-formed incoming X-Request-ID, otherwise mint one."""
+    if header_value and REQUEST_ID_PATTERN.match(header_value):
+        return header_value
+    return uuid.uuid4().hex[:16]
+
+def start_trace(method, route, request_id=None):
+    trace = Trace(request_id or uuid.uuid4().hex[:16], method, route)
+    _current.set(trace)
+    return trace
+
+def current_trace():
+    return _current.get()
+
+def current_request_id():
+    trace = _current.get()
+    return trace.request_id if trace else None
+
+def record(stage_name, seconds):
+    """Attribute `seconds` of work to a stage of the current request."""
+    trace = _current.get()
+    stage_duration.observe(seconds, route=trace.route if trace else 'background', stage=stage_name)
+    if trace is not None:
+        trace.stages[stage_name] = trace.stages.get(stage_name, 0.0) + seconds
+
+@contextmanager
+def stage(stage_name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage_name, time.perf_counter() - started)
+
+def finish_trace(trace, status):
+    if trace is None or trace.finished:
+        return
+    trace.finished = True
+    elapsed = time.perf_counter() - trace.started
+    http_requests.inc(method=trace.method, route=trace.route, status=status)
+    http_duration.observe(elapsed, method=trace.method, route=trace.route)
+    if REQUEST_LOG:
+        print(json.dumps({
+            "request_id": trace.request_id,
+            "method": trace.method,
+            "route": trace.route,
+            "status": status,
+            "duration_ms": round(elapsed * 1000, 1),
+            "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in trace.stages.items()}
+        }), flush=True)
@@ -0,0 +1,38 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+import uuid
+import pytest
+
+
+@pytest.fixture
+def db():
+    """The database module on a pool opened against TEST_DB_DSN; skips the test without one."""
+    dsn = os.getenv("TEST_DB_DSN")
+    if not dsn:
+        pytest.skip("TEST_DB_DSN not set")
+    import database
+    if database.connection_pool is None:
+        database.DB_DSN = dsn
+        database.init_pool()
+        database.init_db()
+    return database
+
+
+@pytest.fixture
+def user_id(db):
+    """A throwaway user, deleted with everything it owns afterwards."""
+    user_id = str(uuid.uuid4())
+    with db.db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO users (id, email, password_hash, created_at) VALUES (%s, %s, 'x', %s)",
+                (user_id, f"{user_id}@test.invalid", int(time.time() * 1000))
+            )
+    yield user_id
+    with db.db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
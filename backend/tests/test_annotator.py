@@ -0,0 +1,47 @@
+import annotator
+
+
+def texts(sentence):
+    return [segment[0] for segment in annotator._segment(sentence)]
+
+
+def test_conjugations_attach_to_their_verb():
+    assert texts("食べられなかった") == ["食べられなかった"]
+    assert texts("本を読んでいます。") == ["本", "を", "読んでいます", "。"]
+
+
+def test_compound_nouns_merge():
+    assert texts("日本語を勉強する") == ["日本語", "を", "勉強", "する"]
+
+
+def test_particles_and_punctuation_stay_separate():
+    segments = annotator._segment("猫は、魚が好き。")
+    assert [segment[3] for segment in segments if segment[0] in ("は", "が")] == ["particle", "particle"]
+    assert [segment[1] for segment in segments if segment[3] == "punctuation"] == ["", ""]
+
+
+def test_merged_segment_keeps_head_lemma_and_reading():
+    text, reading, lemma, function, forms = annotator._segment("行きました")[0]
+    assert (text, reading, lemma, function) == ("行きました", "いきました", "行く", "verb")
+    assert "いく" in forms
+
+
+def test_kana_reading_needs_no_furigana():
+    assert annotator._segment("これ")[0][1] == "これ"
+
+
+def test_glosses_keyed_by_kana_dictionary_form():
+    # UniDic's lemma for する is 為る; the model writes the kana form
+    segments = annotator.annotate("勉強していました", glosses={"する": "to do"})
+    assert segments[1]["text"] == "していました"
+    assert segments[1]["meaning"] == "to do"
+
+
+def test_glosses_keyed_by_surface_then_lemma():
+    segments = annotator.annotate("食べた", glosses={"食べる": "to eat"}, notes={"食べた": "past tense"})
+    assert segments[0]["meaning"] == "to eat"
+    assert segments[0]["explanation"] == "past tense"
+
+
+def test_split_sentences():
+    assert annotator.split_sentences("はい。そうです！「本当？」まだ") == (["はい。", "そうです！", "「本当？」"], "まだ")
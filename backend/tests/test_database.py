@@ -0,0 +1,71 @@
+import select
+import pytest
+
+
+@pytest.fixture
+def pool(db):
+    """A private two-connection pool on the test database, closed afterwards."""
+    pool = db.ConnectionPool(1, 2, db.connection_pool.dsn, timeout=0.2)
+    yield pool
+    for conn, _ in pool._idle:
+        conn.close()
+
+
+def terminate(db, conn):
+    with db.db_connection() as admin:
+        with admin.cursor() as cur:
+            cur.execute("SELECT pg_terminate_backend(%s)", (conn.get_backend_pid(),))
+    select.select([conn], [], [], 1)  # Until the backend has gone
+
+
+def test_checkout_times_out_when_exhausted(db, pool):
+    held = [pool.getconn(), pool.getconn()]
+    timeouts = db.metrics.snapshot()["checkout_timeouts"]
+    with pytest.raises(db.PoolTimeout):
+        pool.getconn()
+    assert db.metrics.snapshot()["checkout_timeouts"] == timeouts + 1
+    for conn in held:
+        pool.putconn(conn)
+    assert pool.snapshot()["idle"] == 2
+
+
+def test_recently_used_dead_connection_is_replaced(db, pool):
+    conn = pool.getconn()
+    pool.putconn(conn)
+    terminate(db, conn)
+
+    replacement = pool.getconn()  # Idle far less than DB_HEALTHCHECK_IDLE
+    assert replacement is not conn
+    assert conn.closed
+    with replacement.cursor() as cur:
+        cur.execute("SELECT 1")
+        assert cur.fetchone() == (1,)
+    pool.putconn(replacement)
+    assert pool.snapshot()["size"] == 1
+
+
+def test_connection_dying_in_use_gets_idle_siblings_pinged(db, pool):
+    first, second = pool.getconn(), pool.getconn()
+    pool.putconn(second)
+    terminate(db, first)
+    with pytest.raises(db.psycopg2.OperationalError):
+        with first.cursor() as cur:
+            cur.execute("SELECT 1")
+    pool.putconn(first)  # Closed, so discarded
+    assert pool.snapshot() == {"size": 1, "idle": 1, "in_use": 0, "max": 2}
+
+    statements = db.metrics.snapshot()["statements"]
+    conn = pool.getconn()
+    assert conn is second
+    assert db.metrics.snapshot()["statements"] == statements + 1  # The health check
+    pool.putconn(conn)
+
+
+def test_pool_wait_and_hold_totals_are_exported(db):
+    import app
+    metrics = {name: (kind, samples) for name, _, kind, samples in app.collect_metrics()}
+    for name in ("db_pool_checkouts_total", "db_pool_wait_seconds_total", "db_pool_held_seconds_total"):
+        kind, samples = metrics[name]
+        assert kind == "counter"
+        assert samples[0][1] >= 0
+    assert metrics["db_pool_wait_seconds_max"][0] == "gauge"
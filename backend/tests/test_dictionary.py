@@ -0,0 +1,121 @@
+import pytest
+import annotator
+import dictionary
+
+JMDICT = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE JMdict [
+<!ENTITY n "noun (common) (futsuumeishi)">
+]>
+<JMdict>
+<entry>
+<ent_seq>1</ent_seq>
+<k_ele><keb>羽</keb><ke_pri>ichi1</ke_pri></k_ele>
+<r_ele><reb>は</reb><re_pri>ichi1</re_pri></r_ele>
+<sense><pos>&n;</pos><gloss>feather</gloss></sense>
+</entry>
+<entry>
+<ent_seq>2</ent_seq>
+<r_ele><reb>は</reb></r_ele>
+<sense><pos>&prt;</pos><gloss>topic marker particle</gloss></sense>
+</entry>
+<entry>
+<ent_seq>3</ent_seq>
+<k_ele><keb>猫</keb><ke_pri>ichi1</ke_pri></k_ele>
+<r_ele><reb>ねこ</reb><re_pri>ichi1</re_pri></r_ele>
+<sense><pos>&n;</pos><gloss>cat</gloss><gloss>feline</gloss></sense>
+<sense><gloss>shamisen</gloss></sense>
+</entry>
+<entry>
+<ent_seq>4</ent_seq>
+<k_ele><keb>食べる</keb><ke_pri>ichi1</ke_pri></k_ele>
+<r_ele><reb>たべる</reb><re_pri>ichi1</re_pri></r_ele>
+<sense><pos>&v1;</pos><pos>&vt;</pos><gloss>to eat</gloss></sense>
+</entry>
+<entry>
+<ent_seq>5</ent_seq>
+<r_ele><reb>ネコ</reb></r_ele>
+<sense><pos>&n;</pos><gloss>cat (katakana)</gloss></sense>
+</entry>
+<entry>
+<ent_seq>6</ent_seq>
+<k_ele><keb>猫舌</keb></k_ele>
+<r_ele><reb>ねこじた</reb></r_ele>
+<sense><pos>&n;</pos><gloss>aversion to hot food</gloss></sense>
+</entry>
+</JMdict>
+"""
+
+@pytest.fixture
+def index(tmp_path):
+    source = tmp_path / "JMdict_e"
+    source.write_text(JMDICT, encoding="utf-8")
+    target = str(tmp_path / "jmdict.idx")
+    key_count, entry_count = dictionary.build_index(str(source), target)
+    assert entry_count == 6
+    return dictionary.Dictionary(target)
+
+def ids(entries):
+    return [entry["id"] for entry in entries]
+
+def test_lookup_by_kanji_and_reading(index):
+    assert ids(index.lookup("猫")) == [3]
+    assert ids(index.lookup("ねこ")) == [3, 5]
+
+def test_katakana_is_folded_to_hiragana(index):
+    assert ids(index.lookup("ネコ")) == [3, 5]
+
+def test_common_entries_come_first(index):
+    assert ids(index.lookup("は")) == [1, 2]
+
+def test_prefix_lookup(index):
+    assert ids(index.lookup("猫", prefix=True)) == [3, 6]
+    assert ids(index.lookup("猫", prefix=True, limit=1)) == [3]
+
+def test_entities_are_kept_as_names(index):
+    entry = index.lookup("食べる")[0]
+    assert entry["senses"][0]["pos"] == ["v1", "vt"]
+    assert entry["common"] is True
+
+def test_missing_term(index):
+    assert index.lookup("犬") == []
+    assert index.gloss("犬") == ""
+
+def test_gloss(index):
+    assert index.gloss("猫") == "cat; feline"
+    assert index.gloss("ねこ", "noun") == "cat; feline"
+
+def test_gloss_requires_agreeing_part_of_speech(index):
+    assert index.gloss("食べる", "noun") == ""
+    assert index.gloss("食べる", "verb") == "to eat"
+    # Particles and other function words never take a dictionary meaning
+    assert index.gloss("は", "particle") == ""
+
+def test_gloss_inherits_part_of_speech_from_earlier_senses(index):
+    entry = index.lookup("猫")[0]
+    assert entry["senses"][1]["pos"] == []
+    assert index.gloss("猫", "noun") == "cat; feline"
+
+@pytest.fixture
+def loaded(index, monkeypatch):
+    monkeypatch.setattr(dictionary, "dictionary", index)
+    return index
+
+def meanings(segments):
+    return {segment["text"]: segment["meaning"] for segment in segments}
+
+def test_annotator_glosses_content_words_only(loaded):
+    found = meanings(annotator.annotate("猫は魚を食べます。"))
+    assert found["猫"] == "cat; feline"
+    assert found["食べます"] == "to eat"
+    assert found["は"] == ""
+    assert found["。"] == ""
+
+def test_annotator_prefers_the_models_gloss(loaded):
+    found = meanings(annotator.annotate("猫は魚を食べます。", glosses={"猫": "kitty", "は": "topic"}))
+    assert found["猫"] == "kitty"
+    assert found["は"] == "topic"
+
+def test_vocab_gloss_skips_function_words(loaded):
+    assert annotator.gloss("は") == ""
+    assert annotator.gloss("猫") == "cat; feline"
+    assert annotator.gloss("食べました") == "to eat"
@@ -0,0 +1,54 @@
+import endpoints
+
+KEY = "abc123"
+AUDIO = bytes(range(100))
+
+
+def test_plain_hit_sends_whole_clip():
+    status, headers, body = endpoints.cached_clip(AUDIO, KEY, {})
+    assert status == 200
+    assert body == AUDIO
+    assert headers["ETag"] == '"abc123"'
+    assert headers["Accept-Ranges"] == "bytes"
+
+
+def test_matching_etag_is_not_modified():
+    status, _, body = endpoints.cached_clip(AUDIO, KEY, {"If-None-Match": 'W/"other", "abc123"'})
+    assert status == 304
+    assert body == b""
+
+
+def test_range_is_partial_content():
+    status, headers, body = endpoints.cached_clip(AUDIO, KEY, {"Range": "bytes=10-19"})
+    assert status == 206
+    assert body == AUDIO[10:20]
+    assert headers["Content-Range"] == "bytes 10-19/100"
+
+
+def test_suffix_and_open_ended_ranges():
+    assert endpoints._byte_range("bytes=-10", 100) == (90, 99)
+    assert endpoints._byte_range("bytes=-500", 100) == (0, 99)
+    assert endpoints._byte_range("bytes=95-", 100) == (95, 99)
+    assert endpoints._byte_range("bytes=95-500", 100) == (95, 99)
+
+
+def test_unsatisfiable_range():
+    assert endpoints._byte_range("bytes=100-", 100) is False
+    assert endpoints._byte_range("bytes=-0", 100) is False
+    status, headers, body = endpoints.cached_clip(AUDIO, KEY, {"Range": "bytes=200-300"})
+    assert status == 416
+    assert headers["Content-Range"] == "bytes */100"
+
+
+def test_ignored_ranges_send_whole_clip():
+    assert endpoints._byte_range("bytes=0-1,5-6", 100) is None
+    assert endpoints._byte_range("items=0-1", 100) is None
+    assert endpoints._byte_range("bytes=a-b", 100) is None
+    status, _, body = endpoints.cached_clip(AUDIO, KEY, {"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert status == 200
+    assert body == AUDIO
+
+
+def test_transcription_result():
+    assert endpoints.transcription_result(True, lambda: {"text": "こんにちは"}) == ({"text": "こんにちは"}, 200)
+    assert endpoints.transcription_result(False, None) == ({"error": "Transcription failed"}, 500)
@@ -0,0 +1,93 @@
+import time
+import uuid
+import pytest
+import ai
+import history
+from history import estimate_tokens
+
+
+def turn(i):
+    role = "user" if i % 2 == 0 else "assistant"
+    return {"role": role, "content": f"message {i} " + "ねこ" * 40}
+
+
+def test_context_stays_within_the_token_budget(monkeypatch):
+    vocab = ', '.join(f"単語{i}" for i in range(500))
+    messages = [turn(i) for i in range(10)]
+    scheduled = []
+    monkeypatch.setattr(history, "build_vocab_context", lambda user_id, message, fallback: vocab)
+    monkeypatch.setattr(history, "is_db_available", lambda: True)
+    monkeypatch.setattr(history, "load_history", lambda user_id, session_id, limit: ("Talked about cats.", 3, 14, messages))
+    monkeypatch.setattr(history.summary_refresher, "schedule", lambda user_id, session_id: scheduled.append(session_id))
+
+    vocab_context, conversation = history.build_tutor_context("u1", "s1", "こんにちは")
+
+    assert estimate_tokens(vocab_context) <= history.HISTORY_TOKEN_BUDGET * history.VOCAB_BUDGET_SHARE
+    assert vocab_context.startswith("単語0, 単語1")
+    assert estimate_tokens(vocab_context) + estimate_tokens(conversation) <= history.HISTORY_TOKEN_BUDGET
+    lines = conversation.split('\n')
+    assert lines[0] == "(Earlier: Talked about cats.)"
+    assert lines[-1] == history.format_message(messages[-1])  # Newest turns are kept first
+    assert history.format_message(messages[0]) not in lines
+    assert scheduled == ["s1"]  # 14 - 6 verbatim - 4 summarized >= HISTORY_SUMMARY_BATCH
+
+
+def test_no_session_means_no_history(monkeypatch):
+    monkeypatch.setattr(history, "build_vocab_context", lambda user_id, message, fallback: "猫, 犬")
+    assert history.build_tutor_context("u1", None, "こんにちは") == ("猫, 犬", '')
+
+
+@pytest.fixture
+def session_id(db, user_id):
+    """A session with enough turns for its oldest ones to be summarized."""
+    import app
+    session_id = str(uuid.uuid4())
+    now = int(time.time() * 1000)
+    with db.db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO sessions (id, user_id, title, created_at, updated_at) VALUES (%s, %s, 't', %s, %s)",
+                (session_id, user_id, now, now)
+            )
+            app.replace_session_messages(cur, session_id, [turn(i) for i in range(12)], now)
+    return session_id
+
+
+def stored_summary(db, session_id):
+    with db.db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT summary, summary_through FROM sessions WHERE id = %s", (session_id,))
+            return cur.fetchone()
+
+
+def test_refresh_folds_aged_out_turns_into_the_summary(db, user_id, session_id, monkeypatch):
+    transcripts = []
+
+    def summarize(previous, transcript, user_id=None):
+        transcripts.append(transcript)
+        return "Greetings."
+
+    monkeypatch.setattr(ai, "summarize_conversation", summarize)
+    history.refresh_summary(user_id, session_id)
+    # 12 messages minus the 6 of the verbatim window
+    assert stored_summary(db, session_id) == ("Greetings.", 12 - 2 * history.HISTORY_RECENT_TURNS - 1)
+    assert transcripts[0].count('\n') == 12 - 2 * history.HISTORY_RECENT_TURNS - 1
+
+
+def test_refresh_is_dropped_when_messages_are_replaced_meanwhile(db, user_id, session_id, monkeypatch):
+    import app
+
+    def summarize(previous, transcript, user_id=None):
+        # The learner's client rewrites the conversation while Gemini is busy
+        with db.db_connection() as conn:
+            with conn.cursor() as cur:
+                app.replace_session_messages(cur, session_id, [turn(i) for i in range(20)], 0)
+        return "A conversation that no longer exists."
+
+    monkeypatch.setattr(ai, "summarize_conversation", summarize)
+    history.refresh_summary(user_id, session_id)
+    assert stored_summary(db, session_id) == (None, -1)  # summary_through never moved, yet the guard held
+    with db.db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT data FROM messages WHERE session_id = %s AND position = 19", (session_id,))
+            assert cur.fetchone()[0] == turn(19)
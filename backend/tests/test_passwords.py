@@ -0,0 +1,56 @@
+import threading
+import uuid
+import pytest
+import passwords
+
+
+@pytest.fixture
+def busy_pool(monkeypatch):
+    """The app's hash pool swapped for one whose only slot is taken by a stuck hash."""
+    pool = passwords.HashPool(1, 0, 0.05)
+    release = threading.Event()
+    with pytest.raises(TimeoutError):
+        pool.run(release.wait)
+    monkeypatch.setattr(passwords, "hash_pool", pool)
+    yield pool
+    release.set()
+    pool.shutdown()
+
+
+def test_hashes_round_trip():
+    pool = passwords.HashPool(2, 2, 10)
+    hashed = pool.run(passwords._hashpw, b"secret", 4)
+    assert pool.run(passwords._checkpw, b"secret", hashed)
+    assert not pool.run(passwords._checkpw, b"wrong", hashed)
+    pool.shutdown()
+
+
+def test_timed_out_hash_keeps_its_slot(busy_pool):
+    with pytest.raises(passwords.HashQueueFull):
+        busy_pool.run(lambda: None)
+
+
+def test_slot_returns_when_the_hash_finishes():
+    pool = passwords.HashPool(1, 0, 0.05)
+    release = threading.Event()
+    with pytest.raises(TimeoutError):
+        pool.run(release.wait)
+    release.set()
+    pool._executor.submit(lambda: None).result()  # The stuck hash has finished
+    assert pool.run(lambda: 42) == 42
+    pool.shutdown()
+
+
+def test_hash_rounds():
+    assert passwords.hash_rounds("$2b$04$abc") == 4
+    assert passwords.hash_rounds("garbage") is None
+
+
+@pytest.mark.parametrize("path", ["/api/auth/register", "/api/auth/login"])
+def test_saturated_pool_answers_503_with_retry_after(db, user_id, busy_pool, path):
+    import app
+    # Login finds the fixture's user; register gets a fresh address
+    email = f"{user_id}@test.invalid" if path.endswith("login") else f"{uuid.uuid4()}@test.invalid"
+    response = app.app.test_client().post(path, json={"email": email, "password": "secret1"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,74 @@
+import time
+from reply_cache import ReplyCache, normalize_message
+
+
+def test_normalize_keeps_question_mark():
+    assert normalize_message("元気？") == "元気?"
+    assert normalize_message("元気?!") == "元気?"
+    assert normalize_message("元気") == "元気"
+    assert normalize_message("元気。") == "元気"
+    assert normalize_message("  Hello   World!! ") == "hello world"
+
+
+def test_question_and_statement_are_separate_entries():
+    cache = ReplyCache(10, 60)
+    cache.put("u1", "元気", "N5", "", {"reply": "statement"})
+    assert cache.get("u1", "元気？", "N5", "") is None
+    assert cache.get("u1", "元気。", "N5", "") == {"reply": "statement"}
+
+
+def test_openers_are_shared_across_learners_at_the_same_level_and_vocab():
+    cache = ReplyCache(10, 60)
+    cache.put("u1", "こんにちは", "N5", "猫", {"reply": 1})
+    assert cache.get("u2", "こんにちは!", "N5", "猫") == {"reply": 1}
+    assert cache.get("u2", "こんにちは", "N4", "猫") is None
+    assert cache.get("u2", "こんにちは", "N5", "犬") is None
+
+
+def test_later_turns_stay_with_their_conversation():
+    cache = ReplyCache(10, 60)
+    cache.put("u1", "はい", "N5", "", {"reply": 1}, history="a")
+    assert cache.get("u2", "はい", "N5", "", history="a") is None
+    assert cache.get("u1", "はい", "N5", "", history="b") is None
+    assert cache.get("u1", "はい", "N5", "") is None
+    assert cache.get("u1", "はい", "N5", "", history="a") == {"reply": 1}
+
+
+def test_fuzzy_tier_matches_near_duplicate_openers_only_when_enabled():
+    exact = ReplyCache(10, 60)
+    exact.put("u1", "how do i say cat", "N5", "", {"reply": "猫"})
+    assert exact.get("u2", "how do i say cats", "N5", "") is None
+
+    fuzzy = ReplyCache(10, 60, fuzzy_threshold=0.7)
+    fuzzy.put("u1", "how do i say cat", "N5", "", {"reply": "猫"})
+    assert fuzzy.get("u2", "how do i say cats", "N5", "") == {"reply": "猫"}
+    assert fuzzy.get("u2", "how do i say dog", "N5", "") is None
+    assert fuzzy.get("u2", "how do i say cat?", "N5", "") is None
+    assert fuzzy.snapshot()["fuzzy_hits"] == 1
+
+
+def test_fuzzy_tier_ignores_later_turns():
+    cache = ReplyCache(10, 60, fuzzy_threshold=0.5)
+    cache.put("u1", "how do i say cat", "N5", "", {"reply": "猫"}, history="a")
+    assert cache.get("u1", "how do i say cats", "N5", "", history="a") is None
+
+
+def test_eviction_and_expiry():
+    cache = ReplyCache(2, 60)
+    for message in ("a", "b", "c"):
+        cache.put("u1", message, "", "", {"m": message})
+    assert cache.get("u1", "a", "", "") is None
+    assert cache.snapshot()["evictions"] == 1
+
+    cache = ReplyCache(2, 0.01)
+    cache.put("u1", "a", "", "", {})
+    time.sleep(0.02)
+    assert cache.get("u1", "a", "", "") is None
+    assert cache.snapshot()["expirations"] == 1
+
+
+def test_returned_reply_is_a_copy():
+    cache = ReplyCache(2, 60)
+    cache.put("u1", "a", "", "", {"segments": []})
+    cache.get("u1", "a", "", "")["segments"].append("x")
+    assert cache.get("u1", "a", "", "") == {"segments": []}
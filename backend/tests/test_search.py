@@ -0,0 +1,26 @@
+import search
+
+
+def test_query_variants_cover_both_kana_scripts():
+    assert search.query_variants("ねこ") == ["ねこ", "ネコ"]
+    assert search.query_variants("猫") == ["猫"]
+
+
+def test_long_queries_use_indexable_ilike():
+    params = {}
+    clause = search._match_clause("expr", ["50%_off"], params)
+    assert clause == "(expr ILIKE %(p0)s)"
+    assert params == {"p0": "%50\\%\\_off%"}
+
+
+def test_short_queries_avoid_the_trigram_index():
+    params = {}
+    clause = search._match_clause("expr", search.query_variants("ね"), params)
+    assert "ILIKE" not in clause
+    assert clause == "(strpos(lower(expr), %(p0)s) > 0 OR strpos(lower(expr), %(p1)s) > 0)"
+    assert params == {"p0": "ね", "p1": "ネ"}
+
+
+def test_snippet_centres_on_the_match():
+    text = "あ" * 50 + "ネコ" + "い" * 50
+    assert search.snippet(text, ["ねこ"]) == "…" + "あ" * 30 + "ネコ" + "い" * 30 + "…"
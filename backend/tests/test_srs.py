@@ -0,0 +1,76 @@
+import pytest
+import srs
+
+NOW = 1_700_000_000_000
+
+
+def card(**state):
+    return {"interval_days": 0.0, "ease": srs.START_EASE, "repetitions": 0, "lapses": 0, **state}
+
+
+def test_new_card_first_intervals():
+    assert srs.schedule(card(), srs.GOOD, NOW)["interval_days"] == 1.0
+    assert srs.schedule(card(), srs.EASY, NOW)["interval_days"] == 4.0
+    assert srs.schedule(card(), srs.HARD, NOW)["interval_days"] == 1.0
+
+
+def test_again_resets_and_relearns_soon():
+    state = srs.schedule(card(interval_days=30.0, repetitions=5, lapses=1), srs.AGAIN, NOW)
+    assert state["interval_days"] == 0.0
+    assert state["repetitions"] == 0
+    assert state["lapses"] == 2
+    assert state["ease"] == 2.3
+    assert state["due_at"] == NOW + srs.RELEARN_MS
+    assert state["mastery"] == 1
+
+
+def test_hard_grows_slowly_and_lowers_ease():
+    state = srs.schedule(card(interval_days=10.0, repetitions=3), srs.HARD, NOW)
+    assert state["interval_days"] == pytest.approx(10.0 * srs.HARD_FACTOR)
+    assert state["ease"] == 2.35
+    assert state["repetitions"] == 4
+
+
+def test_good_second_review_then_multiplies_by_ease():
+    assert srs.schedule(card(interval_days=1.0, repetitions=1), srs.GOOD, NOW)["interval_days"] == 6.0
+    state = srs.schedule(card(interval_days=6.0, repetitions=2), srs.GOOD, NOW)
+    assert state["interval_days"] == pytest.approx(15.0)
+    assert state["ease"] == srs.START_EASE
+    assert state["due_at"] == NOW + int(15.0 * srs.DAY_MS)
+    assert state["last_reviewed_at"] == NOW
+
+
+def test_easy_adds_bonus_and_raises_ease():
+    assert srs.schedule(card(interval_days=1.0, repetitions=1), srs.EASY, NOW)["interval_days"] == pytest.approx(6.0 * srs.EASY_BONUS)
+    state = srs.schedule(card(interval_days=6.0, repetitions=2), srs.EASY, NOW)
+    assert state["interval_days"] == pytest.approx(6.0 * 2.5 * srs.EASY_BONUS)
+    assert state["ease"] == 2.65
+
+
+def test_ease_never_drops_below_minimum():
+    state = card(ease=srs.MIN_EASE + 0.05)
+    for _ in range(3):
+        state.update(srs.schedule(state, srs.AGAIN, NOW))
+    assert state["ease"] == srs.MIN_EASE
+    state.update(srs.schedule(state, srs.HARD, NOW))
+    assert state["ease"] == srs.MIN_EASE
+
+
+def test_interval_is_capped():
+    state = srs.schedule(card(interval_days=srs.MAX_INTERVAL_DAYS - 1, repetitions=10), srs.EASY, NOW)
+    assert state["interval_days"] == srs.MAX_INTERVAL_DAYS
+    state = srs.schedule(card(interval_days=srs.MAX_INTERVAL_DAYS, repetitions=10), srs.HARD, NOW)
+    assert state["interval_days"] == srs.MAX_INTERVAL_DAYS
+
+
+def test_missing_state_uses_defaults():
+    state = srs.schedule({"interval_days": None, "ease": None, "repetitions": None, "lapses": None}, srs.GOOD, NOW)
+    assert state["interval_days"] == 1.0
+    assert state["ease"] == srs.START_EASE
+    assert state["repetitions"] == 1
+    assert state["mastery"] == 2
+
+
+def test_mastery_tops_out_at_five():
+    assert srs.mastery_for(0) == 1
+    assert srs.mastery_for(10) == 5
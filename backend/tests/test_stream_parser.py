@@ -0,0 +1,48 @@
+import json
+import pytest
+from ai import SentenceStreamParser
+
+
+def feed_all(chunks):
+    parser = SentenceStreamParser()
+    sentences = []
+    for chunk in chunks:
+        sentences.extend(parser.feed(chunk))
+    return parser, sentences
+
+
+def test_sentences_come_out_as_they_finish():
+    parser = SentenceStreamParser()
+    assert parser.feed('{"japanese": "こんにちは。元') == ["こんにちは。"]
+    assert parser.feed('気ですか？はい') == ["元気ですか？"]
+    assert parser.feed('", "english": "Hello."}') == ["はい"]
+    assert parser.feed('') == []
+    assert parser.result()["english"] == "Hello."
+
+
+def test_waits_for_the_japanese_key():
+    parser = SentenceStreamParser()
+    assert parser.feed('{"english": "Yes.", "japa') == []
+    assert parser.feed('nese": "はい。"}') == ["はい。"]
+
+
+@pytest.mark.parametrize("escaped, decoded", [
+    ('\\"本\\"です。', '"本"です。'),
+    ('一行目\\n二行目。', '一行目\n二行目。'),
+    ('\\u732bです。', '猫です。'),
+    ('\\ud83d\\ude00です。', '\U0001F600です。'),
+    ('C:\\\\dir。', 'C:\\dir。'),
+])
+def test_escapes_split_at_every_position(escaped, decoded):
+    raw = '{"japanese": "' + escaped + '", "english": ""}'
+    assert json.loads(raw)["japanese"] == decoded
+    for cut in range(len(raw) + 1):
+        parser, sentences = feed_all([raw[:cut], raw[cut:]])
+        assert "".join(sentences) == decoded, cut
+        assert parser.result()["japanese"] == decoded
+
+
+def test_one_character_chunks():
+    raw = json.dumps({"japanese": "「行こう！」と言った。\U0001F600", "english": "x"})
+    _, sentences = feed_all(list(raw))
+    assert sentences == ["「行こう！」", "と言った。", "\U0001F600"]
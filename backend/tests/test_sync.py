@@ -0,0 +1,62 @@
+import json
+import time
+import uuid
+import psycopg2
+import sync
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def changes(db, user_id, since):
+    with db.db_connection() as conn:
+        with conn.cursor() as cur:
+            body, cursor = sync.load_changes(cur, user_id, since, now_ms())
+    return json.loads(body), cursor
+
+
+def add_vocab(cur, user_id, term):
+    cur.execute("INSERT INTO vocab (id, user_id, term, reading, meaning) VALUES (%s, %s, %s, '', '')", (str(uuid.uuid4()), user_id, term))
+
+
+def test_first_sync_is_a_full_snapshot(db, user_id):
+    with db.db_connection() as conn:
+        with conn.cursor() as cur:
+            add_vocab(cur, user_id, "猫")
+    body, cursor = changes(db, user_id, None)
+    assert body["reset"] is True
+    assert [v["term"] for v in body["vocab"]] == ["猫"]
+    assert body["cursor"] == str(cursor)
+
+
+def test_deletes_come_back_as_tombstones(db, user_id):
+    with db.db_connection() as conn:
+        with conn.cursor() as cur:
+            add_vocab(cur, user_id, "犬")
+    _, cursor = changes(db, user_id, None)
+    with db.db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM vocab WHERE user_id = %s RETURNING id", (user_id,))
+            deleted = cur.fetchone()[0]
+    body, _ = changes(db, user_id, cursor)
+    assert body["reset"] is False
+    assert body["deleted"]["vocab"] == [deleted]
+
+
+def test_cursor_waits_for_open_writers(db, user_id):
+    _, cursor = changes(db, user_id, None)
+    writer = psycopg2.connect(db.DB_DSN)
+    try:
+        with writer.cursor() as cur:
+            add_vocab(cur, user_id, "鳥")  # Stamped now, committed later
+        with db.db_connection() as conn:
+            with conn.cursor() as cur:
+                add_vocab(cur, user_id, "魚")
+        body, cursor = changes(db, user_id, cursor)
+        assert [v["term"] for v in body["vocab"]] == ["魚"]
+        writer.commit()
+    finally:
+        writer.close()
+    body, _ = changes(db, user_id, cursor)
+    assert "鳥" in [v["term"] for v in body["vocab"]]
@@ -0,0 +1,25 @@
+import telemetry
+
+
+def test_collectors_declare_their_metric_type():
+    registry = telemetry.Registry()
+    registry.add_collector(lambda: [
+        ("cache_hits_total", "Hits.", "counter", [({}, 3)]),
+        ("cache_entries", "Entries.", "gauge", [({"tier": "memory"}, 2.0)]),
+    ])
+    assert registry.render().splitlines() == [
+        "# HELP cache_hits_total Hits.",
+        "# TYPE cache_hits_total counter",
+        "cache_hits_total 3",
+        "# HELP cache_entries Entries.",
+        "# TYPE cache_entries gauge",
+        'cache_entries{tier="memory"} 2',
+    ]
+
+
+def test_failing_collector_is_skipped():
+    registry = telemetry.Registry()
+    registry.add_collector(lambda: 1 / 0)
+    counter = registry.register(telemetry.Counter("requests_total", "Requests.", ("route",)))
+    counter.inc(route="/a")
+    assert registry.render().splitlines()[-1] == 'requests_total{route="/a"} 1'
@@ -0,0 +1,70 @@
+import io
+import json
+import pytest
+import transfer
+from transfer import ImportFormatError, Importer
+
+
+def body(*rows):
+    """An import stream: the header, then one line per row (strings are sent as they are)."""
+    lines = [{"type": "header", "format": transfer.EXPORT_FORMAT, "version": transfer.EXPORT_VERSION}, *rows]
+    return io.StringIO(''.join((r if isinstance(r, str) else json.dumps(r, ensure_ascii=False)) + "\n" for r in lines))
+
+
+def vocab(id, term, **fields):
+    return {"type": "vocab", "id": id, "term": term, **fields}
+
+
+def import_error(stream):
+    transfer.read_header(stream)
+    with pytest.raises(ImportFormatError) as raised:
+        list(Importer("u1").batches(stream))
+    return raised.value
+
+
+@pytest.mark.parametrize("bad, message", [
+    ("{not json", "invalid JSON"),
+    ('["a list"]', "expected a JSON object"),
+    (json.dumps({"type": "card"}), "unknown row type 'card'"),
+    (json.dumps({"type": "vocab", "id": "v9"}), "vocab row is missing term"),
+    (json.dumps(vocab("v9", "魚", mastery="high")), "vocab mastery must be an integer"),
+    (json.dumps(vocab("v9", "魚", addedAt=2 ** 63)), "vocab addedAt must be an integer"),
+    (json.dumps(vocab("v9", "魚", ease=1e39)), "vocab ease must be a finite number"),
+    (json.dumps(vocab(9, "魚")), "vocab id must be a string"),
+])
+def test_errors_name_the_offending_line(bad, message):
+    error = import_error(body(vocab("v1", "猫"), "", vocab("v2", "犬"), bad, vocab("v3", "鳥")))
+    assert error.line == 5  # Header, two rows and a blank line before it
+    assert str(error).startswith(f"Line 5: {message}")
+
+
+def test_one_id_under_two_terms_is_caught_before_writing():
+    error = import_error(body(vocab("v1", "猫"), vocab("v2", "犬"), vocab("v1", "猫"), vocab("v1", "虎")))
+    assert error.line == 5
+    assert "on line 2" in str(error)
+
+
+def test_error_after_a_committed_batch_keeps_its_line(db, user_id, monkeypatch):
+    monkeypatch.setattr(transfer, "IMPORT_BATCH_ROWS", 2)
+    stream = body(*(vocab(f"{user_id}-{i}", term) for i, term in enumerate("猫犬鳥")), vocab(f"{user_id}-3", "魚", lapses=-2 ** 40))
+    transfer.read_header(stream)
+    importer = Importer(user_id)
+    batches = importer.batches(stream)
+    assert next(batches)["counts"]["vocab"] == 2
+    with pytest.raises(ImportFormatError) as raised:
+        next(batches)
+    assert raised.value.line == 5
+
+
+def test_import_route_reports_the_line(db, user_id):
+    import app
+    from flask_jwt_extended import create_access_token
+    with app.app.app_context():
+        token = create_access_token(identity=user_id)
+    stream = body(vocab(f"{user_id}-0", "猫"), vocab(f"{user_id}-0", "犬"), vocab(f"{user_id}-1", "鳥"))
+    response = app.app.test_client().post(
+        "/api/import", data=stream.getvalue().encode(), headers={"Authorization": f"Bearer {token}"}
+    )
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert events[-1]["type"] == "error"
+    assert events[-1]["line"] == 3
@@ -0,0 +1,96 @@
+import threading
+import time
+import pytest
+import upstream
+import tts
+
+
+def wait_until(condition, timeout=1.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def admission(capacity=1):
+    return upstream.Admission("test", capacity, 4, 5.0, 1.0)
+
+
+def test_background_waits_behind_queued_requests():
+    adm = admission()
+    adm.acquire("u1")
+    order = []
+    wake = threading.Event()
+    background = threading.Thread(target=lambda: order.append(("bg", adm.acquire_background("u3", wake))))
+    background.start()
+    wait_until(lambda: adm.snapshot()["background"])
+    foreground = threading.Thread(target=lambda: order.append(("fg", adm.acquire("u2"))))
+    foreground.start()
+    wait_until(lambda: adm.snapshot()["waiting"])
+
+    adm.release("u1", 0.0)
+    foreground.join(1)
+    assert order == [("fg", None)]
+    assert not wake.is_set()
+
+    adm.release("u2", 0.0)
+    background.join(1)
+    assert order == [("fg", None), ("bg", True)]
+    assert adm.snapshot()["active"] == 1
+
+
+def test_background_wait_can_be_abandoned():
+    adm = admission()
+    adm.acquire("u1")
+    wake = threading.Event()
+    result = []
+    background = threading.Thread(target=lambda: result.append(adm.acquire_background("u2", wake)))
+    background.start()
+    wait_until(lambda: adm.snapshot()["background"])
+    wake.set()
+    background.join(1)
+    assert result == [False]
+    assert adm.snapshot()["background"] == 0
+    adm.release("u1", 0.0)
+    assert adm.snapshot()["active"] == 0
+
+
+def test_background_does_not_delay_requests():
+    adm = admission(capacity=2)
+    assert adm.acquire_background("u1", threading.Event())
+    adm.acquire("u2")  # The free slot goes straight to the request
+    assert adm.snapshot()["active"] == 2
+
+
+@pytest.fixture
+def busy_tts(monkeypatch):
+    """A one-slot "tts" admission, held by a request until the test releases it."""
+    adm = admission()
+    monkeypatch.setitem(upstream.admissions, "tts", adm)
+    monkeypatch.setattr(tts, "_spill_speech", lambda key, text, voice: iter([b"audio"]))
+    adm.acquire("someone")
+    return adm
+
+
+def test_presynth_job_stays_claimable_while_waiting_for_a_slot(busy_tts):
+    presynth = tts.Presynthesizer(1, 8, 8)
+    presynth.submit("k1", "猫", "voice", "u1", presynth.reply_rank(), 0)
+    wait_until(lambda: busy_tts.snapshot()["background"])
+
+    assert presynth.claim("k1") is None  # Handed over to the caller
+    assert presynth.snapshot()["claimed"] == 1
+    wait_until(lambda: not busy_tts.snapshot()["background"])
+    busy_tts.release("someone", 0.0)
+    assert busy_tts.snapshot()["active"] == 0
+
+
+def test_presynth_runs_once_a_slot_frees_up(busy_tts):
+    presynth = tts.Presynthesizer(1, 8, 8)
+    presynth.submit("k1", "猫", "voice", "u1", presynth.reply_rank(), 0)
+    wait_until(lambda: busy_tts.snapshot()["background"])
+    job = presynth._pending["k1"]
+
+    busy_tts.release("someone", 0.0)
+    assert job.done.wait(1)
+    assert presynth.snapshot()["synthesized"] == 1
+    assert busy_tts.snapshot()["active"] == 0
@@ -0,0 +1,82 @@
+import uuid
+import pytest
+
+
+@pytest.fixture
+def app(db):
+    import app
+    return app
+
+
+def item(vocab_id, term):
+    return {"id": vocab_id, "term": term, "reading": "r", "meaning": "m", "mastery": 1, "addedAt": 1}
+
+
+def save(db, app, user_id, items):
+    with db.db_connection() as conn:
+        with conn.cursor() as cur:
+            return app.upsert_vocab_items(cur, user_id, items)
+
+
+def terms(db, user_id):
+    with db.db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT term, id FROM vocab WHERE user_id = %s ORDER BY term", (user_id,))
+            return dict(cur.fetchall())
+
+
+def test_known_id_with_edited_term_renames_the_card(db, app, user_id):
+    vocab_id = str(uuid.uuid4())
+    save(db, app, user_id, [item(vocab_id, "ねこ")])
+    assert save(db, app, user_id, [item(vocab_id, "猫")]) == {"猫": vocab_id}
+    assert terms(db, user_id) == {"猫": vocab_id}
+
+
+def test_same_term_keeps_the_stored_id(db, app, user_id):
+    vocab_id = str(uuid.uuid4())
+    save(db, app, user_id, [item(vocab_id, "犬")])
+    assert save(db, app, user_id, [item(str(uuid.uuid4()), "犬")]) == {"犬": vocab_id}
+
+
+def test_rename_onto_a_stored_term_conflicts(db, app, user_id):
+    first, second = str(uuid.uuid4()), str(uuid.uuid4())
+    save(db, app, user_id, [item(first, "鳥"), item(second, "魚")])
+    with pytest.raises(app.VocabConflict):
+        save(db, app, user_id, [item(first, "魚")])
+    assert terms(db, user_id) == {"魚": second, "鳥": first}
+
+
+def test_another_users_id_conflicts(db, app, user_id):
+    vocab_id = str(uuid.uuid4())
+    save(db, app, user_id, [item(vocab_id, "本")])
+    with pytest.raises(app.VocabConflict):
+        save(db, app, str(uuid.uuid4()), [item(vocab_id, "本")])
+
+
+def test_swapping_two_cards_terms_is_not_a_conflict(db, app, user_id):
+    first, second = str(uuid.uuid4()), str(uuid.uuid4())
+    save(db, app, user_id, [item(first, "上"), item(second, "下")])
+    assert save(db, app, user_id, [item(first, "下"), item(second, "上")]) == {"下": first, "上": second}
+    assert terms(db, user_id) == {"下": first, "上": second}
+
+
+def test_rename_onto_a_term_freed_in_the_same_batch(db, app, user_id):
+    first, second = str(uuid.uuid4()), str(uuid.uuid4())
+    save(db, app, user_id, [item(first, "右"), item(second, "左")])
+    save(db, app, user_id, [item(second, "左手"), item(first, "左")])
+    assert terms(db, user_id) == {"左": first, "左手": second}
+
+
+def test_optional_fields_use_column_defaults(db, app, user_id):
+    vocab_id = str(uuid.uuid4())
+    save(db, app, user_id, [{"id": vocab_id, "term": "水", "addedAt": 5}])
+    save(db, app, user_id, [{"id": str(uuid.uuid4()), "term": "水"}])
+    with db.db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id, mastery, added_at FROM vocab WHERE user_id = %s", (user_id,))
+            assert cur.fetchall() == [(vocab_id, 1, 5)]
+
+
+def test_repeated_id_in_a_batch_keeps_the_last_item(db, app, user_id):
+    vocab_id = str(uuid.uuid4())
+    assert save(db, app, user_id, [item(vocab_id, "花"), item(vocab_id, "華")]) == {"華": vocab_id}
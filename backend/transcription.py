@@ -0,0 +1,117 @@
+"""Incremental transcription for /api/transcribe/stream.
+
+The Whisper service only transcribes whole files, so the browser streams
+16 kHz mono PCM and we cut it into utterance-sized segments at pauses in
+speech. Each segment is sent to Whisper as soon as it closes, and the
+transcript so far goes back to the client while the learner keeps talking.
+Only the open segment and a few queued ones are ever held in memory.
+"""
+import os
+import io
+import wave
+from array import array
+from dotenv import load_dotenv
+import upstream
+
+load_dotenv()
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2  # 16-bit little-endian PCM
+FRAME_SAMPLES = SAMPLE_RATE * 30 // 1000  # 30 ms analysis frames
+FRAME_BYTES = FRAME_SAMPLES * SAMPLE_WIDTH
+
+# Frame RMS (on the int16 scale) below which we treat audio as silence
+STREAM_SILENCE_RMS = float(os.getenv("STREAM_SILENCE_RMS", "500"))
+# A pause this long ends the current segment
+STREAM_PAUSE_SECONDS = float(os.getenv("STREAM_PAUSE_SECONDS", "0.6"))
+# Segments are cut here even mid-speech so long utterances still show progress
+STREAM_MAX_SEGMENT_SECONDS = float(os.getenv("STREAM_MAX_SEGMENT_SECONDS", "12"))
+STREAM_MIN_SEGMENT_SECONDS = 1.0
+# Closed segments waiting for Whisper before we stop reading from the client
+STREAM_MAX_PENDING_SEGMENTS = int(os.getenv("STREAM_MAX_PENDING_SEGMENTS", "4"))
+
+def frame_rms(frame):
+    samples = array('h')
+    samples.frombytes(frame)
+    if not samples:
+        return 0.0
+    return (sum(s * s for s in samples) / len(samples)) ** 0.5
+
+def pcm_to_wav(pcm):
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(SAMPLE_WIDTH)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(pcm)
+    return buf.getvalue()
+
+class SpeechSegmenter:
+    """Splits a PCM stream into segments at pauses.
+
+    feed() returns the segments completed by the new audio; flush() returns
+    whatever is left when the stream ends. Segments with no voiced frames
+    are dropped, since Whisper tends to invent text for silence.
+    """
+
+    def __init__(self):
+        self._pending = bytearray()  # partial frame carried between feeds
+        self._segment = bytearray()
+        self._voiced = False
+        self._silent_frames = 0
+        self._pause_frames = int(STREAM_PAUSE_SECONDS * 1000 / 30)
+        self._min_bytes = int(STREAM_MIN_SEGMENT_SECONDS * SAMPLE_RATE) * SAMPLE_WIDTH
+        self._max_bytes = int(STREAM_MAX_SEGMENT_SECONDS * SAMPLE_RATE) * SAMPLE_WIDTH
+
+    def feed(self, pcm):
+        self._pending += pcm
+        segments = []
+        while len(self._pending) >= FRAME_BYTES:
+            frame = bytes(self._pending[:FRAME_BYTES])
+            del self._pending[:FRAME_BYTES]
+
+            if frame_rms(frame) >= STREAM_SILENCE_RMS:
+                self._voiced = True
+                self._silent_frames = 0
+            else:
+                self._silent_frames += 1
+
+            if not self._voiced:
+                # Leading silence: keep only the last pause's worth as lead-in
+                self._segment += frame
+                excess = len(self._segment) - self._pause_frames * FRAME_BYTES
+                if excess > 0:
+                    del self._segment[:excess]
+                continue
+
+            self._segment += frame
+            paused = self._silent_frames >= self._pause_frames and len(self._segment) >= self._min_bytes
+            if paused or len(self._segment) >= self._max_bytes:
+                segments.append(self._close())
+        return segments
+
+    def flush(self):
+        self._segment += self._pending
+        self._pending.clear()
+        if not self._voiced:
+            self._segment.clear()
+            return None
+        return self._close()
+
+    def _close(self):
+        segment = bytes(self._segment)
+        self._segment.clear()
+        self._voiced = False
+        self._silent_frames = 0
+        return segment
+
+async def transcribe_segment(client, whisper_url, pcm, user_id=None):
+    """Transcribe one PCM segment with the Whisper service."""
+    async with upstream.alimit("whisper", user_id):
+        response = await client.post(
+            f"{whisper_url}/asr",
+            files={"audio_file": ("segment.wav", pcm_to_wav(pcm), "audio/wav")},
+            params={"language": "ja", "output": "json"}
+        )
+    response.raise_for_status()
+    return response.json().get("text", "").strip()
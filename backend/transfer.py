@@ -0,0 +1,321 @@
+"""Bulk export and import of one user's data as NDJSON.
+
+An export is a header line, then one line per settings, vocab card,
+session, message and review, then an end line with the counts. Postgres
+renders each row as JSON itself and server-side cursors page through the
+tables, so an export never holds more than one page in memory.
+
+An import reads the same format line by line, COPYs each batch into a
+temp table and upserts from there in its own transaction. A pooled
+connection is held only while a batch is written, never while waiting
+on the upload. Re-importing
+the same file is a no-op, and a failed import can be resumed by sending
+it again.
+"""
+import io
+import os
+import json
+from dotenv import load_dotenv
+from database import db_connection
+
+load_dotenv()
+
+EXPORT_FORMAT = "j-tutor-export"
+EXPORT_VERSION = 1
+# Rows fetched per round trip from each export cursor
+EXPORT_FETCH_ROWS = int(os.getenv("EXPORT_FETCH_ROWS", "1000"))
+# Lines loaded per import transaction
+IMPORT_BATCH_ROWS = int(os.getenv("IMPORT_BATCH_ROWS", "5000"))
+# Longest accepted import line; a session's messages are one line each
+IMPORT_MAX_LINE_BYTES = int(os.getenv("IMPORT_MAX_LINE_BYTES", str(1024 * 1024)))
+
+KINDS = ("settings", "vocab", "session", "message", "review")
+
+EXPORT_QUERIES = (
+    ("settings", """
+        SELECT json_build_object('type', 'settings', 'settings', COALESCE(settings, '{}'::jsonb))::text
+        FROM user_settings WHERE user_id = %(user_id)s"""),
+    ("vocab", """
+        SELECT json_build_object(
+            'type', 'vocab', 'id', id, 'term', term, 'reading', reading, 'meaning', meaning,
+            'explanation', explanation, 'examples', COALESCE(examples, '[]')::json, 'mastery', mastery,
+            'addedAt', added_at, 'dueAt', due_at, 'intervalDays', interval_days, 'ease', ease,
+            'repetitions', repetitions, 'lapses', lapses, 'lastReviewedAt', last_reviewed_at
+        )::text
+        FROM vocab WHERE user_id = %(user_id)s ORDER BY id"""),
+    ("session", """
+        SELECT json_build_object(
+            'type', 'session', 'id', id, 'title', title, 'createdAt', created_at, 'updatedAt', updated_at,
+            'summary', summary, 'summaryThrough', summary_through
+        )::text
+        FROM sessions WHERE user_id = %(user_id)s ORDER BY id"""),
+    ("message", """
+        SELECT json_build_object(
+            'type', 'message', 'sessionId', m.session_id, 'position', m.position, 'role', m.role,
+            'data', m.data, 'createdAt', m.created_at
+        )::text
+        FROM messages m JOIN sessions s ON s.id = m.session_id
+        WHERE s.user_id = %(user_id)s ORDER BY m.session_id, m.position"""),
+    ("review", """
+        SELECT json_build_object(
+            'type', 'review', 'term', v.term, 'grade', r.grade, 'reviewedAt', r.reviewed_at,
+            'intervalDays', r.interval_days
+        )::text
+        FROM reviews r JOIN vocab v ON v.id = r.vocab_id
+        WHERE r.user_id = %(user_id)s ORDER BY r.id"""),
+)
+
+class ImportFormatError(Exception):
+    """A malformed import stream; `line` is the 1-based line number."""
+
+    def __init__(self, line, message):
+        super().__init__(f"Line {line}: {message}")
+        self.line = line
+
+def _line(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')) + "\n"
+
+def export_lines(conn, user_id, now):
+    """Yield the user's export as NDJSON text, a page of lines at a time.
+
+    Everything is read in one repeatable-read transaction, so the file is
+    a consistent snapshot even while the user keeps working.
+    """
+    counts = dict.fromkeys(KINDS, 0)
+    with conn.cursor() as cur:
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+    yield _line({"type": "header", "format": EXPORT_FORMAT, "version": EXPORT_VERSION, "exportedAt": now})
+    for kind, query in EXPORT_QUERIES:
+        with conn.cursor(name=f"export_{kind}") as cur:
+            cur.itersize = EXPORT_FETCH_ROWS
+            cur.execute(query, {"user_id": user_id})
+            while True:
+                rows = cur.fetchmany(EXPORT_FETCH_ROWS)
+                if not rows:
+                    break
+                counts[kind] += len(rows)
+                yield ''.join(row[0] + "\n" for row in rows)
+    yield _line({"type": "end", "counts": counts})
+
+# ==================== IMPORT ====================
+
+# Each statement upserts one kind from the batch in import_rows. Rows whose
+# ids belong to another user, duplicates and reviews already on record are
+# left alone (and counted as skipped).
+IMPORT_STATEMENTS = {
+    "settings": """
+        INSERT INTO user_settings (user_id, settings)
+        SELECT %(user_id)s, doc->'settings' FROM import_rows
+        WHERE kind = 'settings' AND jsonb_typeof(doc->'settings') = 'object'
+        ORDER BY line DESC LIMIT 1
+        ON CONFLICT (user_id) DO UPDATE SET settings = EXCLUDED.settings""",
+    "vocab": """
+        INSERT INTO vocab (id, user_id, term, reading, meaning, explanation, examples, mastery, added_at,
+                           due_at, interval_days, ease, repetitions, lapses, last_reviewed_at)
+        SELECT DISTINCT ON (doc->>'term')
+            doc->>'id', %(user_id)s, doc->>'term', doc->>'reading', doc->>'meaning', doc->>'explanation',
+            COALESCE(doc->'examples', '[]'::jsonb)::text, COALESCE((doc->>'mastery')::int, 1), (doc->>'addedAt')::bigint,
+            COALESCE((doc->>'dueAt')::bigint, 0), COALESCE((doc->>'intervalDays')::real, 0),
+            COALESCE((doc->>'ease')::real, 2.5), COALESCE((doc->>'repetitions')::int, 0),
+            COALESCE((doc->>'lapses')::int, 0), (doc->>'lastReviewedAt')::bigint
+        FROM import_rows r
+        WHERE kind = 'vocab'
+          AND NOT EXISTS (
+              SELECT 1 FROM vocab v
+              WHERE v.id = r.doc->>'id' AND (v.user_id <> %(user_id)s OR v.term <> r.doc->>'term')
+          )
+        ORDER BY doc->>'term', line DESC
+        ON CONFLICT (user_id, term) DO UPDATE SET
+            reading = EXCLUDED.reading,
+            meaning = EXCLUDED.meaning,
+            explanation = EXCLUDED.explanation,
+            examples = EXCLUDED.examples,
+            mastery = EXCLUDED.mastery,
+            added_at = EXCLUDED.added_at,
+            due_at = EXCLUDED.due_at,
+            interval_days = EXCLUDED.interval_days,
+            ease = EXCLUDED.ease,
+            repetitions = EXCLUDED.repetitions,
+            lapses = EXCLUDED.lapses,
+            last_reviewed_at = EXCLUDED.last_reviewed_at""",
+    "session": """
+        INSERT INTO sessions (id, user_id, title, created_at, updated_at, summary, summary_through)
+        SELECT DISTINCT ON (doc->>'id')
+            doc->>'id', %(user_id)s, doc->>'title', (doc->>'createdAt')::bigint, (doc->>'updatedAt')::bigint,
+            doc->>'summary', COALESCE((doc->>'summaryThrough')::int, -1)
+        FROM import_rows
+        WHERE kind = 'session'
+        ORDER BY doc->>'id', line DESC
+        ON CONFLICT (id) DO UPDATE SET
+            title = EXCLUDED.title,
+            created_at = EXCLUDED.created_at,
+            updated_at = EXCLUDED.updated_at,
+            summary = EXCLUDED.summary,
+            summary_through = EXCLUDED.summary_through,
+            history_version = sessions.history_version + 1
+        WHERE sessions.user_id = EXCLUDED.user_id""",
+    "message": """
+        WITH stored AS (
+            INSERT INTO messages (session_id, position, role, data, created_at)
+            SELECT DISTINCT ON (r.doc->>'sessionId', (r.doc->>'position')::int)
+                r.doc->>'sessionId', (r.doc->>'position')::int, r.doc->>'role', r.doc->'data', (r.doc->>'createdAt')::bigint
+            FROM import_rows r
+            JOIN sessions s ON s.id = r.doc->>'sessionId' AND s.user_id = %(user_id)s
+            WHERE r.kind = 'message'
+            ORDER BY r.doc->>'sessionId', (r.doc->>'position')::int, r.line DESC
+            ON CONFLICT (session_id, position) DO UPDATE SET
+                role = EXCLUDED.role,
+                data = EXCLUDED.data,
+                created_at = EXCLUDED.created_at
+            RETURNING session_id, position
+        ), counts AS (
+            UPDATE sessions SET message_count = GREATEST(COALESCE(sessions.message_count, 0), c.next_position)
+            FROM (SELECT session_id, MAX(position) + 1 AS next_position FROM stored GROUP BY session_id) c
+            WHERE sessions.id = c.session_id
+        )
+        SELECT COUNT(*) FROM stored""",
+    "review": """
+        INSERT INTO reviews (user_id, vocab_id, grade, reviewed_at, interval_days)
+        SELECT DISTINCT %(user_id)s, v.id, (r.doc->>'grade')::smallint, (r.doc->>'reviewedAt')::bigint,
+               COALESCE((r.doc->>'intervalDays')::real, 0)
+        FROM import_rows r
+        JOIN vocab v ON v.user_id = %(user_id)s AND v.term = r.doc->>'term'
+        WHERE r.kind = 'review'
+          AND NOT EXISTS (
+              SELECT 1 FROM reviews x
+              WHERE x.vocab_id = v.id AND x.reviewed_at = (r.doc->>'reviewedAt')::bigint
+          )""",
+}
+
+# Fields an import line must carry, by kind
+REQUIRED_FIELDS = {
+    "settings": ("settings",),
+    "vocab": ("id", "term"),
+    "session": ("id",),
+    "message": ("sessionId", "position", "data"),
+    "review": ("term", "grade", "reviewedAt"),
+}
+# Typed fields and, for integers, the column's bound. Checked as each line
+# is read, so a bad value is reported against its own line instead of
+# failing the batch's upsert as a whole.
+TEXT_FIELDS = ("id", "term", "sessionId")
+INTEGER_FIELDS = {
+    "mastery": 2 ** 31, "repetitions": 2 ** 31, "lapses": 2 ** 31, "position": 2 ** 31, "summaryThrough": 2 ** 31,
+    "grade": 2 ** 15,
+    "addedAt": 2 ** 63, "dueAt": 2 ** 63, "lastReviewedAt": 2 ** 63, "createdAt": 2 ** 63, "updatedAt": 2 ** 63,
+    "reviewedAt": 2 ** 63,
+}
+REAL_FIELDS = ("intervalDays", "ease")
+REAL_BOUND = 1e38
+
+def _copy_text(value):
+    return value.replace('\\', '\\\\')
+
+def parse_line(line, number):
+    if len(line) > IMPORT_MAX_LINE_BYTES:
+        raise ImportFormatError(number, f"longer than {IMPORT_MAX_LINE_BYTES} bytes")
+    try:
+        row = json.loads(line)
+    except ValueError as e:
+        raise ImportFormatError(number, f"invalid JSON ({e})")
+    if not isinstance(row, dict):
+        raise ImportFormatError(number, "expected a JSON object")
+    return row
+
+def check_fields(row, kind, number):
+    for field in TEXT_FIELDS:
+        if row.get(field) is not None and not isinstance(row[field], str):
+            raise ImportFormatError(number, f"{kind} {field} must be a string")
+    for field, bound in INTEGER_FIELDS.items():
+        value = row.get(field)
+        if value is not None and (type(value) is not int or not -bound <= value < bound):
+            raise ImportFormatError(number, f"{kind} {field} must be an integer of magnitude below {bound}")
+    for field in REAL_FIELDS:
+        value = row.get(field)
+        if value is not None and (type(value) not in (int, float) or not abs(value) < REAL_BOUND):
+            raise ImportFormatError(number, f"{kind} {field} must be a finite number")
+
+def read_header(stream):
+    """Check the first line of an import stream is an export header we understand."""
+    header = parse_line(stream.readline(IMPORT_MAX_LINE_BYTES + 1), 1)
+    if header.get('type') != 'header' or header.get('format') != EXPORT_FORMAT:
+        raise ImportFormatError(1, f"not a {EXPORT_FORMAT} file")
+    if header.get('version') != EXPORT_VERSION:
+        raise ImportFormatError(1, f"unsupported export version {header.get('version')}")
+    return header
+
+class Importer:
+    """Loads an export stream, after its header, into one user's account, a batch per transaction."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.lines = 1
+        self.counts = dict.fromkeys(KINDS, 0)
+        self.skipped = 0
+        self._batch = io.StringIO()
+        self._staged = dict.fromkeys(KINDS, 0)
+        self._vocab_ids = {}  # id -> (term, line) for vocab rows in the current batch
+
+    def batches(self, stream):
+        """Consume the rest of the stream; yields progress after each committed batch."""
+        while True:
+            line = stream.readline(IMPORT_MAX_LINE_BYTES + 1)
+            if not line:
+                break
+            self.lines += 1
+            if not line.strip():
+                continue
+            number = self.lines
+            row = parse_line(line, number)
+            kind = row.get('type')
+            if kind == 'end':
+                break
+            if kind not in KINDS:
+                raise ImportFormatError(number, f"unknown row type {kind!r}")
+            missing = [field for field in REQUIRED_FIELDS[kind] if row.get(field) is None]
+            if missing:
+                raise ImportFormatError(number, f"{kind} row is missing {', '.join(missing)}")
+            check_fields(row, kind, number)
+            if kind == 'vocab':
+                self._check_vocab_id(row, number)
+            doc = json.dumps(row, ensure_ascii=False, separators=(',', ':'))
+            self._batch.write(f"{number}\t{kind}\t{_copy_text(doc)}\n")
+            self._staged[kind] += 1
+            if sum(self._staged.values()) >= IMPORT_BATCH_ROWS:
+                self.flush()
+                yield self.progress()
+        if any(self._staged.values()):
+            self.flush()
+            yield self.progress()
+
+    def _check_vocab_id(self, row, number):
+        # One id under two terms would reach the insert as two rows with the same primary key
+        term, first = self._vocab_ids.setdefault(row['id'], (row['term'], number))
+        if term != row['term']:
+            raise ImportFormatError(number, f"vocab id {row['id']} is used for {term!r} on line {first} and {row['term']!r} here")
+
+    def flush(self):
+        """COPY the staged lines into import_rows and upsert them, in one transaction."""
+        self._batch.seek(0)
+        try:
+            with db_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        CREATE TEMP TABLE IF NOT EXISTS import_rows (line BIGINT, kind TEXT, doc JSONB) ON COMMIT DELETE ROWS
+                    """)
+                    cur.copy_expert("COPY import_rows (line, kind, doc) FROM STDIN", self._batch)
+                    # Parents before children: messages need their sessions, reviews their cards
+                    for kind in KINDS:
+                        if not self._staged[kind]:
+                            continue
+                        cur.execute(IMPORT_STATEMENTS[kind], {"user_id": self.user_id})
+                        stored = cur.fetchone()[0] if kind == 'message' else cur.rowcount
+                        self.counts[kind] += stored
+                        self.skipped += self._staged[kind] - stored
+        finally:
+            self._batch = io.StringIO()
+            self._staged = dict.fromkeys(KINDS, 0)
+            self._vocab_ids = {}
+
+    def progress(self):
+        return {"lines": self.lines, "counts": dict(self.counts), "skipped": self.skipped}
@@ -0,0 +1,522 @@
+import os
+import asyncio
+import concurrent.futures
+import hashlib
+import heapq
+import itertools
+import threading
+import unicodedata
+import uuid
+from collections import OrderedDict
+import edge_tts
+from dotenv import load_dotenv
+import upstream
+from annotator import SENTENCE_ENDINGS
+
+load_dotenv()
+
+DEFAULT_VOICE = 'ja-JP-NanamiNeural'
+VALID_VOICES = [
+    'ja-JP-NanamiNeural', 'ja-JP-KeitaNeural', 'ja-JP-AoiNeural',
+    'ja-JP-DaichiNeural', 'ja-JP-MayuNeural', 'ja-JP-NaokiNeural',
+    'ja-JP-ShioriNeural'
+]
+
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tts_cache"))
+TTS_CACHE_MEMORY_MB = int(os.getenv("TTS_CACHE_MEMORY_MB", "64"))
+TTS_CACHE_DISK_MB = int(os.getenv("TTS_CACHE_DISK_MB", "1024"))
+# Audio chunks buffered between Edge TTS and a slow client before synthesis pauses
+TTS_STREAM_BUFFER_CHUNKS = int(os.getenv("TTS_STREAM_BUFFER_CHUNKS", "32"))
+# Seconds to wait for the next chunk from Edge TTS
+TTS_CHUNK_TIMEOUT = float(os.getenv("TTS_CHUNK_TIMEOUT", "30"))
+# Background threads that synthesize tutor replies before anyone presses play
+TTS_PRESYNTH_WORKERS = int(os.getenv("TTS_PRESYNTH_WORKERS", "2"))
+# Clips waiting for a worker, in total and per user; the oldest replies are dropped first
+TTS_PRESYNTH_QUEUE = int(os.getenv("TTS_PRESYNTH_QUEUE", "256"))
+TTS_PRESYNTH_PER_USER = int(os.getenv("TTS_PRESYNTH_PER_USER", "16"))
+
+def normalize_text(text):
+    """Canonical form of the text so trivially different requests share audio."""
+    text = unicodedata.normalize('NFKC', text)
+    return ' '.join(text.split())
+
+def cache_key(text, voice):
+    """Content address for a (voice, normalized text) pair."""
+    return hashlib.sha256(f"{voice}\n{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+class AudioCache:
+    """Two-tier LRU cache of synthesized audio: bounded memory, spilling to disk.
+
+    Entries are immutable (the key is a hash of the content that produced
+    them), so disk files are written once and only ever evicted.
+    """
+
+    def __init__(self, directory, memory_bytes, disk_bytes):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> bytes
+        self._memory_size = 0
+        self._disk = OrderedDict()  # key -> size on disk
+        self._disk_size = 0
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+        self._load_disk_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def _load_disk_index(self):
+        """Rebuild the disk LRU from what previous runs left behind, oldest first."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith('.mp3'):
+                    continue
+                st = os.stat(os.path.join(self.directory, name))
+                entries.append((st.st_mtime, name[:-4], st.st_size))
+            for _, key, size in sorted(entries):
+                self._disk[key] = size
+                self._disk_size += size
+        except OSError as e:
+            print(f"⚠️  TTS disk cache unavailable: {e}")
+            self.disk_bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._memory or key in self._disk
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return data
+            on_disk = key in self._disk
+            if on_disk:
+                self._disk.move_to_end(key)
+
+        if on_disk:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    data = f.read()
+                os.utime(self._path(key))
+            except OSError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                    self._put_memory(key, data)
+                return data
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def writer(self, key):
+        """Return a writer that streams a new entry to disk, or None if it can't be stored."""
+        with self._lock:
+            if self.disk_bytes <= 0 or key in self._disk:
+                return None
+        try:
+            return AudioCacheWriter(self, key)
+        except OSError as e:
+            print(f"⚠️  TTS disk cache write failed: {e}")
+            return None
+
+    def _commit(self, key, tmp_path, size):
+        # Rename so readers never see a partial file
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            if key not in self._disk:
+                self._disk[key] = size
+                self._disk_size += size
+            evicted = self._evict_disk()
+
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def _put_memory(self, key, data):
+        # Caller holds the lock
+        if len(data) > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, old = self._memory.popitem(last=False)
+            self._memory_size -= len(old)
+            self.stats["memory_evictions"] += 1
+
+    def _evict_disk(self):
+        # Caller holds the lock; returns keys whose files should be removed
+        evicted = []
+        while self._disk_size > self.disk_bytes and len(self._disk) > 1:
+            old_key, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            self.stats["disk_evictions"] += 1
+            evicted.append(old_key)
+        return evicted
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_size,
+            }
+
+class AudioCacheWriter:
+    """Appends chunks to a temp file; commit() publishes it as a cache entry."""
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.size = 0
+        self.tmp_path = f"{cache._path(key)}.{uuid.uuid4().hex}.tmp"
+        self._file = open(self.tmp_path, 'wb')
+
+    def write(self, chunk):
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self):
+        self._file.close()
+        if not self.size:
+            self.abort()
+            return
+        try:
+            self.cache._commit(self.key, self.tmp_path, self.size)
+        except OSError as e:
+            print(f"⚠️  TTS disk cache write failed: {e}")
+            self.abort()
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+audio_cache = AudioCache(
+    TTS_CACHE_DIR,
+    TTS_CACHE_MEMORY_MB * 1024 * 1024,
+    TTS_CACHE_DISK_MB * 1024 * 1024
+)
+
+# A single long-lived event loop runs all Edge TTS sessions, instead of
+# spinning one up per request with asyncio.run().
+_loop = None
+_loop_lock = threading.Lock()
+
+def get_event_loop():
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="tts-loop", daemon=True).start()
+    return _loop
+
+async def _new_queue():
+    return asyncio.Queue(maxsize=TTS_STREAM_BUFFER_CHUNKS)
+
+async def _produce_speech(text, voice, chunks):
+    """Push audio chunks from Edge TTS onto the queue, then None (or the error)."""
+    try:
+        communicate = edge_tts.Communicate(text, voice)
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                await chunks.put(chunk["data"])
+        await chunks.put(None)
+    except Exception as e:
+        await chunks.put(e)
+
+def stream_speech(text, voice):
+    """Yield MP3 chunks as Edge TTS produces them."""
+    loop = get_event_loop()
+    chunks = asyncio.run_coroutine_threadsafe(_new_queue(), loop).result()
+    producer = asyncio.run_coroutine_threadsafe(_produce_speech(text, voice, chunks), loop)
+    try:
+        while True:
+            pending = asyncio.run_coroutine_threadsafe(chunks.get(), loop)
+            try:
+                item = pending.result(timeout=TTS_CHUNK_TIMEOUT)
+            except concurrent.futures.TimeoutError:
+                pending.cancel()
+                raise TimeoutError("Edge TTS stopped sending audio")
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Stops synthesis if the client went away mid-stream
+        producer.cancel()
+
+def load_clip(key):
+    """Cached audio for `key` or None, without synthesizing anything.
+
+    A clip a pre-synthesis worker is producing right now is waited for
+    rather than synthesized twice; one still queued is handed over to the
+    caller. Blocks on disk and on the worker, so keep it off event loops.
+    """
+    audio = audio_cache.get(key)
+    if audio is None:
+        job = presynth.claim(key)
+        if job is not None and job.done.wait(TTS_CHUNK_TIMEOUT):
+            audio = audio_cache.get(key)
+    return audio
+
+def stream_speech_cached(key, text, voice, user_id=None):
+    """Stream freshly synthesized audio, spilling it into the cache as it goes.
+
+    The entry is only published once the whole clip has been produced.
+    """
+    with upstream.limit("tts", user_id):
+        yield from _spill_speech(key, text, voice)
+
+def _spill_speech(key, text, voice):
+    # Caller holds a "tts" admission slot
+    writer = audio_cache.writer(key)
+    try:
+        for chunk in stream_speech(normalize_text(text), voice):
+            if writer:
+                writer.write(chunk)
+            yield chunk
+    except BaseException:
+        if writer:
+            writer.abort()
+        raise
+    if writer:
+        writer.commit()
+
+async def astream_speech_cached(key, text, voice, user_id=None):
+    """Async counterpart of stream_speech_cached, run on the caller's event loop.
+
+    Cache file writes happen on worker threads so disk I/O never blocks the loop.
+    """
+    writer = await asyncio.to_thread(audio_cache.writer, key)
+    try:
+        async with upstream.alimit("tts", user_id):
+            communicate = edge_tts.Communicate(normalize_text(text), voice)
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    if writer:
+                        await asyncio.to_thread(writer.write, chunk["data"])
+                    yield chunk["data"]
+    except BaseException:
+        if writer:
+            writer.abort()  # Stays inline: it must run even while being cancelled
+        raise
+    if writer:
+        await asyncio.to_thread(writer.commit)
+
+# ==================== PRE-SYNTHESIS ====================
+
+class PresynthJob:
+    __slots__ = ('key', 'text', 'voice', 'user_id', 'priority', 'cancelled', 'wake', 'done')
+
+    def __init__(self, key, text, voice, user_id, priority):
+        self.key = key
+        self.text = text
+        self.voice = voice
+        self.user_id = user_id
+        self.priority = priority
+        self.cancelled = False
+        self.wake = threading.Event()  # Admission grant, or cancellation while waiting for one
+        self.done = threading.Event()
+
+class Presynthesizer:
+    """Bounded priority queue of clips, synthesized into the audio cache by a few background threads.
+
+    Newer replies go first and, within a reply, earlier sentences. Workers
+    hold a "tts" admission slot like any request, but queue for it at the
+    lowest priority: only slots no request is waiting for. A request that
+    needs a clip now takes over a queued job (claim), including one whose
+    worker is still waiting for a slot, or waits on the one being synthesized.
+    """
+
+    def __init__(self, workers, max_queue, per_user):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.per_user = per_user
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._heap = []  # (priority, job); cancelled jobs are skipped when popped
+        self._pending = {}  # key -> queued job
+        self._running = {}  # key -> job being synthesized
+        self._threads = []
+        self._replies = itertools.count(1)
+        self._ties = itertools.count()
+        self.stats = {"queued": 0, "synthesized": 0, "dropped": 0, "claimed": 0, "failed": 0}
+
+    @property
+    def enabled(self):
+        return self.workers > 0 and audio_cache.disk_bytes > 0
+
+    def reply_rank(self):
+        """Priority of a new reply: lower sorts first, so later replies outrank earlier ones."""
+        return -next(self._replies)
+
+    def submit(self, key, text, voice, user_id, rank, index):
+        """Queue a clip unless it is cached, queued or in progress already."""
+        if not self.enabled or key in audio_cache:
+            return
+        with self._lock:
+            if key in self._pending or key in self._running:
+                return
+            job = PresynthJob(key, text, voice, user_id, (rank, index, next(self._ties)))
+            mine = [j for j in self._pending.values() if j.user_id == user_id]
+            if len(mine) >= self.per_user:
+                victim = max(mine + [job], key=lambda j: j.priority)
+            elif len(self._pending) >= self.max_queue:
+                victim = max(list(self._pending.values()) + [job], key=lambda j: j.priority)
+            else:
+                victim = None
+            if victim is not None:
+                self.stats["dropped"] += 1
+                if victim is job:
+                    return
+                self._cancel(victim)
+            self._pending[key] = job
+            heapq.heappush(self._heap, (job.priority, job))
+            self.stats["queued"] += 1
+            self._start()
+            self._ready.notify()
+
+    def _cancel(self, job):
+        # Caller holds the lock
+        job.cancelled = True
+        del self._pending[job.key]
+        job.wake.set()
+        job.done.set()
+
+    def claim(self, key):
+        """Take a clip over for a request that wants it now.
+
+        A queued job is cancelled (returns None: synthesize it yourself);
+        a running one is returned so the caller can wait on job.done.
+        """
+        with self._lock:
+            job = self._pending.get(key)
+            if job is not None:
+                self._cancel(job)
+                self.stats["claimed"] += 1
+                return None
+            return self._running.get(key)
+
+    def _start(self):
+        # Caller holds the lock
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"tts-presynth-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _work(self):
+        while True:
+            with self._ready:
+                while not self._heap:
+                    self._ready.wait()
+                _, job = heapq.heappop(self._heap)
+                if job.cancelled:
+                    continue
+            try:
+                self._synthesize(job)
+            finally:
+                with self._lock:
+                    if self._running.get(job.key) is job:
+                        del self._running[job.key]
+                job.done.set()
+
+    def _synthesize(self, job):
+        # The job stays pending (claimable) until a slot nobody else is waiting for frees up
+        try:
+            with upstream.background_limit("tts", job.user_id, job.wake):
+                with self._lock:
+                    if job.cancelled:
+                        return
+                    del self._pending[job.key]
+                    self._running[job.key] = job
+                for _ in _spill_speech(job.key, job.text, job.voice):
+                    pass
+            outcome = "synthesized"
+        except Exception as e:
+            print(f"⚠️  TTS pre-synthesis failed: {e}")
+            outcome = "failed"
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "pending": len(self._pending),
+                "running": len(self._running),
+                "workers": self.workers if self.enabled else 0,
+            }
+
+presynth = Presynthesizer(TTS_PRESYNTH_WORKERS, TTS_PRESYNTH_QUEUE, TTS_PRESYNTH_PER_USER)
+
+class ReplyAudio:
+    """Queues a tutor reply for pre-synthesis one sentence at a time.
+
+    Feed it segments as they stream in; each sentence is queued as soon as
+    its last segment arrives. finish() returns the reply's audio handle,
+    one clip per sentence, which clients play in order through /api/tts.
+    """
+
+    def __init__(self, user_id, voice):
+        self.user_id = user_id
+        self.voice = voice
+        self.rank = presynth.reply_rank()
+        self._text = ''
+        self._count = 0
+
+    def _queue(self, text, index):
+        key = cache_key(text, self.voice)
+        presynth.submit(key, text, self.voice, self.user_id, self.rank, index)
+        return {"key": key, "text": text}
+
+    def add(self, segment):
+        self._text += str(segment.get('text', ''))
+        if self._text and self._text[-1] in SENTENCE_ENDINGS:
+            if is_speakable(self._text):
+                self._queue(self._text, self._count)
+                self._count += 1
+            self._text = ''
+
+    def finish(self, segments):
+        """{"voice", "clips": [{"key", "text"}]} for the final segments, or None if pre-synthesis is off."""
+        if not presynth.enabled:
+            return None
+        return {"voice": self.voice, "clips": [self._queue(text, i) for i, text in enumerate(reply_sentences(segments))]}
+
+def is_speakable(text):
+    return any(ch.isalnum() for ch in text)
+
+def reply_sentences(segments):
+    """A reply's text split into sentences along its segments, skipping bare punctuation."""
+    sentences, text = [], ''
+    for segment in segments or []:
+        text += str(segment.get('text', ''))
+        if text and text[-1] in SENTENCE_ENDINGS:
+            sentences.append(text)
+            text = ''
+    if text:
+        sentences.append(text)
+    return [sentence for sentence in sentences if is_speakable(sentence)]
@@ -0,0 +1,354 @@
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager, asynccontextmanager
+import httpx
+import requests
+from google.api_core import retry as api_retry
+from google.api_core import retry_async as api_retry_async
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+import telemetry
+
+load_dotenv()
+
+# Max in-flight calls per upstream service, per process
+UPSTREAM_LIMITS = {
+    "gemini": int(os.getenv("GEMINI_CONCURRENCY", "64")),
+    "whisper": int(os.getenv("WHISPER_CONCURRENCY", "2")),
+    "tts": int(os.getenv("TTS_CONCURRENCY", "32")),
+}
+# Calls allowed to wait for a slot, and for how long (seconds), before we shed load
+UPSTREAM_QUEUES = {
+    "gemini": int(os.getenv("GEMINI_QUEUE_SIZE", "128")),
+    "whisper": int(os.getenv("WHISPER_QUEUE_SIZE", "8")),
+    "tts": int(os.getenv("TTS_QUEUE_SIZE", "64")),
+}
+UPSTREAM_QUEUE_TIMEOUTS = {
+    "gemini": float(os.getenv("GEMINI_QUEUE_TIMEOUT", "10")),
+    "whisper": float(os.getenv("WHISPER_QUEUE_TIMEOUT", "30")),
+    "tts": float(os.getenv("TTS_QUEUE_TIMEOUT", "10")),
+}
+# Fraction of an upstream's slots + queue one user may occupy at once
+UPSTREAM_USER_SHARE = float(os.getenv("UPSTREAM_USER_SHARE", "0.25"))
+
+# Timeouts (seconds). A hung upstream should fail the request, not pin a worker.
+WHISPER_CONNECT_TIMEOUT = float(os.getenv("WHISPER_CONNECT_TIMEOUT", "5"))
+WHISPER_READ_TIMEOUT = float(os.getenv("WHISPER_READ_TIMEOUT", "120"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+
+# Retries for connection failures and 429/5xx, with exponential backoff
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_BACKOFF = float(os.getenv("UPSTREAM_BACKOFF", "0.5"))
+RETRY_STATUSES = (429, 502, 503, 504)
+
+class Overloaded(Exception):
+    """A call was turned away by admission control.
+
+    status is 429 when the caller already holds its fair share of the
+    upstream, 503 when the upstream as a whole is saturated.
+    """
+
+    def __init__(self, upstream, status, retry_after, message):
+        super().__init__(message)
+        self.upstream = upstream
+        self.status = status
+        self.retry_after = retry_after
+
+class _Waiter:
+    __slots__ = ('user_id', 'wake', 'granted', 'background')
+
+    def __init__(self, user_id, wake, background=False):
+        self.user_id = user_id
+        self.wake = wake
+        self.granted = False
+        self.background = background
+
+class Admission:
+    """Concurrency cap plus a bounded, deadline-limited wait queue for one upstream.
+
+    Freed slots go to the queued user with the fewest calls in flight, so one
+    busy user can't starve the rest. Background work queues behind every
+    request and only gets slots nobody is waiting for. Shared by request
+    threads and the event loop: threads wait on an Event, coroutines on a Future.
+    """
+
+    def __init__(self, name, capacity, max_queue, max_wait, user_share):
+        self.name = name
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.per_user = max(2, int((capacity + max_queue) * user_share))
+        self._lock = threading.Lock()
+        self._active = 0
+        self._active_by_user = {}
+        self._queues = OrderedDict()  # user_id -> deque of _Waiter, oldest user first
+        self._waiting = 0
+        self._background = deque()  # _Waiter for background work, oldest first
+        self._service_time = 1.0  # EWMA of seconds a slot is held
+        self.stats = {"admitted": 0, "queued": 0, "rejected_user": 0, "rejected_queue": 0, "timed_out": 0}
+
+    def retry_after(self):
+        # Caller holds the lock. Rough time for the current queue to drain.
+        return max(1, math.ceil(self._service_time * (self._waiting / self.capacity + 1)))
+
+    def _reject(self, status, stat, message):
+        self.stats[stat] += 1
+        return Overloaded(self.name, status, self.retry_after(), message)
+
+    def _enter(self, user_id, wake):
+        """Take a slot now (returns None) or join the queue (returns the waiter)."""
+        with self._lock:
+            if user_id is not None:
+                held = self._active_by_user.get(user_id, 0) + len(self._queues.get(user_id, ()))
+                if held >= self.per_user:
+                    raise self._reject(429, "rejected_user", f"Too many {self.name} requests in progress for this user")
+            if self._active < self.capacity and not self._waiting:
+                self._grant(user_id)
+                return None
+            if self._waiting >= self.max_queue:
+                raise self._reject(503, "rejected_queue", f"The {self.name} service is busy, try again shortly")
+            waiter = _Waiter(user_id, wake)
+            self._queues.setdefault(user_id, deque()).append(waiter)
+            self._waiting += 1
+            self.stats["queued"] += 1
+            return waiter
+
+    def _abandon(self, waiter):
+        """Leave the queue after a timeout or cancellation. True if a slot was granted anyway."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            if waiter.background:
+                self._background.remove(waiter)
+                return False
+            queue = self._queues[waiter.user_id]
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.user_id]
+            self._waiting -= 1
+            return False
+
+    def _grant(self, user_id):
+        # Caller holds the lock
+        self._active += 1
+        self._active_by_user[user_id] = self._active_by_user.get(user_id, 0) + 1
+        self.stats["admitted"] += 1
+
+    def release(self, user_id, held_for):
+        with self._lock:
+            self._active -= 1
+            remaining = self._active_by_user[user_id] - 1
+            if remaining:
+                self._active_by_user[user_id] = remaining
+            else:
+                del self._active_by_user[user_id]
+            self._service_time += 0.2 * (held_for - self._service_time)
+
+            while self._active < self.capacity and self._waiting:
+                # Fair share: the waiting user with the fewest calls in flight goes next
+                user = min(self._queues, key=lambda u: self._active_by_user.get(u, 0))
+                queue = self._queues[user]
+                waiter = queue.popleft()
+                if not queue:
+                    del self._queues[user]
+                else:
+                    # Round-robin among users with equal share
+                    self._queues.move_to_end(user)
+                self._waiting -= 1
+                waiter.granted = True
+                self._grant(user)
+                waiter.wake()
+
+            while self._active < self.capacity and not self._waiting and self._background:
+                waiter = self._background.popleft()
+                waiter.granted = True
+                self._grant(waiter.user_id)
+                waiter.wake()
+
+    def acquire(self, user_id=None):
+        event = threading.Event()
+        waiter = self._enter(user_id, event.set)
+        if waiter is None or event.wait(self.max_wait) or self._abandon(waiter):
+            return
+        with self._lock:
+            raise self._reject(503, "timed_out", f"Timed out waiting for the {self.name} service")
+
+    def acquire_background(self, user_id, wake):
+        """Wait, with no deadline, for a slot no request is queued for.
+
+        `wake` is a threading.Event the caller may also set to give up.
+        Returns whether the slot is held; never raises Overloaded.
+        """
+        with self._lock:
+            if self._active < self.capacity and not self._waiting and not self._background:
+                self._grant(user_id)
+                return True
+            waiter = _Waiter(user_id, wake.set, background=True)
+            self._background.append(waiter)
+        wake.wait()
+        return self._abandon(waiter)
+
+    async def acquire_async(self, user_id=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enter(user_id, wake)
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except asyncio.TimeoutError:
+            if self._abandon(waiter):
+                return
+            with self._lock:
+                raise self._reject(503, "timed_out", f"Timed out waiting for the {self.name} service")
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self.release(user_id, 0.0)
+            raise
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "active": self._active,
+                "waiting": self._waiting,
+                "background": len(self._background),
+                "capacity": self.capacity,
+                "retry_after": self.retry_after(),
+            }
+
+admissions = {
+    name: Admission(name, capacity, UPSTREAM_QUEUES[name], UPSTREAM_QUEUE_TIMEOUTS[name], UPSTREAM_USER_SHARE)
+    for name, capacity in UPSTREAM_LIMITS.items()
+}
+
+@contextmanager
+def limit(upstream, user_id=None):
+    """Hold one of the upstream's slots (blocking threads); raises Overloaded if refused."""
+    admission = admissions[upstream]
+    queued = time.monotonic()
+    admission.acquire(user_id)
+    started = time.monotonic()
+    telemetry.record(f"{upstream}_queue", started - queued)
+    try:
+        yield
+    finally:
+        held = time.monotonic() - started
+        admission.release(user_id, held)
+        telemetry.record(upstream, held)
+
+@asynccontextmanager
+async def alimit(upstream, user_id=None):
+    """Hold one of the upstream's slots (awaiting on the event loop); raises Overloaded if refused."""
+    admission = admissions[upstream]
+    queued = time.monotonic()
+    await admission.acquire_async(user_id)
+    started = time.monotonic()
+    telemetry.record(f"{upstream}_queue", started - queued)
+    try:
+        yield
+    finally:
+        held = time.monotonic() - started
+        admission.release(user_id, held)
+        telemetry.record(upstream, held)
+
+@contextmanager
+def background_limit(upstream, user_id, wake):
+    """Hold one of the upstream's slots at the lowest priority (see Admission.acquire_background).
+
+    Yields whether the slot was granted; False once the caller set `wake` to give up.
+    """
+    admission = admissions[upstream]
+    if not admission.acquire_background(user_id, wake):
+        yield False
+        return
+    started = time.monotonic()
+    try:
+        yield True
+    finally:
+        held = time.monotonic() - started
+        admission.release(user_id, held)
+        telemetry.record(upstream, held)
+
+def admission_stats():
+    return {name: admission.snapshot() for name, admission in admissions.items()}
+
+# ==================== SHARED CLIENTS ====================
+
+_whisper_session = None
+_session_lock = threading.Lock()
+
+def whisper_timeout():
+    return (WHISPER_CONNECT_TIMEOUT, WHISPER_READ_TIMEOUT)
+
+def get_whisper_session():
+    """Keep-alive HTTP session for Whisper, shared across request threads."""
+    global _whisper_session
+    with _session_lock:
+        if _whisper_session is None:
+            retry = Retry(
+                total=UPSTREAM_RETRIES,
+                backoff_factor=UPSTREAM_BACKOFF,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=None,  # /asr is a pure function of the upload, safe to repeat
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=UPSTREAM_LIMITS["whisper"],
+                max_retries=retry
+            )
+            _whisper_session = requests.Session()
+            _whisper_session.mount("http://", adapter)
+            _whisper_session.mount("https://", adapter)
+        return _whisper_session
+
+def create_async_whisper_client():
+    """Pooled async client for Whisper; owned by the ASGI app's lifespan."""
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(WHISPER_READ_TIMEOUT, connect=WHISPER_CONNECT_TIMEOUT),
+        transport=httpx.AsyncHTTPTransport(
+            retries=UPSTREAM_RETRIES,
+            limits=httpx.Limits(max_connections=UPSTREAM_LIMITS["whisper"])
+        )
+    )
+
+def gemini_request_options(stream=False):
+    """Timeout and retry policy for Gemini calls.
+
+    Streams are not retried: once segments have been sent to the client,
+    starting the reply over would duplicate them.
+    """
+    if stream:
+        return {"timeout": GEMINI_TIMEOUT}
+    return {
+        "timeout": GEMINI_TIMEOUT,
+        "retry": api_retry.Retry(
+            initial=UPSTREAM_BACKOFF,
+            multiplier=2,
+            timeout=GEMINI_TIMEOUT,
+            predicate=api_retry.if_transient_error
+        )
+    }
+
+def gemini_request_options_async(stream=False):
+    if stream:
+        return {"timeout": GEMINI_TIMEOUT}
+    return {
+        "timeout": GEMINI_TIMEOUT,
+        "retry": api_retry_async.AsyncRetry(
+            initial=UPSTREAM_BACKOFF,
+            multiplier=2,
+            timeout=GEMINI_TIMEOUT,
+            predicate=api_retry.if_transient_error
+        )
+    }
@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from psycopg2.extras import RealDictCursor
+from dotenv import load_dotenv
+from database import db_connection, is_db_available
+
+load_dotenv()
+
+# Number of known words sent to the tutor per turn
+VOCAB_CONTEXT_SIZE = int(os.getenv("VOCAB_CONTEXT_SIZE", "40"))
+# How long a user's vocab list is reused before re-reading it
+VOCAB_CACHE_TTL = int(os.getenv("VOCAB_CACHE_TTL", "300"))
+VOCAB_CACHE_USERS = int(os.getenv("VOCAB_CACHE_USERS", "2000"))
+
+def is_content_char(ch):
+    """Kanji and katakana carry meaning on their own; hiragana mostly doesn't."""
+    return '一' <= ch <= '鿿' or '゠' <= ch <= 'ヿ'
+
+class VocabEntry:
+    __slots__ = ('term', 'reading', 'mastery', 'added_at', 'chars')
+
+    def __init__(self, term, reading, mastery, added_at):
+        self.term = term
+        self.reading = reading or ''
+        self.mastery = mastery or 1
+        self.added_at = added_at or 0
+        self.chars = {ch for ch in term if is_content_char(ch)}
+
+def score_entry(entry, message, message_chars):
+    score = 0.0
+    if entry.term in message:
+        score += 3.0
+    elif entry.reading and len(entry.reading) > 1 and entry.reading in message:
+        # Learner typed the word in kana
+        score += 2.0
+    if entry.chars:
+        score += len(entry.chars & message_chars) / len(entry.chars)
+    # Better-known words are safer for the tutor to lean on
+    score += min(entry.mastery, 5) * 0.05
+    return score
+
+def rank_vocab(message, entries, limit=VOCAB_CONTEXT_SIZE):
+    """Pick the `limit` entries most relevant to the message, newest first on ties."""
+    message_chars = {ch for ch in message if is_content_char(ch)}
+    ranked = sorted(
+        entries,
+        key=lambda e: (score_entry(e, message, message_chars), e.added_at),
+        reverse=True
+    )
+    return ranked[:limit]
+
+class UserVocabCache:
+    """Per-user vocab lists for prompt building, bounded LRU with a TTL."""
+
+    def __init__(self, max_users, ttl):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._users = OrderedDict()  # user_id -> (expires_at, [VocabEntry])
+
+    def get(self, user_id):
+        with self._lock:
+            cached = self._users.get(user_id)
+            if cached and cached[0] > time.time():
+                self._users.move_to_end(user_id)
+                return cached[1]
+
+        entries = self._load(user_id)
+        with self._lock:
+            self._users[user_id] = (time.time() + self.ttl, entries)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return entries
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def _load(self, user_id):
+        with db_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(
+                    "SELECT term, reading, mastery, added_at FROM vocab WHERE user_id = %s",
+                    (user_id,)
+                )
+                rows = cur.fetchall()
+        return [VocabEntry(r['term'], r['reading'], r['mastery'], r['added_at']) for r in rows]
+
+user_vocab_cache = UserVocabCache(VOCAB_CACHE_USERS, VOCAB_CACHE_TTL)
+
+def build_vocab_context(user_id, message, fallback=''):
+    """Comma-separated known words most relevant to this message.
+
+    Falls back to whatever the client sent when the database is unavailable.
+    """
+    if not is_db_available():
+        return fallback
+    entries = user_vocab_cache.get(user_id)
+    return ', '.join(e.term for e in rank_vocab(message, entries))
@@ -1,21 +1,22 @@
 import React, { useState, useEffect } from 'react';
-import { Menu, ChevronLeft, MessageSquare, BookOpen, Settings, Mic, Square, Send, WifiOff, LogOut, Loader2 } from 'lucide-react';
+import { Menu, ChevronLeft, MessageSquare, BookOpen, Repeat, Settings, Mic, Square, Send, WifiOff, LogOut, Loader2 } from 'lucide-react';
 
 // Components
 import Sidebar from './components/Sidebar';
 import ChatArea from './components/ChatArea';
 import WordInspector from './components/WordInspector';
 import KnowledgePanel from './components/KnowledgePanel';
+import ReviewPanel from './components/ReviewPanel';
 import SettingsPanel from './components/SettingsPanel';
 import AuthPage from './components/AuthPage';
 
 // Context & Services
 import { useAuth } from './context/AuthContext';
 import { 
-  fetchGeminiReply, 
-  fetchSettings, saveSettings,
-  fetchSessions, saveSession, deleteSession as apiDeleteSession,
-  fetchVocab, saveVocabItem
+  streamGeminiReply, 
+  syncUserData, saveSettings,
+  fetchSessions, fetchSession, saveSession, appendSessionMessages, deleteSession as apiDeleteSession,
+  saveVocabItem, saveVocabBatch
 } from './services/api';
 
 // Constants
@@ -31,6 +32,7 @@ function JapaneseTutorApp() {
   const [settings, setSettings] = useState(DEFAULT_SETTINGS);
   const [knownVocab, setKnownVocab] = useState([]);
   const [sessions, setSessions] = useState([]);
+  const [sessionsCursor, setSessionsCursor] = useState(null);
   const [activeSessionId, setActiveSessionId] = useState(null);
   const [dataLoading, setDataLoading] = useState(true);
   
@@ -55,14 +57,13 @@ function JapaneseTutorApp() {
   const loadUserData = async () => {
     setDataLoading(true);
     try {
-      const [settingsData, sessionsData, vocabData] = await Promise.all([
-        fetchSettings(),
-        fetchSessions(),
-        fetchVocab()
-      ]);
+      // Only what changed since the last visit comes over the wire
+      const { settings: settingsData, sessions: sessionsData, vocab: vocabData } = await syncUserData(user.id);
       
       setSettings({ ...DEFAULT_SETTINGS, ...settingsData });
       setKnownVocab(vocabData);
+      // The synced list is complete, so there are no further pages
+      setSessionsCursor(null);
       
       if (sessionsData.length > 0) {
         setSessions(sessionsData);
@@ -98,6 +99,44 @@ function JapaneseTutorApp() {
 
   const activeSession = sessions.find(s => s.id === activeSessionId) || sessions[0];
 
+  // Messages are loaded lazily when a session is opened
+  useEffect(() => {
+    if (activeSession && !activeSession.messages) {
+      loadSessionMessages(activeSession.id);
+    }
+  }, [activeSession?.id]);
+
+  const loadSessionMessages = async (id, before = null) => {
+    try {
+      const data = await fetchSession(id, before);
+      setSessions(prev => prev.map(s => s.id === id ? {
+        ...s,
+        messages: before !== null ? [...data.messages, ...(s.messages || [])] : data.messages,
+        firstPosition: data.firstPosition,
+        hasMoreMessages: data.hasMore
+      } : s));
+    } catch (e) {
+      console.error('Failed to load messages:', e);
+    }
+  };
+
+  const handleLoadEarlierMessages = () => {
+    if (activeSession?.hasMoreMessages) {
+      loadSessionMessages(activeSession.id, activeSession.firstPosition);
+    }
+  };
+
+  const handleLoadMoreSessions = async () => {
+    if (!sessionsCursor) return;
+    try {
+      const page = await fetchSessions(sessionsCursor);
+      setSessions(prev => [...prev, ...page.sessions.filter(p => !prev.some(s => s.id === p.id))]);
+      setSessionsCursor(page.nextCursor);
+    } catch (e) {
+      console.error('Failed to load sessions:', e);
+    }
+  };
+
   // --- Handlers ---
 
   const handleCreateSession = async () => {
@@ -174,13 +213,14 @@ function JapaneseTutorApp() {
   };
 
   const handleSend = async () => {
-    if (!inputText.trim()) return;
+    if (!inputText.trim() || !activeSession?.messages) return;
     const text = inputText;
     setInputText('');
     setTranscript('');
     
     // Add User Message
-    const updatedMessages = [...activeSession.messages, { role: 'user', content: text }];
+    const userMessage = { role: 'user', content: text };
+    const updatedMessages = [...activeSession.messages, userMessage];
     const updatedSessions = sessions.map(s => 
       s.id === activeSessionId ? { ...s, messages: updatedMessages } : s
     );
@@ -188,7 +228,13 @@ function JapaneseTutorApp() {
     setIsProcessing(true);
 
     try {
-      const reply = await fetchGeminiReply(text, settings, knownVocab);
+      // Show segments as they stream in
+      const reply = await streamGeminiReply(text, settings, (_, segments) => {
+        const partialMessages = [...updatedMessages, { role: 'assistant', content: { segments: [...segments], english: '', grammar_point: null } }];
+        setSessions(prev => prev.map(s => 
+          s.id === activeSessionId ? { ...s, messages: partialMessages } : s
+        ));
+      }, activeSessionId);
       
       // Auto-Add Vocab Logic
       let updatedVocab = [...knownVocab];
@@ -210,28 +256,27 @@ function JapaneseTutorApp() {
         if (newWords.length > 0) {
           updatedVocab = [...newWords, ...updatedVocab];
           setKnownVocab(updatedVocab);
-          // Save new vocab items
-          for (const word of newWords) {
-            try {
-              await saveVocabItem(word);
-            } catch (e) {
-              console.error('Failed to save vocab:', e);
-            }
+          // Save new vocab items in one request
+          try {
+            await saveVocabBatch(newWords);
+          } catch (e) {
+            console.error('Failed to save vocab:', e);
           }
         }
       }
 
       // Update Session with AI Message
-      const finalMessages = [...updatedMessages, { role: 'assistant', content: reply }];
+      const assistantMessage = { role: 'assistant', content: reply };
+      const finalMessages = [...updatedMessages, assistantMessage];
       const finalSession = { ...activeSession, messages: finalMessages };
       const finalSessions = sessions.map(s => 
         s.id === activeSessionId ? finalSession : s
       );
       setSessions(finalSessions);
       
-      // Save session
+      // Save only the new turn
       try {
-        await saveSession(finalSession);
+        await appendSessionMessages(activeSessionId, [userMessage, assistantMessage]);
       } catch (e) {
         console.error('Failed to save session:', e);
       }
@@ -287,6 +332,8 @@ function JapaneseTutorApp() {
         onSelectSession={(id) => { setActiveSessionId(id); setActiveTab('chat'); if(window.innerWidth<768) setSidebarOpen(false); }}
         onCreateSession={handleCreateSession}
         onDeleteSession={handleDeleteSession}
+        hasMore={!!sessionsCursor}
+        onLoadMore={handleLoadMoreSessions}
         user={user}
         onLogout={logout}
       />
@@ -303,9 +350,10 @@ function JapaneseTutorApp() {
              <div><h1 className="font-bold text-lg text-gray-800">{activeSession ? safeString(activeSession.title) : 'J-Tutor'}</h1><p className="text-xs text-gray-500">{settings.targetLevel}</p></div>
           </div>
           <div className="flex bg-gray-100 p-1 rounded-lg">
-            {['chat', 'knowledge', 'settings'].map(tab => (
+            {['chat', 'review', 'knowledge', 'settings'].map(tab => (
               <button key={tab} onClick={() => setActiveTab(tab)} className={`flex items-center gap-2 px-3 py-1.5 rounded-md text-sm font-medium transition-all ${activeTab === tab ? 'bg-white shadow-sm text-indigo-600' : 'text-gray-500 hover:text-gray-700'}`}>
                 {tab === 'chat' && <MessageSquare size={16} />}
+                {tab === 'review' && <Repeat size={16} />}
                 {tab === 'knowledge' && <BookOpen size={16} />}
                 {tab === 'settings' && <Settings size={16} />}
                 <span className="capitalize hidden sm:inline">{tab}</span>
@@ -315,13 +363,20 @@ function JapaneseTutorApp() {
         </header>
 
         {/* Tab Views */}
-        {activeTab === 'chat' && activeSession && (
+        {activeTab === 'chat' && activeSession && !activeSession.messages && (
+          <div className="flex-1 flex items-center justify-center">
+            <Loader2 size={24} className="animate-spin text-indigo-600" />
+          </div>
+        )}
+
+        {activeTab === 'chat' && activeSession?.messages && (
           <>
             <ChatArea 
               activeSession={activeSession} 
               settings={settings} 
               isProcessing={isProcessing} 
               onWordClick={(seg, context) => setInspectedWord({ data: seg, originSegments: context })} 
+              onLoadEarlier={handleLoadEarlierMessages}
             />
             {/* Input Area */}
             <div className="bg-white p-4 border-t shrink-0">
@@ -351,6 +406,7 @@ function JapaneseTutorApp() {
           </>
         )}
 
+        {activeTab === 'review' && <ReviewPanel />}
         {activeTab === 'knowledge' && <KnowledgePanel knownVocab={knownVocab} onAddManual={handleManualAdd} />}
         {activeTab === 'settings' && <SettingsPanel settings={settings} setSettings={updateSettings} />}
       </div>
@@ -50,7 +50,7 @@ const InteractiveSentence = ({ segments, onWordClick, furiganaMode }) => {
   );
 };
 
-const ChatArea = ({ activeSession, settings, isProcessing, onWordClick }) => {
+const ChatArea = ({ activeSession, settings, isProcessing, onWordClick, onLoadEarlier }) => {
   const scrollRef = useRef(null);
   const { speak, stop, isSpeaking, speakingId } = useTTS();
   
@@ -58,16 +58,23 @@ const ChatArea = ({ activeSession, settings, isProcessing, onWordClick }) => {
     scrollRef.current?.scrollIntoView({ behavior: "smooth" });
   }, [activeSession.messages]);
 
-  const handleSpeak = (text, messageId) => {
+  const handleSpeak = (text, messageId, audio) => {
     if (isSpeaking && speakingId === messageId) {
       stop();
     } else {
-      speak(text, settings.ttsVoice, messageId);
+      speak(text, settings.ttsVoice, messageId, audio);
     }
   };
 
   return (
     <div className="flex-1 overflow-y-auto p-4 space-y-6">
+      {activeSession.hasMoreMessages && (
+        <div className="flex justify-center">
+          <button onClick={onLoadEarlier} className="text-xs text-indigo-600 hover:text-indigo-800 font-medium px-3 py-1.5 rounded-full bg-indigo-50 hover:bg-indigo-100 transition-colors">
+            Load earlier messages
+          </button>
+        </div>
+      )}
       {activeSession.messages.map((msg, idx) => {
         const messageId = `msg-${idx}`;
         const isThisPlaying = isSpeaking && speakingId === messageId;
@@ -104,7 +111,7 @@ const ChatArea = ({ activeSession, settings, isProcessing, onWordClick }) => {
                           }
                         </div>
                         <button 
-                          onClick={() => handleSpeak(reconstructSentence(msg.content?.segments || []), messageId)}
+                          onClick={() => handleSpeak(reconstructSentence(msg.content?.segments || []), messageId, msg.content?.audio)}
                           className={`p-1.5 rounded-full transition-all ${
                             isThisPlaying 
                               ? 'bg-indigo-600 text-white shadow-lg shadow-indigo-200 animate-pulse' 
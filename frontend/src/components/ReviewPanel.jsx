@@ -0,0 +1,113 @@
+import React, { useState, useEffect, useRef } from 'react';
+import { Repeat, Loader2, CheckCircle } from 'lucide-react';
+import { safeString } from '../constants';
+import { fetchDueCards, submitReviewGrades } from '../services/api';
+
+const GRADE_BUTTONS = [
+  { grade: 1, label: 'Again', className: 'bg-red-500 hover:bg-red-600' },
+  { grade: 2, label: 'Hard', className: 'bg-orange-500 hover:bg-orange-600' },
+  { grade: 3, label: 'Good', className: 'bg-green-600 hover:bg-green-700' },
+  { grade: 4, label: 'Easy', className: 'bg-indigo-600 hover:bg-indigo-700' },
+];
+
+// Grades are sent together once the batch is finished (or the panel closes)
+const ReviewPanel = () => {
+  const [cards, setCards] = useState([]);
+  const [index, setIndex] = useState(0);
+  const [revealed, setRevealed] = useState(false);
+  const [loading, setLoading] = useState(true);
+  const [reviewedCount, setReviewedCount] = useState(0);
+  const pending = useRef([]);
+
+  const flush = async () => {
+    const grades = pending.current;
+    pending.current = [];
+    if (grades.length === 0) return;
+    try {
+      await submitReviewGrades(grades);
+    } catch (e) {
+      console.error('Failed to save review grades:', e);
+      pending.current = [...grades, ...pending.current];
+    }
+  };
+
+  const loadBatch = async () => {
+    setLoading(true);
+    try {
+      await flush();
+      const { cards: due } = await fetchDueCards();
+      setCards(due);
+      setIndex(0);
+      setRevealed(false);
+    } catch (e) {
+      console.error('Failed to load review cards:', e);
+    }
+    setLoading(false);
+  };
+
+  useEffect(() => {
+    loadBatch();
+    return () => { flush(); };
+  }, []);
+
+  const handleGrade = (grade) => {
+    pending.current.push({ id: cards[index].id, grade, reviewedAt: Date.now() });
+    setReviewedCount(c => c + 1);
+    if (index + 1 < cards.length) {
+      setIndex(index + 1);
+      setRevealed(false);
+    } else {
+      loadBatch();
+    }
+  };
+
+  const card = cards[index];
+
+  return (
+    <div className="flex-1 overflow-y-auto p-4 bg-gray-50 flex items-center justify-center">
+      <div className="bg-white rounded-xl shadow-sm border border-gray-100 w-full max-w-md p-6">
+        <div className="flex justify-between items-center mb-6">
+          <h2 className="font-bold text-gray-700 flex items-center gap-2"><Repeat size={16} /> Review</h2>
+          <span className="text-xs font-mono bg-gray-50 border px-2 py-1 rounded text-gray-500">{reviewedCount} reviewed</span>
+        </div>
+
+        {loading ? (
+          <div className="flex justify-center py-12 text-gray-400"><Loader2 className="animate-spin" /></div>
+        ) : !card ? (
+          <div className="flex flex-col items-center gap-2 py-12 text-gray-500">
+            <CheckCircle size={32} className="text-green-500" />
+            <p className="font-medium">Nothing due right now.</p>
+          </div>
+        ) : (
+          <>
+            <div className="text-center py-8">
+              <div className="text-4xl font-bold text-gray-800">{safeString(card.term)}</div>
+              {revealed && (
+                <div className="mt-4 space-y-1">
+                  {card.reading && <div className="text-lg text-gray-500">{safeString(card.reading)}</div>}
+                  <div className="text-lg text-gray-800 font-medium">{safeString(card.meaning)}</div>
+                  {card.examples?.[0] && <div className="text-sm text-gray-500 italic">"{safeString(card.examples[0])}"</div>}
+                </div>
+              )}
+            </div>
+            {revealed ? (
+              <div className="grid grid-cols-4 gap-2">
+                {GRADE_BUTTONS.map(({ grade, label, className }) => (
+                  <button key={grade} onClick={() => handleGrade(grade)} className={`py-2 rounded-lg text-white text-sm font-bold ${className}`}>
+                    {label}
+                  </button>
+                ))}
+              </div>
+            ) : (
+              <button onClick={() => setRevealed(true)} className="w-full py-3 rounded-lg font-bold bg-gray-900 text-white">
+                Show Answer
+              </button>
+            )}
+          </>
+        )}
+      </div>
+    </div>
+  );
+};
+
+export default ReviewPanel;
@@ -1,8 +1,9 @@
 import React from 'react';
 import { Brain, PlusCircle, MessageSquare, X, LogOut, User } from 'lucide-react';
 import { APP_VERSION, safeString } from '../constants';
+import SidebarSearch from './SidebarSearch';
 
-const Sidebar = ({ sessions, activeSessionId, isOpen, onSelectSession, onCreateSession, onDeleteSession, user, onLogout }) => (
+const Sidebar = ({ sessions, activeSessionId, isOpen, onSelectSession, onCreateSession, onDeleteSession, hasMore, onLoadMore, user, onLogout }) => (
   <div className={`
     ${isOpen ? 'w-64' : 'w-0'} bg-gray-900 text-gray-300 transition-all duration-300 ease-in-out overflow-hidden flex flex-col border-r border-gray-800
     absolute md:relative z-20 h-full shadow-xl
@@ -35,6 +36,7 @@ const Sidebar = ({ sessions, activeSessionId, isOpen, onSelectSession, onCreateS
       <button onClick={onCreateSession} className="w-full flex items-center gap-2 p-3 bg-gray-800 hover:bg-gray-700 text-white rounded-lg mb-4 transition-colors text-sm font-medium">
         <PlusCircle size={16} /> New Chat
       </button>
+      <SidebarSearch onSelectSession={onSelectSession} />
       <div className="text-xs font-semibold text-gray-500 uppercase px-3 mb-2">History</div>
       {sessions.map(s => (
         <div 
@@ -53,6 +55,11 @@ const Sidebar = ({ sessions, activeSessionId, isOpen, onSelectSession, onCreateS
           )}
         </div>
       ))}
+      {hasMore && (
+        <button onClick={onLoadMore} className="w-full p-2 text-xs text-gray-500 hover:text-white hover:bg-gray-800 rounded-lg transition-colors">
+          Load more
+        </button>
+      )}
     </div>
     <div className="p-4 border-t border-gray-800 shrink-0 text-xs text-gray-500 flex justify-between">
        <span>{APP_VERSION}</span>
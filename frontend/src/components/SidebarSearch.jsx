@@ -0,0 +1,73 @@
+import React, { useState, useEffect } from 'react';
+import { Search, MessageSquare, BookOpen } from 'lucide-react';
+import { safeString } from '../constants';
+import { searchUserData } from '../services/api';
+
+const SEARCH_DELAY_MS = 300;
+
+// Searches vocab and past conversations; picking a message opens its session
+const SidebarSearch = ({ onSelectSession }) => {
+  const [query, setQuery] = useState('');
+  const [results, setResults] = useState(null);
+
+  useEffect(() => {
+    const q = query.trim();
+    if (!q) {
+      setResults(null);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const data = await searchUserData(q);
+        if (!cancelled) setResults(data);
+      } catch (e) {
+        console.error('Search failed:', e);
+      }
+    }, SEARCH_DELAY_MS);
+    return () => { cancelled = true; clearTimeout(timer); };
+  }, [query]);
+
+  return (
+    <div className="mb-4">
+      <div className="flex items-center gap-2 px-3 py-2 bg-gray-800 rounded-lg">
+        <Search size={14} className="text-gray-500 shrink-0" />
+        <input
+          value={query}
+          onChange={(e) => setQuery(e.target.value)}
+          placeholder="Search words & chats"
+          className="bg-transparent text-sm text-white placeholder-gray-500 outline-none w-full"
+        />
+      </div>
+      {results && (
+        <div className="mt-2 space-y-1">
+          {results.vocab.length === 0 && results.messages.length === 0 && (
+            <div className="px-3 py-2 text-xs text-gray-500">No matches</div>
+          )}
+          {results.vocab.map(v => (
+            <div key={v.id} className="flex items-center gap-2 px-3 py-2 text-sm rounded-lg">
+              <BookOpen size={12} className="shrink-0 text-gray-500" />
+              <span className="text-white">{safeString(v.term)}</span>
+              <span className="truncate text-xs text-gray-500">{safeString(v.meaning)}</span>
+            </div>
+          ))}
+          {results.messages.map(m => (
+            <div
+              key={`${m.sessionId}:${m.position}`}
+              onClick={() => { onSelectSession(m.sessionId); setQuery(''); }}
+              className="px-3 py-2 text-sm rounded-lg cursor-pointer hover:bg-gray-800"
+            >
+              <div className="flex items-center gap-2 text-xs text-gray-500">
+                <MessageSquare size={12} className="shrink-0" />
+                <span className="truncate">{safeString(m.sessionTitle)}</span>
+              </div>
+              <div className="truncate text-gray-300">{safeString(m.snippet)}</div>
+            </div>
+          ))}
+        </div>
+      )}
+    </div>
+  );
+};
+
+export default SidebarSearch;
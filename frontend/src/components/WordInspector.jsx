@@ -1,12 +1,25 @@
-import React from 'react';
-import { X, Lightbulb, Check, Plus } from 'lucide-react';
+import React, { useEffect, useState } from 'react';
+import { X, Lightbulb, Check, Plus, BookOpen } from 'lucide-react';
 import { safeString, reconstructSentence } from '../constants';
+import { lookupDictionary } from '../services/api';
 
 const WordInspector = ({ inspectedWord, knownVocab, onAddToVocab, onClose }) => {
+  const term = inspectedWord ? safeString(inspectedWord.data.text) : '';
+  const [entries, setEntries] = useState([]);
+
+  useEffect(() => {
+    setEntries([]);
+    if (!term) return;
+    let cancelled = false;
+    lookupDictionary(term)
+      .then(result => { if (!cancelled) setEntries(result.entries || []); })
+      .catch(() => {}); // The tutor's own meaning is still shown
+    return () => { cancelled = true; };
+  }, [term]);
+
   if (!inspectedWord) return null;
   
   const { data, originSegments } = inspectedWord;
-  const term = safeString(data.text);
   const reading = safeString(data.reading);
   const meaning = safeString(data.meaning);
   const explanation = safeString(data.explanation);
@@ -37,6 +50,32 @@ const WordInspector = ({ inspectedWord, knownVocab, onAddToVocab, onClose }) =>
               </div>
             )}
           </div>
+          {entries.length > 0 && (
+            <div>
+              <h3 className="flex items-center gap-1.5 text-sm font-bold text-gray-400 uppercase tracking-wide mb-2">
+                <BookOpen size={14} /> Dictionary
+              </h3>
+              <div className="space-y-3 max-h-48 overflow-y-auto">
+                {entries.slice(0, 3).map(entry => (
+                  <div key={entry.id} className="text-sm">
+                    <div className="font-medium text-gray-800">
+                      {[...entry.kanji, ...entry.readings].slice(0, 3).join('・')}
+                    </div>
+                    <ol className="list-decimal list-inside text-gray-600">
+                      {entry.senses.slice(0, 3).map((sense, i) => (
+                        <li key={i}>{sense.glosses.join('; ')}</li>
+                      ))}
+                    </ol>
+                    {entry.examples?.slice(0, 1).map((example, i) => (
+                      <div key={i} className="mt-1 text-xs text-gray-500">
+                        {example.japanese} <span className="italic">{example.english}</span>
+                      </div>
+                    ))}
+                  </div>
+                ))}
+              </div>
+            </div>
+          )}
           <div>
             <h3 className="text-sm font-bold text-gray-400 uppercase tracking-wide mb-2">Context</h3>
             <div className="bg-gray-50 p-3 rounded-lg text-sm text-gray-600 italic border border-gray-100">"{fullSentence}"</div>
@@ -1,4 +1,5 @@
 import React, { createContext, useContext, useState, useEffect } from 'react';
+import { clearSyncState } from '../services/api';
 
 const AuthContext = createContext(null);
 
@@ -79,6 +80,8 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    // Don't leave this user's synced data on a shared machine
+    if (user) clearSyncState(user.id);
     localStorage.removeItem('token');
     setToken(null);
     setUser(null);
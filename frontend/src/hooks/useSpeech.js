@@ -1,68 +1,186 @@
 import { useState, useRef, useCallback } from 'react';
 
+const SAMPLE_RATE = 16000;
+
+// Converts mic input to 16-bit PCM and posts it to the main thread in ~100ms blocks
+const PCM_WORKLET = `
+class PcmCapture extends AudioWorkletProcessor {
+  constructor() {
+    super();
+    this.buffer = new Int16Array(1600);
+    this.length = 0;
+  }
+  process(inputs) {
+    const channel = inputs[0] && inputs[0][0];
+    if (channel) {
+      for (let i = 0; i < channel.length; i++) {
+        const s = Math.max(-1, Math.min(1, channel[i]));
+        this.buffer[this.length++] = s < 0 ? s * 0x8000 : s * 0x7fff;
+        if (this.length === this.buffer.length) {
+          this.port.postMessage(this.buffer.slice().buffer);
+          this.length = 0;
+        }
+      }
+    }
+    return true;
+  }
+}
+registerProcessor('pcm-capture', PcmCapture);
+`;
+
+const canStream = () =>
+  typeof WebSocket !== 'undefined' && typeof AudioWorkletNode !== 'undefined';
+
+const streamUrl = () => {
+  const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+  return `${protocol}//${window.location.host}/api/transcribe/stream`;
+};
+
 const useSpeech = () => {
   const [isListening, setIsListening] = useState(false);
   const [transcript, setTranscript] = useState('');
   const [isSupported, setIsSupported] = useState(true);
   const mediaRecorderRef = useRef(null);
   const chunksRef = useRef([]);
+  const liveRef = useRef(null);
+
+  // Upload the whole recording once it stops (used when streaming isn't available)
+  const startRecorder = useCallback((stream) => {
+    const mediaRecorder = new MediaRecorder(stream, { mimeType: 'audio/webm' });
+    mediaRecorderRef.current = mediaRecorder;
+    chunksRef.current = [];
+
+    mediaRecorder.ondataavailable = (e) => {
+      if (e.data.size > 0) {
+        chunksRef.current.push(e.data);
+      }
+    };
+
+    mediaRecorder.onstop = async () => {
+      stream.getTracks().forEach(track => track.stop());
+      const audioBlob = new Blob(chunksRef.current, { type: 'audio/webm' });
+
+      try {
+        const formData = new FormData();
+        formData.append('audio', audioBlob, 'recording.webm');
+
+        const token = localStorage.getItem('token');
+        const response = await fetch('/api/transcribe', {
+          method: 'POST',
+          headers: {
+            ...(token && { 'Authorization': `Bearer ${token}` })
+          },
+          body: formData
+        });
+
+        if (response.ok) {
+          const data = await response.json();
+          setTranscript(data.text || '');
+        } else {
+          console.error('Transcription failed:', response.status);
+        }
+      } catch (err) {
+        console.error('Failed to transcribe:', err);
+      }
+    };
+
+    mediaRecorder.start();
+  }, []);
+
+  // Stream PCM over a WebSocket and show partial transcripts while speaking
+  const startLive = useCallback(async (stream) => {
+    const socket = new WebSocket(streamUrl());
+    socket.binaryType = 'arraybuffer';
+    await new Promise((resolve, reject) => {
+      socket.onopen = resolve;
+      socket.onerror = reject;
+    });
+
+    let context;
+    try {
+      context = new AudioContext({ sampleRate: SAMPLE_RATE });
+      const moduleUrl = URL.createObjectURL(new Blob([PCM_WORKLET], { type: 'application/javascript' }));
+      await context.audioWorklet.addModule(moduleUrl);
+      URL.revokeObjectURL(moduleUrl);
+    } catch (err) {
+      socket.close();
+      if (context) context.close();
+      throw err;
+    }
+    socket.send(JSON.stringify({ token: localStorage.getItem('token') || '' }));
+
+    const source = context.createMediaStreamSource(stream);
+    const node = new AudioWorkletNode(context, 'pcm-capture');
+    node.port.onmessage = (e) => {
+      if (socket.readyState === WebSocket.OPEN) socket.send(e.data);
+    };
+    source.connect(node);
+
+    let released = false;
+    const release = () => {
+      if (released) return;
+      released = true;
+      node.port.onmessage = null;
+      source.disconnect();
+      context.close();
+      stream.getTracks().forEach(track => track.stop());
+    };
+
+    socket.onmessage = (e) => {
+      const data = JSON.parse(e.data);
+      if (data.type === 'partial' || data.type === 'final') {
+        setTranscript(data.text || '');
+      } else if (data.type === 'error') {
+        console.error('Transcription failed:', data.error);
+      }
+    };
+    socket.onclose = release;
+
+    liveRef.current = {
+      stop: () => {
+        release();
+        if (socket.readyState === WebSocket.OPEN) {
+          socket.send(JSON.stringify({ type: 'end' }));
+        }
+      }
+    };
+  }, []);
 
   const toggle = useCallback(async () => {
     if (isListening) {
-      if (mediaRecorderRef.current && mediaRecorderRef.current.state === 'recording') {
+      if (liveRef.current) {
+        liveRef.current.stop();
+        liveRef.current = null;
+      } else if (mediaRecorderRef.current && mediaRecorderRef.current.state === 'recording') {
         mediaRecorderRef.current.stop();
       }
       setIsListening(false);
     } else {
+      let stream;
       try {
-        const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
-        const mediaRecorder = new MediaRecorder(stream, { mimeType: 'audio/webm' });
-        mediaRecorderRef.current = mediaRecorder;
-        chunksRef.current = [];
-
-        mediaRecorder.ondataavailable = (e) => {
-          if (e.data.size > 0) {
-            chunksRef.current.push(e.data);
-          }
-        };
-
-        mediaRecorder.onstop = async () => {
-          stream.getTracks().forEach(track => track.stop());
-          const audioBlob = new Blob(chunksRef.current, { type: 'audio/webm' });
-          
-          try {
-            const formData = new FormData();
-            formData.append('audio', audioBlob, 'recording.webm');
-
-            const token = localStorage.getItem('token');
-            const response = await fetch('/api/transcribe', {
-              method: 'POST',
-              headers: {
-                ...(token && { 'Authorization': `Bearer ${token}` })
-              },
-              body: formData
-            });
-
-            if (response.ok) {
-              const data = await response.json();
-              setTranscript(data.text || '');
-            } else {
-              console.error('Transcription failed:', response.status);
-            }
-          } catch (err) {
-            console.error('Failed to transcribe:', err);
-          }
-        };
-
-        mediaRecorder.start();
-        setIsListening(true);
+        stream = await navigator.mediaDevices.getUserMedia({ audio: true });
       } catch (err) {
         console.error('Microphone access denied:', err);
         setIsSupported(false);
         alert('Microphone access denied. Please allow microphone permissions.');
+        return;
+      }
+
+      setTranscript('');
+      if (canStream()) {
+        try {
+          await startLive(stream);
+          setIsListening(true);
+          return;
+        } catch (err) {
+          console.warn('Live transcription unavailable, recording instead:', err);
+          liveRef.current = null;
+        }
       }
+      startRecorder(stream);
+      setIsListening(true);
     }
-  }, [isListening]);
+  }, [isListening, startLive, startRecorder]);
 
   return { isListening, transcript, setTranscript, toggle, isSupported };
 };
@@ -1,11 +1,76 @@
 import { useCallback, useState, useRef } from 'react';
 
+// Feeds a streamed MP3 response into a MediaSource as chunks arrive
+const streamToMediaSource = (body) => {
+  const mediaSource = new MediaSource();
+  mediaSource.addEventListener('sourceopen', async () => {
+    const sourceBuffer = mediaSource.addSourceBuffer('audio/mpeg');
+    const reader = body.getReader();
+    const appendChunk = (chunk) => new Promise((resolve, reject) => {
+      sourceBuffer.addEventListener('updateend', resolve, { once: true });
+      sourceBuffer.addEventListener('error', reject, { once: true });
+      sourceBuffer.appendBuffer(chunk);
+    });
+
+    try {
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        await appendChunk(value);
+      }
+      if (mediaSource.readyState === 'open') mediaSource.endOfStream();
+    } catch (err) {
+      console.error('TTS stream error:', err);
+      reader.cancel();
+      if (mediaSource.readyState === 'open') mediaSource.endOfStream('network');
+    }
+  }, { once: true });
+  return mediaSource;
+};
+
+const requestSpeech = async (text, voice) => {
+  const token = localStorage.getItem('token');
+  const response = await fetch('/api/tts', {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      ...(token && { 'Authorization': `Bearer ${token}` })
+    },
+    body: JSON.stringify({ text, voice })
+  });
+
+  if (!response.ok) {
+    throw new Error('TTS request failed');
+  }
+  return response;
+};
+
 const useTTS = () => {
   const [isSpeaking, setIsSpeaking] = useState(false);
   const [speakingId, setSpeakingId] = useState(null);
   const audioRef = useRef(null);
+  // Bumped by every speak/stop so an older playback stops at its next step
+  const playbackRef = useRef(0);
 
-  const speak = useCallback(async (text, voice = 'ja-JP-NanamiNeural', id = null) => {
+  // Resolves when the clip finishes playing
+  const playUrl = (audioUrl) => new Promise((resolve, reject) => {
+    const audio = new Audio(audioUrl);
+    audioRef.current = audio;
+    audio.onended = () => {
+      URL.revokeObjectURL(audioUrl);
+      resolve();
+    };
+    audio.onerror = () => {
+      URL.revokeObjectURL(audioUrl);
+      reject(new Error('Audio playback failed'));
+    };
+    audio.play().catch(reject);
+  });
+
+  // `audio` is the reply's handle from the chat API: one clip per sentence,
+  // already being synthesized server-side, played back to back.
+  const speak = useCallback(async (text, voice = 'ja-JP-NanamiNeural', id = null, audio = null) => {
+    const playback = ++playbackRef.current;
     if (audioRef.current) {
       audioRef.current.pause();
       audioRef.current = null;
@@ -21,48 +86,41 @@ const useTTS = () => {
     setSpeakingId(id);
 
     try {
-      const token = localStorage.getItem('token');
-      const response = await fetch('/api/tts', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          ...(token && { 'Authorization': `Bearer ${token}` })
-        },
-        body: JSON.stringify({ text, voice })
-      });
-
-      if (!response.ok) {
-        throw new Error('TTS request failed');
+      const clips = audio?.voice === voice && audio.clips?.length ? audio.clips : null;
+      if (clips) {
+        // Fetch the next sentence while the current one plays
+        let next = requestSpeech(clips[0].text, voice).then(r => r.blob());
+        for (let i = 0; i < clips.length; i++) {
+          const blob = await next;
+          if (i + 1 < clips.length) next = requestSpeech(clips[i + 1].text, voice).then(r => r.blob());
+          if (playback !== playbackRef.current) return;
+          await playUrl(URL.createObjectURL(blob));
+          if (playback !== playbackRef.current) return;
+        }
+      } else {
+        const response = await requestSpeech(text, voice);
+        // Start playback on the first chunk where the browser can append MP3
+        // to a MediaSource; otherwise wait for the whole clip.
+        const canStream = window.MediaSource && MediaSource.isTypeSupported('audio/mpeg') && response.body;
+        const audioUrl = canStream
+          ? URL.createObjectURL(streamToMediaSource(response.body))
+          : URL.createObjectURL(await response.blob());
+        if (playback !== playbackRef.current) return;
+        await playUrl(audioUrl);
       }
-
-      const audioBlob = await response.blob();
-      const audioUrl = URL.createObjectURL(audioBlob);
-      const audio = new Audio(audioUrl);
-      audioRef.current = audio;
-
-      audio.onended = () => {
-        URL.revokeObjectURL(audioUrl);
-        setIsSpeaking(false);
-        setSpeakingId(null);
-        audioRef.current = null;
-      };
-
-      audio.onerror = () => {
-        URL.revokeObjectURL(audioUrl);
-        setIsSpeaking(false);
-        setSpeakingId(null);
-        audioRef.current = null;
-      };
-
-      await audio.play();
     } catch (err) {
       console.error('TTS error:', err);
+    }
+
+    if (playback === playbackRef.current) {
       setIsSpeaking(false);
       setSpeakingId(null);
+      audioRef.current = null;
     }
   }, []);
 
   const stop = useCallback(() => {
+    playbackRef.current++;
     if (audioRef.current) {
       audioRef.current.pause();
       audioRef.current = null;
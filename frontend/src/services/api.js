@@ -8,9 +8,9 @@ const getAuthHeaders = () => {
   };
 };
 
-export const fetchGeminiReply = async (userText, settings, knownVocab) => {
+// The backend picks the relevant known vocab and loads the session's history itself
+export const fetchGeminiReply = async (userText, settings, sessionId) => {
   const levelContext = LEVEL_PRESETS[settings.targetLevel].promptContext;
-  const vocabContext = knownVocab.slice(-100).map(v => v.term).join(', ');
 
   const response = await fetch('/api/chat', {
     method: 'POST',
@@ -18,7 +18,8 @@ export const fetchGeminiReply = async (userText, settings, knownVocab) => {
     body: JSON.stringify({
       message: userText,
       levelContext,
-      vocabContext
+      sessionId,
+      voice: settings.ttsVoice
     })
   });
   
@@ -33,6 +34,65 @@ export const fetchGeminiReply = async (userText, settings, knownVocab) => {
   return await response.json();
 };
 
+// Streams the reply as NDJSON; onSegment is called with each segment as it arrives.
+// Resolves with the same shape as fetchGeminiReply.
+export const streamGeminiReply = async (userText, settings, onSegment, sessionId) => {
+  const levelContext = LEVEL_PRESETS[settings.targetLevel].promptContext;
+
+  const response = await fetch('/api/chat/stream', {
+    method: 'POST',
+    headers: getAuthHeaders(),
+    body: JSON.stringify({
+      message: userText,
+      levelContext,
+      sessionId,
+      voice: settings.ttsVoice
+    })
+  });
+
+  if (!response.ok) {
+    if (response.status === 401) {
+      localStorage.removeItem('token');
+      window.location.reload();
+    }
+    throw new Error(`API Error: ${response.status}`);
+  }
+
+  const reply = { segments: [], english: '', grammar_point: null, audio: null };
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  const handleLine = (line) => {
+    if (!line.trim()) return;
+    const event = JSON.parse(line);
+    if (event.type === 'segment') {
+      reply.segments.push(event.segment);
+      onSegment?.(event.segment, reply.segments);
+    } else if (event.type === 'done') {
+      // Final segments add meanings and explanations to the streamed ones
+      if (event.segments) reply.segments = event.segments;
+      reply.english = event.english;
+      reply.grammar_point = event.grammar_point;
+      reply.audio = event.audio;
+    } else if (event.type === 'error') {
+      throw new Error(event.error);
+    }
+  };
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop();
+    lines.forEach(handleLine);
+  }
+  handleLine(buffer + decoder.decode());
+
+  return reply;
+};
+
 // Settings API
 export const fetchSettings = async () => {
   const response = await fetch('/api/settings', {
@@ -52,15 +112,92 @@ export const saveSettings = async (settings) => {
   return await response.json();
 };
 
+// Delta sync: settings, vocab and session metadata are kept in localStorage
+// and only changes since the stored cursor are fetched.
+// Returns { settings, vocab, sessions } with vocab and sessions newest first.
+const syncKey = (userId) => `sync:${userId}`;
+
+const loadSyncState = (userId) => {
+  try {
+    const state = JSON.parse(localStorage.getItem(syncKey(userId)));
+    if (state?.cursor) return state;
+  } catch (e) {
+    // Corrupt or missing; start over
+  }
+  return { cursor: null, etag: null, settings: null, vocab: {}, sessions: {} };
+};
+
+export const syncUserData = async (userId) => {
+  const state = loadSyncState(userId);
+  const query = state.cursor ? `?since=${encodeURIComponent(state.cursor)}` : '';
+  const response = await fetch(`/api/sync${query}`, {
+    headers: { ...getAuthHeaders(), ...(state.etag && { 'If-None-Match': state.etag }) },
+    cache: 'no-store'
+  });
+
+  if (response.status !== 304) {
+    if (!response.ok) throw new Error('Failed to sync');
+    const changes = await response.json();
+    if (changes.reset) {
+      state.settings = null;
+      state.vocab = {};
+      state.sessions = {};
+    }
+    changes.deleted.vocab.forEach(id => { delete state.vocab[id]; });
+    changes.deleted.sessions.forEach(id => { delete state.sessions[id]; });
+    changes.vocab.forEach(item => { state.vocab[item.id] = item; });
+    changes.sessions.forEach(session => { state.sessions[session.id] = session; });
+    if (changes.settings) state.settings = changes.settings;
+    state.cursor = changes.cursor;
+    state.etag = response.headers.get('ETag');
+    try {
+      localStorage.setItem(syncKey(userId), JSON.stringify(state));
+    } catch (e) {
+      // Over quota: this load still works, the next one is a full sync
+      localStorage.removeItem(syncKey(userId));
+    }
+  }
+
+  return {
+    settings: state.settings || {},
+    vocab: Object.values(state.vocab).sort((a, b) => (b.addedAt || 0) - (a.addedAt || 0)),
+    sessions: Object.values(state.sessions).sort((a, b) => (b.updatedAt - a.updatedAt) || (a.id < b.id ? 1 : -1))
+  };
+};
+
+export const clearSyncState = (userId) => localStorage.removeItem(syncKey(userId));
+
+// Ranked search over vocab and past messages; type is 'all', 'vocab' or 'messages'
+export const searchUserData = async (q, type = 'all', offset = 0) => {
+  const params = new URLSearchParams({ q, type, offset });
+  const response = await fetch(`/api/search?${params}`, {
+    headers: getAuthHeaders()
+  });
+  if (!response.ok) throw new Error('Search failed');
+  return await response.json();
+};
+
 // Sessions API
-export const fetchSessions = async () => {
-  const response = await fetch('/api/sessions', {
+// Returns { sessions, nextCursor }; sessions carry metadata only
+export const fetchSessions = async (cursor = null) => {
+  const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+  const response = await fetch(`/api/sessions${query}`, {
     headers: getAuthHeaders()
   });
   if (!response.ok) throw new Error('Failed to fetch sessions');
   return await response.json();
 };
 
+// Returns the session with its latest messages (or those before `before`)
+export const fetchSession = async (sessionId, before = null) => {
+  const query = before !== null ? `?before=${before}` : '';
+  const response = await fetch(`/api/sessions/${sessionId}${query}`, {
+    headers: getAuthHeaders()
+  });
+  if (!response.ok) throw new Error('Failed to fetch session');
+  return await response.json();
+};
+
 export const saveSession = async (session) => {
   const response = await fetch('/api/sessions', {
     method: 'POST',
@@ -71,6 +208,17 @@ export const saveSession = async (session) => {
   return await response.json();
 };
 
+// Append only the new turn instead of re-sending the whole session
+export const appendSessionMessages = async (sessionId, messages) => {
+  const response = await fetch(`/api/sessions/${sessionId}/messages`, {
+    method: 'POST',
+    headers: getAuthHeaders(),
+    body: JSON.stringify({ messages })
+  });
+  if (!response.ok) throw new Error('Failed to save messages');
+  return await response.json();
+};
+
 export const deleteSession = async (sessionId) => {
   const response = await fetch(`/api/sessions/${sessionId}`, {
     method: 'DELETE',
@@ -81,6 +229,15 @@ export const deleteSession = async (sessionId) => {
 };
 
 // Vocab API
+// JMdict entries for a word (falls back to its dictionary form server-side)
+export const lookupDictionary = async (term) => {
+  const response = await fetch(`/api/dictionary/${encodeURIComponent(term)}`, {
+    headers: getAuthHeaders()
+  });
+  if (!response.ok) throw new Error('Dictionary lookup failed');
+  return await response.json();
+};
+
 export const fetchVocab = async () => {
   const response = await fetch('/api/vocab', {
     headers: getAuthHeaders()
@@ -99,6 +256,36 @@ export const saveVocabItem = async (item) => {
   return await response.json();
 };
 
+// Saves many items in one request; returns { ids: { term: id } }
+export const saveVocabBatch = async (items) => {
+  const response = await fetch('/api/vocab/batch', {
+    method: 'POST',
+    headers: getAuthHeaders(),
+    body: JSON.stringify(items)
+  });
+  if (!response.ok) throw new Error('Failed to save vocab');
+  return await response.json();
+};
+
+export const fetchDueCards = async (limit = 20) => {
+  const response = await fetch(`/api/review/next?limit=${limit}`, {
+    headers: getAuthHeaders()
+  });
+  if (!response.ok) throw new Error('Failed to fetch review cards');
+  return await response.json();
+};
+
+// grades: [{ id, grade: 1-4, reviewedAt }]
+export const submitReviewGrades = async (grades) => {
+  const response = await fetch('/api/review/grade', {
+    method: 'POST',
+    headers: getAuthHeaders(),
+    body: JSON.stringify(grades)
+  });
+  if (!response.ok) throw new Error('Failed to save review grades');
+  return await response.json();
+};
+
 export const deleteVocabItem = async (vocabId) => {
   const response = await fetch(`/api/vocab/${vocabId}`, {
     method: 'DELETE',